@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 from flask_cors import CORS
 from config import Config
 from models import db
@@ -6,17 +6,44 @@ from routes.auth_routes import auth_bp
 from routes.profile_routes import profile_bp
 from routes.community_routes import community_bp
 from routes.ai_routes import ai_bp
+from utils.fitness import init_cohort_index
+from utils.leaderboard import init_leaderboard
+from utils.counters import init_counters
+from utils.groups import init_city_groups
+from utils.events import init_event_attendance
+from utils.chat_stream import broker
+from utils.chat_writer import chat_writer
+from utils.response_cache import response_cache
+from utils.auth import token_cache
+from utils.metrics import request_metrics
+from utils.query_profiler import query_profiler
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5173"])
 
 app.config.from_object(Config)
 db.init_app(app)
+# First, so their hooks wrap everything the others do (auth included)
+request_metrics.init_app(app)
+query_profiler.init_app(app)
+broker.buffer_size = Config.CHAT_STREAM_BUFFER
+chat_writer.init_app(app)
+response_cache.init_app(app)
+token_cache.init_app(app)
+request_metrics.add_stats("response_cache", response_cache.stats)
+request_metrics.add_stats("auth_tokens", token_cache.stats)
+request_metrics.add_stats("chat_stream", broker.stats)
+request_metrics.add_stats("chat_writer", chat_writer.stats)
 CORS(app, origins=Config.FRONTEND_ORIGIN, supports_credentials=True)
 
 with app.app_context():
     db.create_all()
     print("✅ Database tables created successfully!")
+    init_cohort_index()
+    init_leaderboard()
+    init_counters(app, Config.COUNTER_RECONCILE_SECONDS)
+    init_city_groups()
+    init_event_attendance()
 
 # Blueprints
 app.register_blueprint(auth_bp, url_prefix="/api")
@@ -24,15 +51,10 @@ app.register_blueprint(profile_bp, url_prefix="/api")
 app.register_blueprint(community_bp, url_prefix="/api")
 app.register_blueprint(ai_bp, url_prefix="/api")
 
-@app.before_request
-def log_request_info():
-    print(f"Incoming request: {request.method} {request.path}")
-    print(f"Headers: {request.headers}")
-    print(f"Body: {request.get_data()}")
-
 @app.route("/api/health")
 def health():
-    return jsonify({"status": "ok"}), 200
+    return jsonify({"status": "ok", "responseCache": response_cache.stats(),
+                    "auth": token_cache.stats()}), 200
 
 @app.route("/test")
 def test():
@@ -0,0 +1,296 @@
+"""
+Generate a synthetic dataset for load testing.
+
+    python generate_data.py --users 1000000 --groups 2000 --events 5000 --messages 100000000 [--seed 42]
+
+Writes users with profiles, one group per city, events and chat messages
+to DATABASE_URL (PostgreSQL or SQLite), appending to what is there. The
+same arguments and seed always produce the same data. Rows are generated
+and written batch by batch (COPY on PostgreSQL), so memory doesn't grow
+with the row counts beyond two small arrays per user.
+
+Skew is modelled on real communities: city sizes and user activity follow
+power laws, so a few groups hold most members and a few users post most
+messages. Chat messages go to their sender's city group, spread over
+--days up to now. Every generated user's password is "password".
+
+Afterwards the leaderboard and stats counters are rebuilt; the cohort and
+similar-user indexes are built when the app next starts.
+"""
+import argparse
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+
+from app import app
+from models import db, User, UserProfile, Group, CommunityEvent, EventAttendance, ChatMessage
+from utils.counters import reconcile_counters
+from utils.fitness import LIFESTYLE_FIELDS, ml_service, profile_features
+from utils.groups import city_key
+from utils.helpers import copy_rows
+from utils.leaderboard import rebuild_leaderboard
+
+FITNESS_LEVELS = np.array(["Beginner", "Intermediate", "Advanced"])
+GOALS = ["Lose Weight", "Build Muscle", "Improve Endurance", "Stay Healthy", "Gain Flexibility"]
+SYLLABLES = ["ba", "ka", "ra", "ti", "no", "sa", "fe", "mo", "lu", "di", "ze", "ha", "ne", "vo", "qi", "tun", "sfa", "sou"]
+PHRASES = [
+    "Anyone up for a run tomorrow?", "Great session today!", "What time is the class?",
+    "I hit a new personal best", "Rest day for me", "Who's joining the weekend hike?",
+    "Any tips for recovery?", "See you at the gym", "That workout was brutal", "Drink water, everyone",
+]
+
+
+class Writer:
+    """Batched inserts: COPY on PostgreSQL, executemany elsewhere"""
+
+    def __init__(self, use_copy):
+        self.use_copy = use_copy
+
+    def write(self, model, rows):
+        if not rows:
+            return
+        if self.use_copy:
+            copy_rows(db.session, model.__tablename__, list(rows[0]), rows)
+        else:
+            db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+
+
+def _progress(label, done, total, start):
+    rate = done / max(time.perf_counter() - start, 1e-9)
+    print(f"✅ {label}: {done}/{total} ({rate:.0f}/s)")
+
+
+def _power_law_ranks(rng, n, size, skew):
+    """size draws from range(n), rank 0 most likely; skew 1 is uniform"""
+    return np.minimum((n * rng.random(size) ** skew).astype(np.int64), n - 1)
+
+
+def _city_names(rng, n):
+    names, seen = [], set()
+    while len(names) < n:
+        name = "".join(rng.choice(SYLLABLES, size=rng.integers(2, 4))).capitalize()
+        if name in seen:
+            name = f"{name} {len(names)}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def generate_groups(rng, writer, n_groups):
+    """One group per new city; returns (ids, city names)"""
+    first_id = (db.session.execute(select(func.max(Group.id))).scalar() or 0) + 1
+    cities = _city_names(rng, n_groups)
+    taken = set(db.session.execute(select(Group.city_key).where(Group.city_key.isnot(None))).scalars())
+    cities = [city for city in cities if city_key(city) not in taken]
+    rows = [
+        {"id": first_id + i, "name": f"{city} Fitness Group", "description": f"Group for {city}",
+         "city_key": city_key(city)}
+        for i, city in enumerate(cities)
+    ]
+    writer.write(Group, rows)
+    print(f"✅ {len(rows)} groups")
+    return np.arange(first_id, first_id + len(rows)), cities
+
+
+def _profiles(rng, user_ids, group_index, group_ids, cities, today):
+    n = len(user_ids)
+    age = np.clip(rng.normal(32, 10, n), 16, 80).astype(int)
+    height = np.round(np.clip(rng.normal(170, 10, n), 140, 210), 1)
+    bmi = np.clip(rng.normal(25, 4, n), 15, 45)
+    weight = np.round(bmi * (height / 100) ** 2, 1)
+    level = FITNESS_LEVELS[rng.choice(3, n, p=[0.5, 0.35, 0.15])]
+    steps = np.round(np.clip(rng.lognormal(8.8, 0.4, n), 1000, 30000))
+    workout = np.round(np.clip(rng.normal(45, 20, n), 0, 180), 1)
+    joined = rng.integers(0, 3 * 365, n)
+    goal_counts = rng.integers(1, 3, n)
+
+    rows = []
+    for i in range(n):
+        h, w = float(height[i]), float(weight[i])
+        profile = {
+            "user_id": int(user_ids[i]),
+            "age": int(age[i]),
+            "weight": w,
+            "height": h,
+            "fitness_level": str(level[i]),
+            "goals": [GOALS[j] for j in rng.choice(len(GOALS), goal_counts[i], replace=False)],
+            "bmi": round(w / ((h / 100) ** 2), 2),
+            "city": cities[group_index[i]],
+            "group_id": int(group_ids[group_index[i]]),
+            "join_date": today - timedelta(days=int(joined[i])),
+            "fitness_category": None,
+            "fitness_goal": None,
+        }
+        for field in LIFESTYLE_FIELDS:
+            profile[field] = None
+        profile["avg_steps"] = float(steps[i])
+        profile["avg_workout_duration"] = float(workout[i])
+        rows.append(profile)
+    return rows
+
+
+def _assign_cohorts(profiles):
+    features = [profile_features(SimpleNamespace(**profile)) for profile in profiles]
+    for profile, label in zip(profiles, ml_service.predict_labels_many(features, apply_defaults=True)):
+        if label is not None:
+            profile["fitness_category"], profile["fitness_goal"] = str(label[0]), str(label[1])
+
+
+def generate_users(rng, writer, n_users, group_ids, cities, batch_size, skew, cohorts):
+    """Users with profiles in power-law sized city groups; returns (user ids, group index per user)"""
+    first_id = (db.session.execute(select(func.max(User.id))).scalar() or 0) + 1
+    user_ids = np.arange(first_id, first_id + n_users, dtype=np.int64)
+    # Group sizes fall off with rank: the first groups are the biggest
+    group_index = _power_law_ranks(rng, len(group_ids), n_users, skew)
+    password_hash = generate_password_hash("password")
+    today = date.today()
+
+    start = time.perf_counter()
+    for offset in range(0, n_users, batch_size):
+        ids = user_ids[offset:offset + batch_size]
+        writer.write(User, [
+            {"id": int(user_id), "username": f"user{user_id}", "surname": f"Tester{user_id % 997}",
+             "phone": f"+1555{user_id:09d}", "password_hash": password_hash}
+            for user_id in ids
+        ])
+        profiles = _profiles(rng, ids, group_index[offset:offset + batch_size], group_ids, cities, today)
+        if cohorts:
+            try:
+                _assign_cohorts(profiles)
+            except Exception as e:
+                print(f"⚠️ Profiles left without a cohort: {e}")
+                cohorts = False
+        writer.write(UserProfile, profiles)
+        _progress("users", offset + len(ids), n_users, start)
+    return user_ids, group_index
+
+
+def load_users():
+    """(user ids, group index per user, group ids, cities) of the profiles already in the database"""
+    rows = db.session.execute(
+        select(UserProfile.user_id, UserProfile.group_id)
+        .where(UserProfile.group_id.isnot(None)).order_by(UserProfile.user_id)
+    ).all()
+    groups = db.session.execute(select(Group.id, Group.name).order_by(Group.id)).all()
+    group_ids = np.array([group_id for group_id, _ in groups], dtype=np.int64)
+    user_ids = np.array([user_id for user_id, _ in rows], dtype=np.int64)
+    group_index = np.searchsorted(group_ids, np.array([group_id for _, group_id in rows], dtype=np.int64))
+    cities = [name.removesuffix(" Fitness Group") for _, name in groups]
+    return user_ids, group_index, group_ids, cities
+
+
+def generate_events(rng, writer, n_events, user_ids, group_index, group_ids, cities, skew):
+    """Events in power-law popular cities, attended by members of that city"""
+    first_id = (db.session.execute(select(func.max(CommunityEvent.id))).scalar() or 0) + 1
+    by_group = np.argsort(group_index, kind="stable")
+    bounds = np.searchsorted(group_index[by_group], np.arange(len(group_ids) + 1))
+    event_groups = _power_law_ranks(rng, len(group_ids), n_events, skew)
+    rows, attendance, now = [], [], datetime.utcnow()
+    for i, g in enumerate(event_groups):
+        members = by_group[bounds[g]:bounds[g + 1]]
+        size = min(len(members), int(rng.geometric(1 / 20)))
+        attendees = user_ids[rng.choice(members, size, replace=False)] if size else []
+        rows.append({
+            "id": first_id + i,
+            "title": f"{rng.choice(['Morning', 'Evening', 'Weekend'])} {rng.choice(['Run', 'Yoga', 'Ride', 'Hike', 'HIIT'])}",
+            "details": "Generated event",
+            "location": cities[g],
+            "attendee_count": len(attendees),
+        })
+        attendance += [{"event_id": first_id + i, "user_id": int(user_id), "created_at": now}
+                       for user_id in attendees]
+    writer.write(CommunityEvent, rows)
+    writer.write(EventAttendance, attendance)
+    print(f"✅ {len(rows)} events, {len(attendance)} RSVPs")
+
+
+def generate_messages(rng, writer, n_messages, user_ids, group_index, group_ids, days, batch_size, skew):
+    """Messages from power-law active users to their group, in time order over the last days"""
+    # Activity rank -> user, so the most active users are spread over ids
+    by_activity = rng.permutation(len(user_ids))
+    end = datetime.utcnow()
+    span = timedelta(days=days).total_seconds()
+
+    start = time.perf_counter()
+    for offset in range(0, n_messages, batch_size):
+        n = min(batch_size, n_messages - offset)
+        senders = by_activity[_power_law_ranks(rng, len(user_ids), n, skew)]
+        # Evenly spread over the span, jittered within the batch and re-sorted
+        fractions = np.sort((offset + rng.random(n) * n) / n_messages)
+        phrases = rng.integers(0, len(PHRASES), n)
+        rows = [
+            {
+                "group_id": int(group_ids[group_index[sender]]),
+                "user_id": int(user_ids[sender]),
+                "username": f"user{user_ids[sender]}",
+                "message": PHRASES[phrase],
+                "timestamp": end - timedelta(seconds=span * (1 - fraction)),
+            }
+            for sender, phrase, fraction in zip(senders, phrases, fractions)
+        ]
+        writer.write(ChatMessage, rows)
+        if (offset // batch_size) % 10 == 0 or offset + n == n_messages:
+            _progress("messages", offset + n, n_messages, start)
+
+
+def _sync_sequences():
+    """Explicit ids don't advance PostgreSQL sequences; move them past the new rows"""
+    for table in ("user", "group", "community_event"):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"
+        ))
+    db.session.commit()
+
+
+def generate(users, groups, events, messages, seed=42, days=365, batch_size=10000,
+             skew=3.0, cohorts=True):
+    rng = np.random.default_rng(seed)
+    use_copy = db.engine.dialect.driver == "psycopg2"
+    writer = Writer(use_copy)
+
+    if users:
+        group_ids, cities = generate_groups(rng, writer, groups)
+        if not len(group_ids):
+            raise SystemExit("❌ No new groups to put users in")
+        user_ids, group_index = generate_users(rng, writer, users, group_ids, cities, batch_size, skew, cohorts)
+    else:
+        user_ids, group_index, group_ids, cities = load_users()
+        if not len(user_ids) and (events or messages):
+            raise SystemExit("❌ No users with a group to generate events or messages for")
+
+    if events:
+        generate_events(rng, writer, events, user_ids, group_index, group_ids, cities, skew)
+    if messages:
+        generate_messages(rng, writer, messages, user_ids, group_index, group_ids, days, batch_size, skew)
+    if use_copy:
+        _sync_sequences()
+
+    if users:
+        total = rebuild_leaderboard()
+        print(f"✅ Leaderboard entries repaired for {total} users")
+    reconcile_counters()
+    print("✅ Done")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000, help="users (with profiles) to add; 0 reuses existing ones")
+    parser.add_argument("--groups", type=int, default=200, help="city groups to add with the users")
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42, help="random seed; the same seed gives the same data")
+    parser.add_argument("--days", type=int, default=365, help="chat history length")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows per insert and commit")
+    parser.add_argument("--skew", type=float, default=3.0,
+                        help="power-law exponent for group sizes and activity (1 = uniform)")
+    parser.add_argument("--no-cohorts", action="store_true", help="don't predict ML cohorts for profiles")
+    args = parser.parse_args()
+
+    with app.app_context():
+        generate(args.users, args.groups, args.events, args.messages, args.seed, args.days,
+                 args.batch_size, args.skew, not args.no_cohorts)
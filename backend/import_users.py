@@ -0,0 +1,34 @@
+"""
+Bulk-import users from a CSV or NDJSON file.
+
+    python import_users.py members.csv [--format csv|ndjson] [--batch-size 1000] [--workers N]
+
+See utils/user_import.py for the columns. Rejected rows are listed with
+their line numbers; the rest are imported.
+"""
+import argparse
+import json
+import sys
+
+from app import app
+from utils.user_import import import_users
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="input file, - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"],
+                        help="input format (default: from the file extension)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="users inserted per transaction")
+    parser.add_argument("--workers", type=int, help="password hashing processes (default: CPU count)")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    with app.app_context(), stream:
+        summary = import_users(stream, fmt, args.batch_size, args.workers)
+
+    for error in summary["errors"]:
+        print(f"❌ line {error['line']}: {error['error']}")
+    if summary["errorsTruncated"]:
+        print("❌ ... more rejected rows not shown")
+    print(json.dumps({k: v for k, v in summary.items() if k != "errors"}))
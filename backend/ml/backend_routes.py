@@ -1,8 +1,27 @@
 # Add these routes to your existing Flask/FastAPI backend
 
 # For Flask:
+import os
 from flask import request, jsonify
-from ml_service import get_fitness_recommendation, ml_service
+from ml_service import get_fitness_recommendation, get_fitness_recommendations, ml_service
+from utils.auth import operator_required
+
+MAX_BATCH_SIZE = 1000
+
+# Score on a pool of ML_INFERENCE_WORKERS processes, micro-batching
+# concurrent requests (0 = predict inside the request thread)
+ML_INFERENCE_WORKERS = int(os.getenv("ML_INFERENCE_WORKERS", "0"))
+if ML_INFERENCE_WORKERS > 0:
+    ml_service.start_scheduler(
+        workers=ML_INFERENCE_WORKERS,
+        max_batch_size=int(os.getenv("ML_MAX_BATCH_SIZE", "64")),
+        max_wait_ms=float(os.getenv("ML_MAX_WAIT_MS", "2")),
+    )
+
+# With ML_MODEL_REGISTRY set, newly activated model versions are picked up
+# without a restart
+if ml_service.registry is not None:
+    ml_service.watch_registry(interval=float(os.getenv("ML_REGISTRY_POLL_SECONDS", "30")))
 
 @app.route('/api/fitness/recommend', methods=['POST'])
 def fitness_recommendation():
@@ -27,6 +46,37 @@ def fitness_recommendation():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/fitness/recommend/batch', methods=['POST'])
+def fitness_recommendation_batch():
+    """Get fitness recommendations for many users in one call"""
+    try:
+        payload = request.json
+        users = payload.get('users') if isinstance(payload, dict) else payload
+        if not isinstance(users, list):
+            return jsonify({"error": "Expected a list of users"}), 400
+        if len(users) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} users)"}), 413
+
+        # Rows missing required fields get their own error entry
+        required_fields = ['age', 'bmi', 'fitness_level_num']
+        results = [None] * len(users)
+        valid_positions = []
+        for i, user_data in enumerate(users):
+            missing = [f for f in required_fields if not isinstance(user_data, dict) or f not in user_data]
+            if missing:
+                results[i] = {"success": False, "error": f"Missing required field: {missing[0]}"}
+            else:
+                valid_positions.append(i)
+
+        scored = get_fitness_recommendations([users[i] for i in valid_positions])
+        for i, result in zip(valid_positions, scored):
+            results[i] = result
+
+        return jsonify({"results": results})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/fitness/predict-category', methods=['POST'])
 def predict_category():
     """Predict user fitness category"""
@@ -47,10 +97,27 @@ def predict_goal():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/fitness/model', methods=['GET'])
+def fitness_model_info():
+    """Active model version and per-version prediction stats"""
+    return jsonify(ml_service.model_info())
+
+@app.route('/api/fitness/model/reload', methods=['POST'])
+@operator_required
+def fitness_model_reload():
+    """Load a registry version (default: the active one) in the background"""
+    version = (request.json or {}).get('version') if request.is_json else None
+    if version and (ml_service.registry is None or version not in ml_service.registry.versions()):
+        return jsonify({"error": f"Unknown model version: {version}"}), 404
+    ml_service.reload_models(version)
+    return jsonify({"status": "loading", "version": version}), 202
+
+
 # For FastAPI:
-from fastapi import APIRouter, HTTPException
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 router = APIRouter(prefix="/api/fitness", tags=["fitness"])
 
@@ -84,6 +151,17 @@ async def get_recommendation(user_data: UserData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/recommend/batch")
+async def get_recommendations_batch(users: List[UserData]):
+    """Get fitness recommendations for many users in one call"""
+    if len(users) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} users)")
+    try:
+        results = get_fitness_recommendations([u.dict() for u in users])
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/predict-category")
 async def predict_user_category(user_data: UserData):
     """Predict user fitness category"""
@@ -104,6 +182,25 @@ async def predict_user_goal(user_data: UserData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/model")
+async def get_model_info():
+    """Active model version and per-version prediction stats"""
+    return ml_service.model_info()
+
+def require_operator(x_operator_token: Optional[str] = Header(None)):
+    """Same operator token as the Flask app's admin routes (OPERATOR_TOKEN)"""
+    expected = os.getenv("OPERATOR_TOKEN")
+    if not (expected and x_operator_token and hmac.compare_digest(x_operator_token.encode(), expected.encode())):
+        raise HTTPException(status_code=403, detail="Operator token required")
+
+@router.post("/model/reload", status_code=202, dependencies=[Depends(require_operator)])
+async def reload_model(version: Optional[str] = None):
+    """Load a registry version (default: the active one) in the background"""
+    if version and (ml_service.registry is None or version not in ml_service.registry.versions()):
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    ml_service.reload_models(version)
+    return {"status": "loading", "version": version}
+
 # Don't forget to include the router in your main FastAPI app:
 # app.include_router(router)
 
@@ -158,5 +255,10 @@ def fitness_health_check():
     return jsonify({
         "status": "healthy",
         "models_loaded": ml_service.clf_cat is not None and ml_service.model_goal is not None,
-        "service_version": "1.0"
+        "model_source": ml_service.model_source,
+        "model_version": ml_service.model_version,
+        "model_stats": ml_service.model_info()["versions"].get(ml_service.model_version),
+        "service_version": "1.0",
+        "cache": ml_service.cache.stats(),
+        "scheduler": ml_service.scheduler.stats() if ml_service.scheduler else None
     })
\ No newline at end of file
@@ -0,0 +1,80 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from ml_service import ml_service, DEFAULT_USER_DATA
+
+print("⏱️ Feature encoder microbenchmark")
+print("=" * 30)
+
+test_user = {
+    "age": 25,
+    "bmi": 23.5,
+    "fitness_level_num": 1,
+    "avg_calories_consumed": 2300,
+    "protein_g": 90
+}
+
+
+def legacy_encode(user_data):
+    """The old per-request pandas path, kept here for comparison"""
+    user_data = dict(user_data)
+    for key, value in DEFAULT_USER_DATA.items():
+        if key not in user_data:
+            user_data[key] = value
+    df = pd.DataFrame([user_data])
+    df["join_date"] = pd.to_datetime(df["join_date"], errors="coerce")
+    df["days_since_joined"] = (pd.Timestamp.today() - df["join_date"]).dt.days
+    df = df.drop(columns=["join_date"])
+    for col in ml_service.feature_columns_cat:
+        if col not in df.columns:
+            df[col] = 0
+    df_cat = df[ml_service.feature_columns_cat]
+    for col in ml_service.feature_columns_goal:
+        if col not in df.columns:
+            df[col] = 0
+    df_goal = df[ml_service.feature_columns_goal]
+    return df_cat, df_goal
+
+
+def encoder_encode(user_data):
+    return ml_service.default_encoder.encode(user_data)
+
+
+def bench(label, fn, n=2000):
+    fn(test_user)
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(test_user)
+    per_call = (time.perf_counter() - start) / n * 1e6
+    print(f"{label:<32} {per_call:8.1f} µs/call")
+    return per_call
+
+
+# Both paths must produce the same feature rows
+df_cat, df_goal = legacy_encode(test_user)
+row_cat, row_goal = encoder_encode(test_user)
+assert np.array_equal(df_cat.to_numpy(dtype=np.float64), row_cat)
+assert np.array_equal(df_goal.to_numpy(dtype=np.float64), row_goal)
+print("✅ Encoder output matches the pandas path\n")
+
+legacy = bench("pandas encode", legacy_encode)
+fast = bench("FeatureEncoder.encode", encoder_encode)
+print(f"🚀 Encoding speedup: {legacy / fast:.0f}x\n")
+
+
+def legacy_predict(user_data):
+    df_cat, df_goal = legacy_encode(user_data)
+    return ml_service.clf_cat.predict(df_cat)[0], ml_service.model_goal.predict(df_goal)[0]
+
+
+def encoder_predict(user_data):
+    row_cat, row_goal = encoder_encode(user_data)
+    return ml_service.clf_cat.predict(row_cat)[0], ml_service.model_goal.predict(row_goal)[0]
+
+
+assert legacy_predict(test_user) == encoder_predict(test_user)
+legacy = bench("pandas encode + predict", legacy_predict, n=300)
+fast = bench("FeatureEncoder encode + predict", encoder_predict, n=300)
+print(f"🚀 End-to-end speedup: {legacy / fast:.1f}x")
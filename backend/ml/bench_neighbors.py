@@ -0,0 +1,63 @@
+import sys
+import time
+
+import numpy as np
+
+from neighbors import SimilarUserIndex
+
+print("⏱️ Similar-user index benchmark")
+print("=" * 30)
+
+# Table sizes to try, e.g. python bench_neighbors.py 10000 100000
+SIZES = [int(n) for n in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+K = 20
+N_QUERIES = 500
+
+# Per-persona means and spreads of the goal features (feature_columns_goal order)
+FEATURE_MEANS = np.array([
+    [1900, 150, 90, 220, 60, 25, 1.5, 450, 60],     # light, new
+    [2300, 350, 120, 280, 70, 45, 2.5, 420, 250],   # regular
+    [2900, 600, 170, 350, 85, 70, 3.2, 470, 500],   # training hard
+    [1700, 400, 110, 160, 55, 50, 2.8, 400, 180],   # cutting
+])
+FEATURE_SPREADS = np.array([300, 120, 25, 60, 15, 15, 0.6, 45, 150])
+
+
+def synthetic_users(n, rng):
+    persona = rng.integers(0, len(FEATURE_MEANS), n)
+    X = FEATURE_MEANS[persona] + rng.normal(size=(n, FEATURE_MEANS.shape[1])) * FEATURE_SPREADS
+    X[:, -1] = np.maximum(X[:, -1], 0).round()
+    return X
+
+
+def brute_force(index, x, k):
+    """Exact k nearest by scanning every row, to check and time against"""
+    z = (x - index._mean) / index._std
+    dist = np.sum((index._points - z) ** 2, axis=1)
+    nearest = np.argpartition(dist, k - 1)[:k]
+    return np.sort(np.sqrt(dist[nearest]))
+
+
+rng = np.random.default_rng(0)
+print(f"{'rows':>10} {'build':>9} {'query':>12} {'brute force':>14} {'speedup':>8}")
+for n in SIZES:
+    X = synthetic_users(n, rng)
+    start = time.perf_counter()
+    index = SimilarUserIndex().build(X, np.arange(n))
+    build_s = time.perf_counter() - start
+
+    queries = synthetic_users(N_QUERIES, rng)
+    start = time.perf_counter()
+    results = [index.query(q, K) for q in queries]
+    query_ms = (time.perf_counter() - start) / N_QUERIES * 1e3
+
+    # Brute force is slow at 1M rows, a subset of the queries is enough
+    n_check = min(N_QUERIES, 50)
+    start = time.perf_counter()
+    exact = [brute_force(index, q, K) for q in queries[:n_check]]
+    brute_ms = (time.perf_counter() - start) / n_check * 1e3
+    assert all(np.allclose(dist, ref) for (_, dist, _), ref in zip(results, exact))
+
+    print(f"{n:>10,} {build_s:>8.2f}s {query_ms:>9.2f} ms {brute_ms:>11.2f} ms {brute_ms / query_ms:>7.1f}x")
+
+print(f"✅ KD-tree neighbours match brute force (k={K})")
@@ -0,0 +1,100 @@
+import threading
+from datetime import date
+
+# Per-member values averaged into a recommendation
+COHORT_FIELDS = [
+    "avg_calories_consumed", "protein_g", "carbs_g", "fat_g",
+    "avg_sleep_duration", "avg_workout_duration", "avg_workout_intensity",
+]
+
+
+def _join_ordinal(join_date):
+    if join_date is None:
+        return None
+    if isinstance(join_date, str):
+        join_date = date.fromisoformat(join_date[:10])
+    return join_date.toordinal()
+
+
+class CohortIndex:
+    """
+    Running sums of member stats per (category, goal) cohort.
+
+    Every member is counted at three levels: its (category, goal) pair,
+    its category alone and the whole population, which are the fallbacks
+    get_recommendation used to compute with three DataFrame filters.
+    Adding or removing a member touches three entries and a lookup reads
+    at most three, whatever the number of members.
+
+    Experience is kept as a sum of join-date ordinals so the average
+    "days since joining" stays correct as days go by.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> (counts, sums), one slot per field, one for the join date
+        # and a last one that is always 1 to count members
+        self._entries = {}
+
+    @staticmethod
+    def _keys(category, goal):
+        return ((category, goal), (category, None), (None, None))
+
+    def _apply(self, category, goal, values, join_date, sign):
+        ordinal = _join_ordinal(join_date)
+        row = [values.get(field) for field in COHORT_FIELDS] + [ordinal, 1]
+        with self._lock:
+            for key in self._keys(category, goal):
+                counts, sums = self._entries.setdefault(
+                    key, ([0] * len(row), [0.0] * len(row))
+                )
+                for i, value in enumerate(row):
+                    if value is not None:
+                        counts[i] += sign
+                        sums[i] += sign * value
+                if not counts[-1]:
+                    del self._entries[key]
+
+    def add(self, category, goal, values, join_date=None):
+        """Count one member; missing (None) values are skipped per field"""
+        self._apply(category, goal, values, join_date, 1)
+
+    def remove(self, category, goal, values, join_date=None):
+        """Undo a previous add() with the same arguments"""
+        self._apply(category, goal, values, join_date, -1)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        """Number of members in the index"""
+        with self._lock:
+            counts, _ = self._entries.get((None, None), ([0], None))
+            return counts[-1]
+
+    def lookup(self, category, goal):
+        """
+        Cohort averages for (category, goal), each field falling back to the
+        category and then to everyone when the narrower cohort has no data.
+        Returns None if the index is empty.
+        """
+        averages = {}
+        with self._lock:
+            levels = [self._entries.get(key) for key in self._keys(category, goal)]
+            levels = [level for level in levels if level is not None]
+            if not levels:
+                return None
+
+            for i, field in enumerate(COHORT_FIELDS + ["join_ordinal"]):
+                averages[field] = None
+                for counts, sums in levels:
+                    if counts[i]:
+                        averages[field] = sums[i] / counts[i]
+                        break
+
+        join_ordinal = averages.pop("join_ordinal")
+        averages["days_since_joined"] = (
+            date.today().toordinal() - join_ordinal if join_ordinal is not None else None
+        )
+        return averages
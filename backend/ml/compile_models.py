@@ -0,0 +1,75 @@
+"""
+Export the pickled LightGBM models as NumPy tree tables (.npz).
+
+Run from anywhere after retraining:
+
+    python compile_models.py
+
+FitnessMLService picks up the .npz files automatically and no longer needs
+lightgbm/sklearn at runtime. Every export is checked against the original
+model before it is written.
+"""
+import os
+import sys
+
+import joblib
+import numpy as np
+
+from tree_ensemble import compile_booster, save_ensemble, load_ensemble
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_NAMES = ("lgb_model", "lgb_model_balanced")
+
+
+def verification_rows(compiled, n_random=20000, seed=0):
+    """Random rows spanning the split thresholds, plus the thresholds themselves"""
+    rng = np.random.default_rng(seed)
+    n_features = compiled.n_features_in_
+    is_split = compiled.left != np.arange(len(compiled.left))
+
+    columns = []
+    for f in range(n_features):
+        thresholds = compiled.threshold[is_split & (compiled.feature == f)]
+        lo, hi = (thresholds.min(), thresholds.max()) if len(thresholds) else (0.0, 1.0)
+        margin = (hi - lo) * 0.1 + 1.0
+        random_values = rng.uniform(lo - margin, hi + margin, n_random)
+        # Values exactly on (and just past) a threshold exercise the <= rule
+        edge_values = rng.choice(thresholds, n_random) if len(thresholds) else random_values
+        edge_values = np.where(rng.random(n_random) < 0.5, edge_values, np.nextafter(edge_values, np.inf))
+        columns.append(np.where(rng.random(n_random) < 0.3, edge_values, random_values))
+
+    X = np.column_stack(columns)
+    X[rng.random(X.shape) < 0.02] = np.nan
+    return X
+
+
+def export(name):
+    pkl_path = os.path.join(MODEL_DIR, name + ".pkl")
+    npz_path = os.path.join(MODEL_DIR, name + ".npz")
+
+    model = joblib.load(pkl_path)
+    compiled = compile_booster(model.booster_, model.classes_)
+    save_ensemble(npz_path, compiled)
+
+    # Check the file we actually wrote, through the mmap path workers use
+    reloaded = load_ensemble(npz_path)
+    X = verification_rows(reloaded)
+    expected = model.predict(X)
+    actual = reloaded.predict(X)
+    mismatches = int(np.sum(expected != actual))
+    if mismatches:
+        os.remove(npz_path)
+        raise RuntimeError(f"{name}: {mismatches}/{len(X)} predictions differ, export removed")
+
+    size_kb = os.path.getsize(npz_path) / 1024
+    print(f"✅ {name}.npz written ({len(reloaded.roots)} trees, {size_kb:.0f} KB), "
+          f"{len(X)} verification rows match")
+
+
+if __name__ == "__main__":
+    try:
+        for name in MODEL_NAMES:
+            export(name)
+    except Exception as e:
+        print(f"❌ Export failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,148 @@
+import math
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=4096)
+def _parse_join_date(value):
+    """Parse a join_date string once; returns a date, a datetime or None"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    # Rare formats: defer to pandas so we accept exactly what it accepts
+    import pandas as pd
+    parsed = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(parsed) else parsed.to_pydatetime()
+
+
+def days_since(join_date):
+    """Same result as (pd.Timestamp.today() - pd.to_datetime(join_date)).days"""
+    if join_date is None:
+        return math.nan
+    if isinstance(join_date, str):
+        parsed = _parse_join_date(join_date)
+    elif isinstance(join_date, (date, datetime)):
+        parsed = join_date
+    else:
+        import pandas as pd
+        parsed = pd.to_datetime(join_date, errors="coerce")
+        parsed = None if pd.isna(parsed) else parsed.to_pydatetime()
+
+    if parsed is None:
+        return math.nan
+    if isinstance(parsed, datetime):
+        return float((datetime.now(parsed.tzinfo) - parsed).days)
+    # Midnight of a plain date is never after "now" on the same day, so the
+    # floor of the timedelta is just the difference in ordinals
+    return float(date.today().toordinal() - parsed.toordinal())
+
+
+class FeatureEncoder:
+    """
+    Maps a request dict straight onto the two model input rows.
+
+    Column positions and defaults are resolved once here, so encoding a
+    request is a handful of dict lookups and float writes into buffers
+    that are allocated once per thread.
+    """
+
+    def __init__(self, feature_columns_cat, feature_columns_goal, defaults=None, rounding=None):
+        defaults = defaults or {}
+        self.columns = list(dict.fromkeys(feature_columns_cat + feature_columns_goal))
+        self.index = {col: i for i, col in enumerate(self.columns)}
+        self.cat_idx = np.array([self.index[c] for c in feature_columns_cat], dtype=np.intp)
+        self.goal_idx = np.array([self.index[c] for c in feature_columns_goal], dtype=np.intp)
+        self.days_idx = self.index.get("days_since_joined")
+
+        # Missing features are 0 unless a default is configured
+        self.template = np.zeros(len(self.columns), dtype=np.float64)
+        for col, value in defaults.items():
+            if col in self.index:
+                self.template[self.index[col]] = float(value)
+        self.default_join_date = defaults.get("join_date")
+
+        # Optional quantization, e.g. {"bmi": 1} rounds bmi to one decimal so
+        # near-identical requests share a prediction cache entry
+        self.rounding = [(self.index[col], digits) for col, digits in (rounding or {}).items()]
+
+        self._index_items = list(self.index.items())
+        self._local = threading.local()
+
+    def encode_into(self, user_data, out, convert_join_date=True):
+        """Write one user's features (in self.columns order) into out"""
+        if not isinstance(user_data, dict):
+            raise ValueError("User data must be an object")
+
+        out[:] = self.template
+        for col, i in self._index_items:
+            if col in user_data:
+                value = user_data[col]
+                if value is None:
+                    out[i] = math.nan
+                    continue
+                try:
+                    out[i] = float(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Invalid value for {col}: {value!r}")
+
+        # join_date, when present, always wins over days_since_joined
+        if convert_join_date and self.days_idx is not None:
+            if "join_date" in user_data:
+                out[self.days_idx] = days_since(user_data["join_date"])
+            elif self.default_join_date is not None:
+                out[self.days_idx] = days_since(self.default_join_date)
+
+        for i, digits in self.rounding:
+            out[i] = round(out[i], digits)
+        return out
+
+    def encode(self, user_data, convert_join_date=True):
+        """
+        Encode a single request into (cat_row, goal_row), each of shape (1, n).
+
+        The returned arrays are per-thread buffers reused by the next call
+        on the same thread; copy them if they need to outlive the request.
+        """
+        bufs = self._local.__dict__
+        if not bufs:
+            bufs["row"] = np.empty(len(self.columns), dtype=np.float64)
+            bufs["cat"] = np.empty((1, len(self.cat_idx)), dtype=np.float64)
+            bufs["goal"] = np.empty((1, len(self.goal_idx)), dtype=np.float64)
+
+        row = self.encode_into(user_data, bufs["row"], convert_join_date)
+        np.take(row, self.cat_idx, out=bufs["cat"][0])
+        np.take(row, self.goal_idx, out=bufs["goal"][0])
+        return bufs["cat"], bufs["goal"]
+
+    @staticmethod
+    def cache_key(row_cat, row_goal):
+        """Hashable key for one encoded request (NaN normalized to None)"""
+        return tuple(None if v != v else v for v in row_cat.tolist() + row_goal.tolist())
+
+    def encode_many(self, users, convert_join_date=True):
+        """
+        Encode a batch of requests.
+
+        Returns (X_cat, X_goal, positions, errors): the matrices hold only
+        the rows that encoded cleanly, positions maps them back to input
+        indices and errors maps failed input indices to a message.
+        """
+        matrix = np.empty((len(users), len(self.columns)), dtype=np.float64)
+        positions, errors = [], {}
+        for i, user_data in enumerate(users):
+            try:
+                self.encode_into(user_data, matrix[len(positions)], convert_join_date)
+                positions.append(i)
+            except Exception as e:
+                errors[i] = str(e)
+
+        matrix = matrix[:len(positions)]
+        return matrix[:, self.cat_idx], matrix[:, self.goal_idx], positions, errors
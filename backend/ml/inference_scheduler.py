@@ -0,0 +1,211 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# Upper bounds of the batch size histogram buckets (rows per batch)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+_STOP = object()
+
+
+class InferenceScheduler:
+    """
+    Micro-batches prediction requests onto a process pool.
+
+    submit() queues a request (one or more arrays with the same number of
+    rows) and returns a Future right away. A dispatcher thread drains the
+    queue into batches of up to max_batch_size rows, waiting at most
+    max_wait_ms after the first request for more to arrive, and runs each
+    batch as a single batch_fn call in a worker process. batch_fn gets the
+    arrays stacked row-wise and must return one array (or a tuple of
+    arrays) with one row per input row; every request's Future resolves
+    with its own slice.
+
+    Workers run initializer(*initargs) once when they start, which is
+    where models get loaded. At most max_in_flight batches are handed to
+    the pool at a time so the queue, not the pool, absorbs bursts.
+
+    A batch that fails (a bad input, a worker that died) fails only its own
+    requests. A pool broken by a dead worker is replaced with a new one.
+    Callers should wait at most result_timeout seconds for a Future and
+    then predict some other way.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=64, max_wait_ms=2.0, workers=None,
+                 initializer=None, initargs=(), mp_context=None, max_in_flight=None,
+                 result_timeout=10.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.result_timeout = result_timeout
+
+        self._pool_options = dict(max_workers=self.workers, mp_context=mp_context,
+                                  initializer=initializer, initargs=initargs)
+        self._pool = ProcessPoolExecutor(**self._pool_options)
+        self._pool_lock = threading.Lock()
+        self.pool_restarts = 0
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._dispatch, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def _reset_stats(self):
+        self._requests = 0
+        self._rows = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._in_flight = 0
+        self._max_batch_seen = 0
+        self._queue_wait = 0.0
+        self._batch_histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def submit(self, *arrays):
+        """Queue one request; returns a Future resolving to batch_fn's rows for it"""
+        if self._closed:
+            raise RuntimeError("Inference scheduler is shut down")
+        arrays = [np.asarray(a) for a in arrays]
+        future = Future()
+        self._queue.put((arrays, len(arrays[0]), future, time.perf_counter()))
+        return future
+
+    def _dispatch(self):
+        pending = None
+        while True:
+            item = pending if pending is not None else self._queue.get()
+            pending = None
+            if item is _STOP:
+                return
+
+            batch, rows = [item], item[1]
+            deadline = time.perf_counter() + self.max_wait
+            while rows < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                # Stop markers and requests that would overflow start the next batch
+                if item is _STOP or rows + item[1] > self.max_batch_size:
+                    pending = item
+                    break
+                batch.append(item)
+                rows += item[1]
+
+            self._slots.acquire()
+            try:
+                self._run(batch, rows)
+            except Exception as e:
+                # Keep dispatching: only this batch fails
+                self._finish(batch, None, e)
+
+    def _replace_pool(self, broken):
+        """Swap in a new pool for a broken one (once, however many batches saw it break)"""
+        with self._pool_lock:
+            if self._pool is not broken or self._closed:
+                return
+            self._pool = ProcessPoolExecutor(**self._pool_options)
+            self.pool_restarts += 1
+        print("⚠️ Inference worker died, process pool restarted")
+        broken.shutdown(wait=False)
+
+    def _run(self, batch, rows):
+        now = time.perf_counter()
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._rows += rows
+            self._batches += 1
+            self._in_flight += 1
+            self._max_batch_seen = max(self._max_batch_seen, rows)
+            self._queue_wait += sum(now - submitted for _, _, _, submitted in batch)
+            self._batch_histogram[np.searchsorted(BATCH_SIZE_BUCKETS, rows)] += 1
+
+        try:
+            stacked = [np.concatenate(parts) for parts in zip(*(arrays for arrays, _, _, _ in batch))]
+            pool = self._pool
+            try:
+                pool_future = pool.submit(self.batch_fn, *stacked)
+            except BrokenProcessPool:
+                self._replace_pool(pool)
+                pool = self._pool
+                pool_future = pool.submit(self.batch_fn, *stacked)
+        except Exception as e:
+            self._finish(batch, None, e)
+            return
+        pool_future.add_done_callback(lambda f: self._finish(batch, f, pool=pool))
+
+    def _finish(self, batch, pool_future, error=None, pool=None):
+        self._slots.release()
+        if error is None:
+            error = pool_future.exception()
+        if isinstance(error, BrokenProcessPool) and pool is not None:
+            self._replace_pool(pool)
+        with self._stats_lock:
+            self._in_flight -= 1
+            if error is not None:
+                self._failed_batches += 1
+
+        try:
+            if error is not None:
+                raise error
+            result = pool_future.result()
+            outputs = result if isinstance(result, tuple) else (result,)
+            start = 0
+            for _, n, future, _ in batch:
+                rows = tuple(out[start:start + n] for out in outputs)
+                future.set_result(rows if isinstance(result, tuple) else rows[0])
+                start += n
+        except Exception as e:
+            # Never leave a caller waiting on a future nobody will resolve
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def stats(self):
+        """Queue depth and batching metrics since start (or the last reset)"""
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "in_flight_batches": self._in_flight,
+                "requests": self._requests,
+                "batches": batches,
+                "failed_batches": self._failed_batches,
+                "pool_restarts": self.pool_restarts,
+                "avg_batch_size": round(self._rows / batches, 2) if batches else 0.0,
+                "max_batch_size": self._max_batch_seen,
+                "avg_queue_wait_ms": round(self._queue_wait / self._requests * 1000, 3) if self._requests else 0.0,
+                "batch_size_histogram": {
+                    f"<={bound}" if bound is not None else f">{BATCH_SIZE_BUCKETS[-1]}": count
+                    for bound, count in zip(list(BATCH_SIZE_BUCKETS) + [None], self._batch_histogram)
+                },
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            in_flight = self._in_flight
+            self._reset_stats()
+            self._in_flight = in_flight
+
+    def shutdown(self, wait=True):
+        """Finish queued requests, then stop the dispatcher and the workers"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+        self._pool.shutdown(wait=wait)
@@ -1,16 +1,130 @@
-import pandas as pd
-import joblib
-from sklearn.preprocessing import LabelEncoder
+import numpy as np
 import os
+import threading
+import time
+from datetime import date, datetime
+
+from cohort_index import CohortIndex, COHORT_FIELDS
+from feature_encoder import FeatureEncoder
+from inference_scheduler import InferenceScheduler
+from model_registry import ModelRegistry, ModelStats, model_files_version
+from neighbors import SimilarUserIndex
+from prediction_cache import PredictionCache
+from tree_ensemble import load_ensemble
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Pickled models and their compiled counterparts (see compile_models.py)
+CATEGORY_MODEL = "lgb_model"
+GOAL_MODEL = "lgb_model_balanced"
+
+# Goal names in LabelEncoder (sorted) order, as used when training
+GOAL_LABELS = np.array(["maintenance", "muscle_gain", "weight_loss"])
+
+# Defaults for optional fields the frontend may leave out
+DEFAULT_USER_DATA = {
+    "avg_sleep_duration": 420,  # 7 hours in minutes
+    "avg_calories_consumed": 2000,
+    "avg_calories_burned": 200,
+    "avg_steps": 8000,
+    "avg_workout_duration": 30,
+    "avg_workout_intensity": 2,
+    "avg_heart_rate": 70,
+    "protein_g": 100,
+    "carbs_g": 250,
+    "fat_g": 70,
+    "join_date": "2024-01-01"
+}
+
+# Members encoded per chunk while bulk-loading the similar-user index
+NEIGHBOR_LOAD_CHUNK = 10000
+
+def load_model_files(model_dir, use_compiled=True):
+    """
+    Load the category and goal models from model_dir
+    
+    Returns:
+        tuple: (clf_cat, model_goal, source), source being "compiled" for
+        the memory-mapped .npz tables or "pickle" for the LightGBM pickles
+    """
+    cat_npz = os.path.join(model_dir, CATEGORY_MODEL + ".npz")
+    goal_npz = os.path.join(model_dir, GOAL_MODEL + ".npz")
+    
+    if use_compiled and os.path.exists(cat_npz) and os.path.exists(goal_npz):
+        # Memory-mapped, so workers share the pages and skip lightgbm
+        return load_ensemble(cat_npz), load_ensemble(goal_npz), "compiled"
+    
+    import joblib
+    clf_cat = joblib.load(os.path.join(model_dir, CATEGORY_MODEL + ".pkl"))
+    model_goal = joblib.load(os.path.join(model_dir, GOAL_MODEL + ".pkl"))
+    return clf_cat, model_goal, "pickle"
+
+# Models of an inference worker process, set by _init_worker
+_worker_models = None
+
+def _init_worker(model_dir, use_compiled):
+    """Load the models once per worker process"""
+    global _worker_models
+    # The module-level service already has them when it matches
+    models = ml_service.models
+    if models is not None and models.path == model_dir and models.source == (
+            "compiled" if use_compiled else "pickle"):
+        _worker_models = models.clf_cat, models.model_goal
+    else:
+        _worker_models = load_model_files(model_dir, use_compiled)[:2]
+
+def _predict_labels_batch(X_cat, X_goal):
+    """Worker side of FitnessMLService._predict_nums"""
+    clf_cat, model_goal = _worker_models
+    return clf_cat.predict(X_cat), model_goal.predict(X_goal)
+
+class ModelBundle:
+    """
+    One loaded model version and everything tied to it
+    
+    The service swaps whole bundles, so a request that picked one up keeps
+    using the same pair of models (and worker pool) until it finishes.
+    """
+    
+    def __init__(self, clf_cat, model_goal, source, version, path):
+        self.clf_cat = clf_cat
+        self.model_goal = model_goal
+        self.source = source
+        self.version = version
+        self.path = path
+        self.loaded_at = datetime.utcnow()
+        self.scheduler = None
 
 class FitnessMLService:
-    def __init__(self, model_dir="./models/"):
-        """Initialize ML service with model loading"""
+    def __init__(self, model_dir=MODEL_DIR, use_compiled=True,
+                 cache_size=10000, cache_ttl=3600, cache_rounding=None,
+                 n_neighbors=20, registry_dir=None):
+        """
+        Initialize ML service with model loading
+        
+        Args:
+            model_dir (str): Directory holding the model files
+            use_compiled (bool): Prefer the compiled .npz models when present
+            cache_size (int): Max cached recommendations (0 disables the cache)
+            cache_ttl (float): Seconds a cached recommendation stays valid
+            cache_rounding (dict): Optional {feature: decimals} quantization,
+                e.g. {"bmi": 1}, so near-identical inputs share an entry
+            n_neighbors (int): Similar users averaged into a recommendation
+            registry_dir (str): Optional model registry (see model_registry.py);
+                its active version is loaded instead of model_dir
+        """
         self.model_dir = model_dir
-        self.clf_cat = None
-        self.model_goal = None
-        self.le = None
-        self.user_df = None
+        self.use_compiled = use_compiled
+        self.registry = ModelRegistry(registry_dir) if registry_dir else None
+        self.models = None
+        # Per-version prediction stats, kept across swaps for comparison
+        self.version_stats = {}
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._scheduler_options = None
+        self.cohorts = CohortIndex()
+        self.n_neighbors = n_neighbors
+        self.neighbors = SimilarUserIndex()
         
         # Feature columns
         self.feature_columns_cat = [
@@ -26,149 +140,461 @@ class FitnessMLService:
             "avg_sleep_duration", "days_since_joined"
         ]
         
+        # Precompiled request -> feature row mappings
+        self.encoder = FeatureEncoder(
+            self.feature_columns_cat, self.feature_columns_goal, rounding=cache_rounding
+        )
+        self.default_encoder = FeatureEncoder(
+            self.feature_columns_cat, self.feature_columns_goal,
+            defaults=DEFAULT_USER_DATA, rounding=cache_rounding
+        )
+        
+        # Recommendations keyed on the encoded feature tuple
+        self.cache = PredictionCache(max_size=cache_size, ttl=cache_ttl)
+        
         self.load_models()
         self.setup_user_data()
     
-    def load_models(self):
-        """Load ML models and encoders"""
-        try:
-            # Load models - adjust paths as needed
-            self.clf_cat = joblib.load("lgb_model.pkl")
-            self.model_goal = joblib.load("lgb_model_balanced.pkl")
-            
-            # Setup label encoder
-            self.le = LabelEncoder()
-            self.le.fit(["weight_loss", "muscle_gain", "maintenance"])
-            
-            print("✅ ML models loaded successfully!")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error loading models: {e}")
-            return False
+    # The active bundle's models, for callers that predate ModelBundle
+    @property
+    def clf_cat(self):
+        return self.models.clf_cat if self.models else None
+    
+    @property
+    def model_goal(self):
+        return self.models.model_goal if self.models else None
+    
+    @property
+    def model_source(self):
+        return self.models.source if self.models else None
+    
+    @property
+    def model_version(self):
+        return self.models.version if self.models else None
+    
+    @property
+    def scheduler(self):
+        return self.models.scheduler if self.models else None
+    
+    def load_models(self, version=None):
+        """
+        Load, warm up and swap in a model version
+        
+        Requests already running finish on the models they started with.
+        
+        Args:
+            version (str): Registry version to load; defaults to the active
+                one (or the files in model_dir without a registry)
+        
+        Returns:
+            bool: Whether the new models are now serving
+        """
+        with self._reload_lock:
+            try:
+                bundle = self._load_bundle(version)
+                self._warm_up(bundle)
+                self._activate(bundle)
+                print(f"✅ ML models loaded successfully! ({bundle.source}, version {bundle.version})")
+                return True
+                
+            except Exception as e:
+                print(f"❌ Error loading models: {e}")
+                return False
+    
+    def reload_models(self, version=None):
+        """load_models() on a background thread; returns the thread"""
+        thread = threading.Thread(target=self.load_models, args=(version,), daemon=True)
+        thread.start()
+        return thread
+    
+    def watch_registry(self, interval=30):
+        """Poll the registry manifest and load whichever version becomes active"""
+        if self.registry is None:
+            raise Exception("No model registry configured")
+        
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    active = self.registry.active_version()
+                except Exception as e:
+                    print(f"❌ Could not read model registry: {e}")
+                    continue
+                if active and active != self.model_version:
+                    self.load_models(active)
+        
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=watch, name="model-registry-watcher", daemon=True)
+            self._watcher.start()
+    
+    def _load_bundle(self, version):
+        if self.registry is not None:
+            version = version or self.registry.active_version()
+            path = self.registry.version_dir(version)
+        else:
+            path = self.model_dir
+        clf_cat, model_goal, source = load_model_files(path, self.use_compiled)
+        return ModelBundle(clf_cat, model_goal, source, version or model_files_version(path), path)
+    
+    def _warm_up(self, bundle, n_rows=64):
+        """Score a few synthetic users so the first real requests don't pay for page faults"""
+        rng = np.random.default_rng(0)
+        users = [
+            {"age": int(age), "bmi": float(bmi), "fitness_level_num": int(level)}
+            for age, bmi, level in zip(rng.integers(18, 70, n_rows), rng.uniform(17, 40, n_rows),
+                                       rng.integers(0, 3, n_rows))
+        ]
+        X_cat, X_goal, _, _ = self.default_encoder.encode_many(users)
+        for n in (1, n_rows):
+            bundle.clf_cat.predict(X_cat[:n])
+            bundle.model_goal.predict(X_goal[:n])
+    
+    def _activate(self, bundle):
+        # Workers hold their own copy of the models
+        if self._scheduler_options is not None:
+            bundle.scheduler = self._new_scheduler(bundle)
+        self.version_stats.setdefault(bundle.version, ModelStats(bundle.version))
+        
+        previous, self.models = self.models, bundle
+        
+        # Cache keys carry the version, this just frees the old entries
+        self.cache.clear()
+        if previous is not None and previous.scheduler is not None:
+            # Drains what was already queued on the old pool
+            threading.Thread(target=previous.scheduler.shutdown, daemon=True).start()
+    
+    def _new_scheduler(self, bundle):
+        return InferenceScheduler(
+            _predict_labels_batch, initializer=_init_worker,
+            initargs=(bundle.path, bundle.source == "compiled"), **self._scheduler_options
+        )
+    
+    def start_scheduler(self, **options):
+        """
+        Run model predictions on a micro-batching process pool
+        
+        Concurrent get_recommendation / predict_many calls are then grouped
+        into one predict call per batch in a worker process, instead of each
+        request thread scoring its own rows under the GIL.
+        
+        Args:
+            **options: InferenceScheduler settings (workers, max_batch_size,
+                max_wait_ms, mp_context, result_timeout)
+        
+        Returns:
+            InferenceScheduler: The running scheduler
+        """
+        self.stop_scheduler()
+        self._scheduler_options = options
+        self.models.scheduler = self._new_scheduler(self.models)
+        print(f"✅ Inference scheduler started ({self.scheduler.workers} workers)")
+        return self.scheduler
+    
+    def stop_scheduler(self):
+        """Go back to predicting in the calling thread"""
+        self._scheduler_options = None
+        if self.models is not None:
+            scheduler, self.models.scheduler = self.models.scheduler, None
+            if scheduler is not None:
+                scheduler.shutdown()
+    
+    def model_info(self):
+        """Active version, what the registry offers and per-version prediction stats"""
+        models = self.models
+        return {
+            "active_version": models.version if models else None,
+            "source": models.source if models else None,
+            "loaded_at": models.loaded_at.isoformat() if models else None,
+            "registry": self.registry.root if self.registry else None,
+            "available_versions": self.registry.versions() if self.registry else [],
+            "versions": {version: stats.snapshot() for version, stats in list(self.version_stats.items())},
+        }
     
     def setup_user_data(self):
-        """Setup example user data - replace with your database query"""
-        self.user_df = pd.DataFrame([
-            {"category": "Beginner", "merged_goal": "weight_loss",
-             "avg_calories_consumed": 2200, "protein_g": 100, "carbs_g": 250, "fat_g": 70,
-             "avg_sleep_duration": 420, "avg_workout_duration": 40, "avg_workout_intensity": 2,
-             "days_since_joined": 120},
-            {"category": "Pro", "merged_goal": "muscle_gain",
-             "avg_calories_consumed": 2800, "protein_g": 150, "carbs_g": 350, "fat_g": 80,
-             "avg_sleep_duration": 460, "avg_workout_duration": 60, "avg_workout_intensity": 3,
-             "days_since_joined": 400},
-            {"category": "Activate", "merged_goal": "maintenance",
-             "avg_calories_consumed": 2500, "protein_g": 120, "carbs_g": 300, "fat_g": 75,
-             "avg_sleep_duration": 440, "avg_workout_duration": 50, "avg_workout_intensity": 2.5,
-             "days_since_joined": 250},
-        ])
+        """Seed the cohort index with example users until load_cohorts() runs"""
+        today = date.today().toordinal()
+        example_users = [
+            ("Beginner", "weight_loss",
+             {"avg_calories_consumed": 2200, "protein_g": 100, "carbs_g": 250, "fat_g": 70,
+              "avg_sleep_duration": 420, "avg_workout_duration": 40, "avg_workout_intensity": 2},
+             120),
+            ("Pro", "muscle_gain",
+             {"avg_calories_consumed": 2800, "protein_g": 150, "carbs_g": 350, "fat_g": 80,
+              "avg_sleep_duration": 460, "avg_workout_duration": 60, "avg_workout_intensity": 3},
+             400),
+            ("Activate", "maintenance",
+             {"avg_calories_consumed": 2500, "protein_g": 120, "carbs_g": 300, "fat_g": 75,
+              "avg_sleep_duration": 440, "avg_workout_duration": 50, "avg_workout_intensity": 2.5},
+             250),
+        ]
+        self.cohorts.clear()
+        for category, goal, values, days_since_joined in example_users:
+            self.cohorts.add(category, goal, values, date.fromordinal(today - days_since_joined))
+    
+    def load_cohorts(self, members):
+        """
+        Rebuild the cohort index from real users
+        
+        Args:
+            members (iterable): (category, goal, values, join_date) tuples,
+                e.g. streamed from the UserProfile table
+        
+        Returns:
+            int: Number of members loaded. The example users are kept when
+            there are none.
+        """
+        cohorts = CohortIndex()
+        for category, goal, values, join_date in members:
+            cohorts.add(category, goal, values, join_date)
+        if len(cohorts):
+            self.cohorts = cohorts
+        return len(cohorts)
+    
+    def load_neighbors(self, members):
+        """
+        Rebuild the similar-user index from real users
+        
+        Args:
+            members (iterable): (member_id, user_data) pairs; missing fields
+                get the request defaults, like get_fitness_recommendation
+        
+        Returns:
+            int: Number of members indexed. Members that fail to encode are
+            skipped. With none, recommendations use the cohort index.
+        """
+        ids, chunks, users = [], [], []
+        
+        def flush():
+            _, X_goal, positions, _ = self.default_encoder.encode_many([u for _, u in users])
+            ids.extend(users[i][0] for i in positions)
+            chunks.append(X_goal)
+            users.clear()
+        
+        for member in members:
+            users.append(member)
+            if len(users) >= NEIGHBOR_LOAD_CHUNK:
+                flush()
+        flush()
+        
+        self.neighbors = SimilarUserIndex().build(np.concatenate(chunks), ids)
+        return len(self.neighbors)
+    
+    def add_neighbor(self, member_id, user_data):
+        """Index (or re-index) one member for similar-user lookups"""
+        _, row_goal = self.default_encoder.encode(user_data)
+        self.neighbors.insert(member_id, row_goal[0].copy())
+    
+    def remove_neighbor(self, member_id):
+        self.neighbors.remove(member_id)
     
     def predict_category(self, user_data):
         """Predict user category only"""
-        if self.clf_cat is None:
+        models = self.models
+        if models is None:
             raise Exception("Category model not loaded")
         
-        df = pd.DataFrame([user_data])
-        
-        # Handle missing features
-        for col in self.feature_columns_cat:
-            if col not in df.columns:
-                df[col] = 0
-        
-        df_cat = df[self.feature_columns_cat]
-        category_num = self.clf_cat.predict(df_cat)[0]
-        category_map = {0: "Beginner", 1: "Activate", 2: "Pro"}
-        category = category_map.get(category_num, "Unknown")
+        row_cat, _ = self.encoder.encode(user_data, convert_join_date=False)
+        category_num = models.clf_cat.predict(row_cat)[0]
+        category = self._decode_category(category_num)
         
         return {"category": category, "category_num": int(category_num)}
     
     def predict_goal(self, user_data):
         """Predict user goal only"""
-        if self.model_goal is None:
+        models = self.models
+        if models is None:
             raise Exception("Goal model not loaded")
         
-        df = pd.DataFrame([user_data])
-        
-        # Handle missing features
-        for col in self.feature_columns_goal:
-            if col not in df.columns:
-                df[col] = 0
-        
-        df_goal = df[self.feature_columns_goal]
-        goal_num = self.model_goal.predict(df_goal)[0]
-        goal = self.le.inverse_transform([goal_num])[0]
+        _, row_goal = self.encoder.encode(user_data, convert_join_date=False)
+        goal_num = models.model_goal.predict(row_goal)[0]
+        goal = self._decode_goals([goal_num])[0]
         
         return {"goal": goal, "goal_num": int(goal_num)}
     
-    def get_recommendation(self, user_data):
-        """Generate complete fitness recommendation"""
-        if not self.clf_cat or not self.model_goal:
+    def _active_models(self):
+        models = self.models
+        if models is None:
             raise Exception("Models not loaded")
+        return models
+    
+    def _predict_nums(self, models, X_cat, X_goal):
+        """
+        Raw (category_nums, goal_nums) for encoded rows, batched when a
+        scheduler runs, timed into the version's stats
+        """
+        start = time.perf_counter()
+        try:
+            result = future = None
+            scheduler = models.scheduler
+            if scheduler is not None:
+                try:
+                    future = scheduler.submit(X_cat, X_goal)
+                except RuntimeError:
+                    # Pool retired by a model swap since we picked it up
+                    pass
+            if future is not None:
+                try:
+                    result = future.result(timeout=scheduler.result_timeout)
+                except Exception as e:
+                    # Failed batch, dead worker or timeout: score here instead
+                    print(f"⚠️ Batched prediction failed, predicting in-thread: {e!r}")
+            if result is None:
+                result = models.clf_cat.predict(X_cat), models.model_goal.predict(X_goal)
+        except Exception:
+            self.version_stats[models.version].record(len(X_cat), time.perf_counter() - start, error=True)
+            raise
+        self.version_stats[models.version].record(len(X_cat), time.perf_counter() - start)
+        return result
+    
+    def _encoder_for(self, apply_defaults):
+        return self.default_encoder if apply_defaults else self.encoder
+    
+    def _decode_goals(self, goal_nums):
+        return GOAL_LABELS[np.asarray(goal_nums, dtype=np.intp)]
+    
+    def _decode_category(self, category_num):
+        category_map = {0: "Beginner", 1: "Activate", 2: "Pro"}
+        return category_map.get(category_num, "Unknown")
+    
+    def predict_labels(self, user_data, apply_defaults=False):
+        """
+        Predict (category, goal) for one user
         
-        # Prepare data
-        df = pd.DataFrame([user_data])
-        
-        # Handle join_date conversion
-        if "join_date" in df.columns:
-            df["join_date"] = pd.to_datetime(df["join_date"], errors="coerce")
-            today = pd.Timestamp.today()
-            df["days_since_joined"] = (today - df["join_date"]).dt.days
-            df = df.drop(columns=["join_date"])
+        Served from self.cache when the encoded features were seen before.
+        """
+        row_cat, row_goal = self._encoder_for(apply_defaults).encode(user_data)
+        return self._predict_row(row_cat, row_goal)
+    
+    def _predict_row(self, row_cat, row_goal):
+        models = self._active_models()
+        cache_key = (models.version,) + FeatureEncoder.cache_key(row_cat[0], row_goal[0])
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        # Ensure all required features exist
-        for col in self.feature_columns_cat:
-            if col not in df.columns:
-                df[col] = 0
-        df_cat = df[self.feature_columns_cat]
+        # Make predictions
+        category_nums, goal_nums = self._predict_nums(models, row_cat, row_goal)
+        category = self._decode_category(category_nums[0])
+        goal = self._decode_goals(goal_nums)[0]
         
-        for col in self.feature_columns_goal:
-            if col not in df.columns:
-                df[col] = 0
-        df_goal = df[self.feature_columns_goal]
+        self.cache.put(cache_key, (category, goal))
+        return category, goal
+    
+    def get_recommendation(self, user_data, apply_defaults=False):
+        """Generate complete fitness recommendation"""
+        row_cat, row_goal = self._encoder_for(apply_defaults).encode(user_data)
+        category, goal = self._predict_row(row_cat, row_goal)
+        return self._build_recommendation(category, goal, row_goal[0])
+    
+    def predict_many(self, users, apply_defaults=False):
+        """
+        Generate recommendations for a list of users.
         
-        # Make predictions
-        category_num = self.clf_cat.predict(df_cat)[0]
-        category_map = {0: "Beginner", 1: "Activate", 2: "Pro"}
-        category = category_map.get(category_num, "Unknown")
+        All valid rows are scored with a single predict call per model.
+        Results come back in input order; a row that can't be scored gets
+        {"success": False, "error": ...} instead of failing the batch.
+        """
+        X_cat, X_goal, positions, errors = self._encoder_for(apply_defaults).encode_many(users)
+        results = [None] * len(users)
+        for i, error in errors.items():
+            results[i] = {"success": False, "error": error}
+        labels = self._labels_many(X_cat, X_goal)
         
-        goal_num = self.model_goal.predict(df_goal)[0]
-        goal = self.le.inverse_transform([goal_num])[0]
+        # Without similar users, everyone in a (category, goal) pair gets
+        # the same recommendation, so build it once
+        use_neighbors = len(self.neighbors) > 0
+        built = {}
+        for row, key in enumerate(labels):
+            try:
+                if use_neighbors:
+                    results[positions[row]] = self._build_recommendation(*key, X_goal[row])
+                    continue
+                if key not in built:
+                    built[key] = self._build_recommendation(*key)
+                results[positions[row]] = built[key]
+            except Exception as e:
+                results[positions[row]] = {"success": False, "error": str(e)}
         
-        # Find similar users
-        similar_users = self.user_df[
-            (self.user_df['category'] == category) &
-            (self.user_df['merged_goal'] == goal)
-        ]
+        return results
+    
+    def predict_labels_many(self, users, apply_defaults=False):
+        """(category, goal) for each user, in input order; None where a row can't be scored"""
+        X_cat, X_goal, positions, _ = self._encoder_for(apply_defaults).encode_many(users)
+        results = [None] * len(users)
+        for position, key in zip(positions, self._labels_many(X_cat, X_goal)):
+            results[position] = key
+        return results
+    
+    def _labels_many(self, X_cat, X_goal):
+        """(category, goal) per encoded row; only rows that miss the cache go to the models"""
+        models = self._active_models()
+        labels = [None] * len(X_cat)
+        cache_keys, miss_rows = [], []
+        for row in range(len(X_cat)):
+            cache_key = (models.version,) + FeatureEncoder.cache_key(X_cat[row], X_goal[row])
+            labels[row] = self.cache.get(cache_key)
+            if labels[row] is None:
+                cache_keys.append(cache_key)
+                miss_rows.append(row)
         
-        if similar_users.empty:
-            similar_users = self.user_df[self.user_df['category'] == category]
+        if miss_rows:
+            category_nums, goal_nums = self._predict_nums(models, X_cat[miss_rows], X_goal[miss_rows])
+            goals = self._decode_goals(goal_nums)
+            for row, cache_key, category_num, goal in zip(miss_rows, cache_keys, category_nums, goals):
+                labels[row] = (self._decode_category(category_num), goal)
+                self.cache.put(cache_key, labels[row])
+        return labels
+    
+    def _similar_users(self, row_goal):
+        """Average stats of the n_neighbors members closest to row_goal"""
+        _, _, rows = self.neighbors.query(row_goal, self.n_neighbors)
+        if not len(rows):
+            return None
+        counts = np.sum(~np.isnan(rows), axis=0)
+        sums = np.nansum(rows, axis=0)
+        stats = {
+            col: sums[i] / counts[i] if counts[i] else None
+            for i, col in enumerate(self.feature_columns_goal)
+        }
+        return {field: stats[field] for field in COHORT_FIELDS + ["days_since_joined"]}
+    
+    def _build_recommendation(self, category, goal, row_goal=None):
+        """
+        Turn similar users' averages into a recommendation payload
         
-        if similar_users.empty:
-            similar_users = self.user_df
+        With row_goal (the user's encoded goal features) and a populated
+        similar-user index, the n_neighbors nearest members are averaged;
+        otherwise the (category, goal) cohort is.
+        """
+        cohort = None
+        if row_goal is not None and len(self.neighbors):
+            cohort = self._similar_users(row_goal)
+        if cohort is None:
+            cohort = self.cohorts.lookup(category, goal) or {}
         
-        # Calculate recommendations
-        rec_diet = similar_users[['avg_calories_consumed', 'protein_g', 'carbs_g', 'fat_g']].mean()
-        rec_sleep = similar_users[['avg_sleep_duration']].mean()
-        rec_workout = similar_users[['avg_workout_duration', 'avg_workout_intensity']].mean()
-        rec_experience = similar_users[['days_since_joined']].mean()
+        # Stats nobody in the cohort reported fall back to the request defaults
+        for field in COHORT_FIELDS:
+            if cohort.get(field) is None:
+                cohort[field] = DEFAULT_USER_DATA[field]
+        if cohort.get("days_since_joined") is None:
+            cohort["days_since_joined"] = 0
         
         recommendation_text = f"""Category: {category}
 Goal: {goal}
-Experience: {rec_experience['days_since_joined']:.0f} days since joining
+Experience: {cohort['days_since_joined']:.0f} days since joining
 
 🥗 Nutrition:
-  - Calories: {rec_diet['avg_calories_consumed']:.0f}
-  - Protein: {rec_diet['protein_g']:.0f} g
-  - Carbs: {rec_diet['carbs_g']:.0f} g
-  - Fat: {rec_diet['fat_g']:.0f} g
+  - Calories: {cohort['avg_calories_consumed']:.0f}
+  - Protein: {cohort['protein_g']:.0f} g
+  - Carbs: {cohort['carbs_g']:.0f} g
+  - Fat: {cohort['fat_g']:.0f} g
 
 🏋️ Workout:
-  - Duration: {rec_workout['avg_workout_duration']:.0f} min
-  - Intensity: {rec_workout['avg_workout_intensity']:.1f}/4 scale
+  - Duration: {cohort['avg_workout_duration']:.0f} min
+  - Intensity: {cohort['avg_workout_intensity']:.1f}/4 scale
 
 😴 Sleep:
-  - Target duration: {rec_sleep['avg_sleep_duration'] / 60:.1f} hours"""
+  - Target duration: {cohort['avg_sleep_duration'] / 60:.1f} hours"""
         
         return {
             "success": True,
@@ -176,22 +602,23 @@ Experience: {rec_experience['days_since_joined']:.0f} days since joining
             "goal": goal,
             "recommendation": recommendation_text,
             "nutrition": {
-                "calories": int(rec_diet['avg_calories_consumed']),
-                "protein": int(rec_diet['protein_g']),
-                "carbs": int(rec_diet['carbs_g']),
-                "fat": int(rec_diet['fat_g'])
+                "calories": int(cohort['avg_calories_consumed']),
+                "protein": int(cohort['protein_g']),
+                "carbs": int(cohort['carbs_g']),
+                "fat": int(cohort['fat_g'])
             },
             "workout": {
-                "duration": int(rec_workout['avg_workout_duration']),
-                "intensity": round(rec_workout['avg_workout_intensity'], 1)
+                "duration": int(cohort['avg_workout_duration']),
+                "intensity": round(cohort['avg_workout_intensity'], 1)
             },
             "sleep": {
-                "hours": round(rec_sleep['avg_sleep_duration'] / 60, 1)
+                "hours": round(cohort['avg_sleep_duration'] / 60, 1)
             }
         }
 
-# Initialize the service (singleton pattern)
-ml_service = FitnessMLService()
+# Initialize the service (singleton pattern); ML_MODEL_REGISTRY points it
+# at a versioned model registry instead of the files next to this module
+ml_service = FitnessMLService(registry_dir=os.getenv("ML_MODEL_REGISTRY"))
 
 def get_fitness_recommendation(user_data):
     """
@@ -217,26 +644,8 @@ def get_fitness_recommendation(user_data):
         dict: Recommendation result
     """
     try:
-        # Set defaults for missing fields
-        defaults = {
-            "avg_sleep_duration": 420,  # 7 hours in minutes
-            "avg_calories_consumed": 2000,
-            "avg_calories_burned": 200,
-            "avg_steps": 8000,
-            "avg_workout_duration": 30,
-            "avg_workout_intensity": 2,
-            "avg_heart_rate": 70,
-            "protein_g": 100,
-            "carbs_g": 250,
-            "fat_g": 70,
-            "join_date": "2024-01-01"
-        }
-        
-        for key, value in defaults.items():
-            if key not in user_data:
-                user_data[key] = value
-        
-        return ml_service.get_recommendation(user_data)
+        # Defaults for missing fields are applied by the encoder
+        return ml_service.get_recommendation(user_data, apply_defaults=True)
         
     except Exception as e:
         return {
@@ -244,6 +653,23 @@ def get_fitness_recommendation(user_data):
             "error": str(e)
         }
 
+def get_fitness_recommendations(users):
+    """
+    Batch version of get_fitness_recommendation
+    
+    Args:
+        users (list): List of user data dicts (same fields as above)
+    
+    Returns:
+        list: One result per user, in input order. Rows that fail carry
+        {"success": False, "error": ...} without affecting the others.
+    """
+    try:
+        return ml_service.predict_many(users, apply_defaults=True)
+        
+    except Exception as e:
+        return [{"success": False, "error": str(e)} for _ in users]
+
 # Example usage for your existing routes
 if __name__ == "__main__":
     # Test the service
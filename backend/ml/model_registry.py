@@ -0,0 +1,205 @@
+"""
+Versioned model artifacts on disk.
+
+    registry/
+        manifest.json           {"active": "...", "versions": [...]}
+        20261018T071500-393d99ec/
+            lgb_model.pkl, lgb_model_balanced.pkl, (.npz if compiled)
+
+Publish a retrained model from the directory holding its files:
+
+    python model_registry.py publish <registry> <model_dir> [--version v] [--activate]
+    python model_registry.py activate <registry> <version>
+    python model_registry.py list <registry>
+
+Running services that watch the registry (FitnessMLService.watch_registry)
+load and swap in whatever version the manifest marks active.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from datetime import datetime
+
+# Artifacts copied per version; the .npz files are optional
+MODEL_FILES = ("lgb_model.pkl", "lgb_model_balanced.pkl", "lgb_model.npz", "lgb_model_balanced.npz")
+MANIFEST = "manifest.json"
+
+# Upper bounds (ms) of the model latency histogram buckets
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+
+def model_files_version(model_dir):
+    """
+    Short content hash identifying the trained models in model_dir
+
+    Hashes the .pkl files, which the .npz tables are compiled from, so both
+    model sources report the same version.
+    """
+    digest = hashlib.sha1()
+    for name in ("lgb_model", "lgb_model_balanced"):
+        path = os.path.join(model_dir, name + ".pkl")
+        if not os.path.exists(path):
+            path = os.path.join(model_dir, name + ".npz")
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """A directory of immutable model versions plus a manifest naming the active one"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def manifest(self):
+        path = os.path.join(self.root, MANIFEST)
+        if not os.path.exists(path):
+            return {"active": None, "versions": []}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        # Write-then-rename so readers never see a half-written file
+        tmp_path = os.path.join(self.root, MANIFEST + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.root, MANIFEST))
+
+    def active_version(self):
+        return self.manifest()["active"]
+
+    def versions(self):
+        return [entry["version"] for entry in self.manifest()["versions"]]
+
+    def version_dir(self, version):
+        if version not in self.versions():
+            raise KeyError(f"Unknown model version: {version}")
+        return os.path.join(self.root, version)
+
+    def publish(self, model_dir, version=None, activate=False, notes=""):
+        """Copy the model files from model_dir in as a new version"""
+        files = [name for name in MODEL_FILES if os.path.exists(os.path.join(model_dir, name))]
+        if not all(name in files for name in MODEL_FILES[:2]):
+            raise FileNotFoundError(f"{model_dir} must contain {MODEL_FILES[0]} and {MODEL_FILES[1]}")
+
+        content_hash = model_files_version(model_dir)
+        version = version or f"{datetime.utcnow():%Y%m%dT%H%M%S}-{content_hash[:8]}"
+        if version in self.versions():
+            raise ValueError(f"Model version {version} already exists")
+
+        # Copied under a temporary name and renamed, so a version directory
+        # is either complete or absent
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f".{version}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in files:
+            shutil.copy2(os.path.join(model_dir, name), os.path.join(staging, name))
+        os.rename(staging, os.path.join(self.root, version))
+
+        manifest = self.manifest()
+        manifest["versions"].append({
+            "version": version,
+            "content_hash": content_hash,
+            "files": files,
+            "created_at": datetime.utcnow().isoformat(),
+            "notes": notes,
+        })
+        if activate or manifest["active"] is None:
+            manifest["active"] = version
+        self._write_manifest(manifest)
+        return version
+
+    def activate(self, version):
+        manifest = self.manifest()
+        if version not in [entry["version"] for entry in manifest["versions"]]:
+            raise KeyError(f"Unknown model version: {version}")
+        manifest["active"] = version
+        self._write_manifest(manifest)
+
+
+class ModelStats:
+    """Prediction counters and a latency histogram for one model version"""
+
+    def __init__(self, version):
+        self.version = version
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, rows, seconds, error=False):
+        ms = seconds * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+            self.errors += error
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.buckets[bucket] += 1
+
+    def _percentile_ms(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        target = q * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return round(self.max_seconds * 1000, 3)
+
+    def snapshot(self):
+        with self._lock:
+            requests = self.requests
+            return {
+                "requests": requests,
+                "rows": self.rows,
+                "errors": self.errors,
+                "avg_latency_ms": round(self.total_seconds / requests * 1000, 3) if requests else 0.0,
+                "p50_latency_ms": self._percentile_ms(0.5) if requests else 0.0,
+                "p95_latency_ms": self._percentile_ms(0.95) if requests else 0.0,
+                "max_latency_ms": round(self.max_seconds * 1000, 3),
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="add the models in model_dir as a new version")
+    publish.add_argument("registry")
+    publish.add_argument("model_dir")
+    publish.add_argument("--version")
+    publish.add_argument("--notes", default="")
+    publish.add_argument("--activate", action="store_true")
+    activate = commands.add_parser("activate", help="make a published version the active one")
+    activate.add_argument("registry")
+    activate.add_argument("version")
+    listing = commands.add_parser("list", help="show published versions")
+    listing.add_argument("registry")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    try:
+        if args.command == "publish":
+            version = registry.publish(args.model_dir, args.version, args.activate, args.notes)
+            print(f"✅ Published model version {version}")
+        elif args.command == "activate":
+            registry.activate(args.version)
+            print(f"✅ Active model version is now {args.version}")
+        else:
+            active = registry.active_version()
+            for entry in registry.manifest()["versions"]:
+                marker = "*" if entry["version"] == active else " "
+                print(f"{marker} {entry['version']}  {entry['created_at']}  {entry['notes']}")
+    except Exception as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -0,0 +1,285 @@
+import threading
+
+import numpy as np
+
+# Leaves scanned per step of a query
+_LEAVES_PER_STEP = 4
+
+# Below this many points one vectorized scan beats walking the leaves
+_BRUTE_FORCE_ROWS = 20000
+
+
+class SimilarUserIndex:
+    """
+    k-nearest-neighbour search over standardized feature rows.
+
+    Points live in a KD-tree built in bulk (median splits on the widest
+    dimension, leaves of at most leaf_size points stored contiguously).
+    A query ranks the leaves by the distance to their bounding boxes and
+    stops as soon as the next box is farther than the k-th neighbour found,
+    so it only touches the few leaves near the point instead of the whole
+    table. Small tables are simply scanned.
+
+    insert() appends to a small side buffer that is scanned brute force;
+    once it outgrows rebuild_ratio of the tree a new tree is built from a
+    snapshot on a background thread and swapped in, so neither the
+    inserting request nor concurrent queries wait for the build. Changes
+    made during the build stay in the side buffer or are replayed as
+    removals. Re-inserting an id replaces its old point.
+    """
+
+    def __init__(self, leaf_size=256, rebuild_ratio=0.1, min_rebuild=1000):
+        self.leaf_size = leaf_size
+        self.rebuild_ratio = rebuild_ratio
+        self.min_rebuild = min_rebuild
+        self._lock = threading.RLock()
+        self._rebuild_thread = None
+        # Bumped by build(), so a background rebuild started before it is dropped
+        self._generation = 0
+        # Ids removed (or replaced) while a background rebuild runs
+        self._removed_during_rebuild = set()
+        self._reset(0)
+
+    def _reset(self, n_features):
+        self._mean = np.zeros(n_features)
+        self._std = np.ones(n_features)
+        # Tree points in leaf order, with their raw rows and ids
+        self._points = np.empty((0, n_features))
+        self._raw = np.empty((0, n_features))
+        self._ids = np.empty(0, dtype=object)
+        self._alive = np.empty(0, dtype=bool)
+        # Node tables: bounding box, point range, children (-1 for leaves)
+        self._lo = self._hi = np.empty((0, n_features))
+        self._start = self._end = self._left = self._right = np.empty(0, dtype=np.intp)
+        self._leaves = np.empty(0, dtype=np.intp)
+        self._leaf_lo = self._leaf_hi = self._lo
+        # Inserted since the last build
+        self._extra_raw, self._extra_ids, self._extra_alive = [], [], []
+        # id -> ("tree" | "extra", position)
+        self._where = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._where)
+
+    @staticmethod
+    def _stats(X):
+        mean = np.nanmean(X, axis=0)
+        std = np.nanstd(X, axis=0)
+        mean[np.isnan(mean)] = 0.0
+        std[~(std > 0)] = 1.0
+        return mean, std
+
+    @staticmethod
+    def _standardize(X, mean, std):
+        Z = (X - mean) / std
+        # Missing values sit at the column mean
+        Z[np.isnan(Z)] = 0.0
+        return Z
+
+    def _compute(self, X, ids):
+        """Tree state for raw rows X and their ids; touches no shared state"""
+        n_features = X.shape[1]
+        state = {"_mean": np.zeros(n_features), "_std": np.ones(n_features)}
+        if len(X) == 0:
+            return state
+        # Later duplicates win, same as calling insert() in order
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - last)
+        X, ids = X[keep], ids[keep]
+
+        mean, std = self._stats(X)
+        Z = self._standardize(X, mean, std)
+
+        order = np.arange(len(Z))
+        lo, hi, start, end, left, right = [], [], [], [], [], []
+
+        def add_node(begin, finish):
+            node = len(start)
+            block = Z[order[begin:finish]]
+            lo.append(block.min(axis=0))
+            hi.append(block.max(axis=0))
+            start.append(begin)
+            end.append(finish)
+            left.append(-1)
+            right.append(-1)
+            if finish - begin > self.leaf_size:
+                dim = int(np.argmax(hi[node] - lo[node]))
+                mid = (begin + finish) // 2
+                part = np.argpartition(block[:, dim], mid - begin)
+                order[begin:finish] = order[begin:finish][part]
+                left[node] = add_node(begin, mid)
+                right[node] = add_node(mid, finish)
+            return node
+
+        add_node(0, len(Z))
+        lo, hi, left = np.array(lo), np.array(hi), np.array(left)
+        leaves = np.flatnonzero(left < 0)
+        state.update(
+            _mean=mean, _std=std,
+            _points=Z[order], _raw=X[order], _ids=ids[order], _alive=np.ones(len(order), dtype=bool),
+            _lo=lo, _hi=hi, _start=np.array(start), _end=np.array(end), _left=left, _right=np.array(right),
+            _leaves=leaves, _leaf_lo=lo[leaves], _leaf_hi=hi[leaves],
+        )
+        return state
+
+    def build(self, X, ids):
+        """Bulk-load raw feature rows (n, d) with one id per row"""
+        X = np.asarray(X, dtype=np.float64)
+        ids = np.asarray(ids, dtype=object)
+        state = self._compute(X, ids)
+        with self._lock:
+            self._generation += 1
+            self._reset(X.shape[1])
+            self.__dict__.update(state)
+            self._where = {member_id: ("tree", i) for i, member_id in enumerate(self._ids.tolist())}
+        return self
+
+    def remove(self, member_id):
+        with self._lock:
+            where = self._where.pop(member_id, None)
+            if where is None:
+                return False
+            if self._rebuild_thread is not None:
+                self._removed_during_rebuild.add(member_id)
+            kind, i = where
+            if kind == "tree":
+                self._alive[i] = False
+            else:
+                self._extra_alive[i] = False
+            return True
+
+    def insert(self, member_id, x):
+        """Add (or replace) one member's raw feature row"""
+        x = np.asarray(x, dtype=np.float64)
+        with self._lock:
+            if len(self._points) == 0 and not self._extra_raw:
+                self._reset(len(x))
+            self.remove(member_id)
+            self._where[member_id] = ("extra", len(self._extra_ids))
+            self._extra_raw.append(x)
+            self._extra_ids.append(member_id)
+            self._extra_alive.append(True)
+            if (self._rebuild_thread is None
+                    and len(self._extra_ids) > max(self.min_rebuild, self.rebuild_ratio * len(self._points))):
+                self._start_rebuild()
+
+    def _start_rebuild(self):
+        """Snapshot the live points and rebuild from them on a thread; call holding _lock"""
+        n_features = len(self._mean)
+        extra_alive = np.array(self._extra_alive, dtype=bool)
+        raw = np.concatenate([
+            self._raw[self._alive], np.array(self._extra_raw).reshape(-1, n_features)[extra_alive]
+        ])
+        ids = np.concatenate([
+            self._ids[self._alive], np.array(self._extra_ids, dtype=object)[extra_alive]
+        ])
+        snapshot = (self._generation, len(self._extra_ids))
+        self._removed_during_rebuild = set()
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild, args=(raw, ids, snapshot), name="neighbors-rebuild", daemon=True
+        )
+        self._rebuild_thread.start()
+
+    def _rebuild(self, raw, ids, snapshot):
+        generation, n_extra = snapshot
+        try:
+            state = self._compute(raw, ids)
+        except Exception as e:
+            print(f"❌ Similar-user index rebuild failed: {e}")
+            with self._lock:
+                self._rebuild_thread = None
+            return
+
+        with self._lock:
+            self._rebuild_thread = None
+            if generation != self._generation:
+                return
+            removed, self._removed_during_rebuild = self._removed_during_rebuild, set()
+            # Inserts made during the build stay in the side buffer
+            extra_raw, extra_ids = self._extra_raw[n_extra:], self._extra_ids[n_extra:]
+            extra_alive = self._extra_alive[n_extra:]
+            self.__dict__.update(state)
+            self._extra_raw, self._extra_ids, self._extra_alive = extra_raw, extra_ids, extra_alive
+            self._where = {}
+            for i, member_id in enumerate(self._ids.tolist()):
+                if member_id in removed:
+                    self._alive[i] = False
+                else:
+                    self._where[member_id] = ("tree", i)
+            for i, (member_id, alive) in enumerate(zip(extra_ids, extra_alive)):
+                if alive:
+                    self._where[member_id] = ("extra", i)
+
+    def wait_for_rebuild(self, timeout=None):
+        """Block until a background rebuild in progress (if any) is swapped in"""
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def query(self, x, k=10):
+        """
+        The k members closest to the raw feature row x.
+
+        Returns (ids, distances, raw_rows) sorted by distance; distances are
+        Euclidean in standardized units.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        with self._lock:
+            extra = np.array(self._extra_raw).reshape(-1, len(self._mean))
+            # Until the first build, scale by whatever has been inserted
+            mean, std = (self._mean, self._std) if len(self._points) else self._stats(extra)
+            z = self._standardize(x[None, :], mean, std)[0]
+            best_d = np.full(k, np.inf)
+            best_i = np.full(k, -1, dtype=np.intp)
+
+            def merge(dist, positions):
+                nonlocal best_d, best_i
+                all_d = np.concatenate([best_d, dist])
+                all_i = np.concatenate([best_i, positions])
+                top = np.argpartition(all_d, k - 1)[:k] if len(all_d) > k else np.arange(len(all_d))
+                best_d, best_i = all_d[top], all_i[top]
+
+            # Visit leaves nearest-box first, a few at a time, until the
+            # next box is farther than the current k-th neighbour
+            if 0 < len(self._points) <= _BRUTE_FORCE_ROWS:
+                dist = np.sum((self._points - z) ** 2, axis=1)
+                dist[~self._alive] = np.inf
+                merge(dist, np.arange(len(dist)))
+            elif len(self._leaves):
+                gap = np.maximum(self._leaf_lo - z, 0.0) + np.maximum(z - self._leaf_hi, 0.0)
+                box_d = np.einsum("ij,ij->i", gap, gap)
+                order = np.argsort(box_d)
+                for b in range(0, len(order), _LEAVES_PER_STEP):
+                    if box_d[order[b]] >= best_d.max():
+                        break
+                    leaves = self._leaves[order[b:b + _LEAVES_PER_STEP]]
+                    positions = np.concatenate([
+                        np.arange(self._start[leaf], self._end[leaf]) for leaf in leaves.tolist()
+                    ])
+                    dist = np.sum((self._points[positions] - z) ** 2, axis=1)
+                    dist[~self._alive[positions]] = np.inf
+                    merge(dist, positions)
+
+            # Recent inserts, scanned brute force (positions offset past the tree)
+            if len(extra):
+                dist = np.sum((self._standardize(extra, mean, std) - z) ** 2, axis=1)
+                dist[~np.array(self._extra_alive)] = np.inf
+                merge(dist, np.arange(len(extra)) + len(self._points))
+
+            found = np.isfinite(best_d)
+            order = np.argsort(best_d[found])
+            positions = best_i[found][order]
+            distances = np.sqrt(best_d[found][order])
+
+            n_tree = len(self._points)
+            ids, rows = [], []
+            for pos in positions.tolist():
+                if pos < n_tree:
+                    ids.append(self._ids[pos])
+                    rows.append(self._raw[pos])
+                else:
+                    ids.append(self._extra_ids[pos - n_tree])
+                    rows.append(self._extra_raw[pos - n_tree])
+            rows = np.array(rows).reshape(len(ids), len(self._mean))
+            return ids, distances, rows
@@ -0,0 +1,276 @@
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+# LightGBM treats |x| <= kZeroThreshold as zero for missing_type "Zero"
+ZERO_THRESHOLD = 1e-35
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+# Leaves are tracked as bits of a uint64
+_MAX_LEAVES = 64
+_ALL_LEAVES = (1 << _MAX_LEAVES) - 1
+
+# Splits x rows cells evaluated at once by TreeEnsemble.raw_score
+_CHUNK_CELLS = 1 << 20
+
+# Arrays stored in the .npz, all one entry per node unless noted
+_ARRAY_FIELDS = (
+    "feature", "threshold", "left", "right", "value",
+    "missing_type", "default_left", "right_mask",
+    "roots", "tree_class",      # one entry per tree
+    "classes",                  # one entry per class label
+)
+
+
+def compile_booster(booster, classes):
+    """
+    Flatten a LightGBM booster into array-based tree tables.
+
+    Every node (split or leaf) is one row, written in pre-order so each
+    tree is a contiguous block starting at its root and its leaves appear
+    left to right. Leaves point to themselves in left/right.
+
+    right_mask is the QuickScorer bitmask of a split: the tree's leaves
+    with the ones in its left subtree cleared. ANDing the masks of every
+    split a row goes right at leaves the row's exit leaf as the lowest set
+    bit, so scoring needs no per-level traversal.
+    """
+    dump = booster.dump_model()
+    num_class = dump["num_tree_per_iteration"]
+
+    feature, threshold, left, right, value = [], [], [], [], []
+    missing_type, default_left, right_mask = [], [], []
+    roots, tree_class = [], []
+    leaf_count = 0
+
+    def add_node(node):
+        nonlocal leaf_count
+        idx = len(feature)
+        feature.append(0)
+        threshold.append(0.0)
+        left.append(idx)
+        right.append(idx)
+        value.append(0.0)
+        missing_type.append(MISSING_NONE)
+        default_left.append(False)
+        right_mask.append(_ALL_LEAVES)
+
+        if "leaf_value" in node:
+            value[idx] = node["leaf_value"]
+            leaf_count += 1
+            return idx
+
+        if node["decision_type"] != "<=":
+            raise ValueError(f"Unsupported split type: {node['decision_type']}")
+        feature[idx] = node["split_feature"]
+        threshold[idx] = node["threshold"]
+        missing_type[idx] = _MISSING_TYPES[node["missing_type"]]
+        default_left[idx] = node["default_left"]
+        first_leaf = leaf_count
+        left[idx] = add_node(node["left_child"])
+        n_left = leaf_count - first_leaf
+        right_mask[idx] = _ALL_LEAVES & ~(((1 << n_left) - 1) << first_leaf)
+        right[idx] = add_node(node["right_child"])
+        return idx
+
+    for i, tree in enumerate(dump["tree_info"]):
+        if tree["num_leaves"] > _MAX_LEAVES:
+            raise ValueError(f"Tree {i} has {tree['num_leaves']} leaves, max is {_MAX_LEAVES}")
+        leaf_count = 0
+        roots.append(add_node(tree["tree_structure"]))
+        tree_class.append(i % num_class)
+
+    objective = dump["objective"].split()
+    sigmoid = 1.0
+    for param in objective[1:]:
+        if param.startswith("sigmoid:"):
+            sigmoid = float(param.split(":", 1)[1])
+
+    meta = {
+        "objective": objective[0],
+        "num_class": num_class,
+        "sigmoid": sigmoid,
+        "average_output": bool(dump.get("average_output", False)),
+        "feature_names": dump["feature_names"],
+    }
+    arrays = {
+        "feature": np.array(feature, dtype=np.int32),
+        "threshold": np.array(threshold, dtype=np.float64),
+        "left": np.array(left, dtype=np.int32),
+        "right": np.array(right, dtype=np.int32),
+        "value": np.array(value, dtype=np.float64),
+        "missing_type": np.array(missing_type, dtype=np.int8),
+        "default_left": np.array(default_left, dtype=np.bool_),
+        "right_mask": np.array(right_mask, dtype=np.uint64),
+        "roots": np.array(roots, dtype=np.int32),
+        "tree_class": np.array(tree_class, dtype=np.int32),
+        "classes": np.asarray(classes),
+    }
+    return TreeEnsemble(arrays, meta)
+
+
+def _memmap_npz(path):
+    """
+    Memory-map every array of an uncompressed .npz.
+
+    np.load ignores mmap_mode for .npz archives, but members written by
+    np.savez are stored uncompressed, so each one is just a .npy file at
+    a fixed offset inside the zip and can be mapped in place.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} member {info.filename} is compressed, can't mmap")
+            # Local file header: 30 fixed bytes, then the name and extra field
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_len, extra_len = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if dtype.hasobject:
+                raise ValueError(f"{path} member {name} holds Python objects, can't mmap")
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                order="F" if fortran_order else "C"
+            )
+    return arrays
+
+
+def save_ensemble(path, ensemble):
+    """Write the tree tables as an uncompressed (mmap-able) .npz"""
+    np.savez(
+        path,
+        meta=np.frombuffer(json.dumps(ensemble.meta).encode(), dtype=np.uint8),
+        **{name: ensemble.arrays[name] for name in _ARRAY_FIELDS},
+    )
+
+
+def load_ensemble(path, mmap=True):
+    """Load a compiled .npz; with mmap the pages are shared across workers"""
+    if mmap:
+        arrays = _memmap_npz(path)
+    else:
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+    meta = json.loads(bytes(arrays.pop("meta")).decode())
+    return TreeEnsemble(arrays, meta)
+
+
+class TreeEnsemble:
+    """
+    Pure-NumPy evaluator for a compiled LightGBM classifier.
+
+    Mirrors LGBMClassifier.predict / predict_proba: same split rules
+    (including missing value handling), leaf outputs accumulated in tree
+    order, then the same sigmoid/softmax before the argmax.
+    """
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.missing_type = arrays["missing_type"]
+        self.default_left = arrays["default_left"]
+        self.right_mask = arrays["right_mask"]
+        self.roots = arrays["roots"]
+        self.tree_class = arrays["tree_class"]
+        self.classes_ = arrays["classes"]
+
+        self.num_class = meta["num_class"]
+        self.feature_name_ = meta["feature_names"]
+        self.n_features_in_ = len(self.feature_name_)
+        # Models without Zero/NaN missing rules only need NaN -> 0.0
+        self._simple_missing = not np.any(self.missing_type)
+
+        # Evaluation only needs the split nodes; leaves are found through
+        # the masks, in pre-order, starting at each tree's _leaf_start
+        is_leaf = self.left == np.arange(len(self.left))
+        splits = np.flatnonzero(~is_leaf)
+        self._split_feature = self.feature[splits].astype(np.intp)
+        self._split_threshold = self.threshold[splits][:, None]
+        self._split_missing = self.missing_type[splits][:, None]
+        self._split_default_left = self.default_left[splits][:, None]
+        self._split_mask = self.right_mask[splits][:, None]
+        # Single-leaf trees have no splits and always exit at leaf 0
+        self._has_split = ~is_leaf[self.roots]
+        self._split_start = np.searchsorted(splits, self.roots[self._has_split])
+        leaves_before = np.concatenate([[0], np.cumsum(is_leaf)])
+        self._leaf_start = leaves_before[self.roots][:, None]
+        self._leaf_value = self.value[is_leaf]
+        # Tree positions per class, in iteration order
+        self._class_trees = [np.flatnonzero(self.tree_class == k) for k in range(self.num_class)]
+
+    def _goes_right(self, X):
+        """Outcome of every split for every row, shape (n_splits, n_rows)"""
+        if self._simple_missing:
+            # Missing type None everywhere: NaN is just 0.0
+            X = np.where(np.isnan(X), 0.0, X)
+            return np.take(X.T, self._split_feature, axis=0) > self._split_threshold
+        x = np.take(X.T, self._split_feature, axis=0)
+        is_nan = np.isnan(x)
+        missing = self._split_missing
+        x = np.where(is_nan & (missing != MISSING_NAN), 0.0, x)
+        use_default = (
+            ((missing == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD))
+            | ((missing == MISSING_NAN) & is_nan)
+        )
+        return ~np.where(use_default, self._split_default_left, x <= self._split_threshold)
+
+    def leaf_values(self, X):
+        """Output of the leaf each row reaches in every tree, shape (n_trees, n_rows)"""
+        all_leaves = np.uint64(_ALL_LEAVES)
+        masks = np.where(self._goes_right(X), self._split_mask, all_leaves)
+        tree_masks = np.full((len(self.roots), X.shape[0]), all_leaves)
+        if len(self._split_start):
+            tree_masks[self._has_split] = np.bitwise_and.reduceat(masks, self._split_start, axis=0)
+        # The exit leaf is the lowest surviving bit
+        lowest = tree_masks & (~tree_masks + np.uint64(1))
+        leaf_rank = np.log2(lowest).astype(np.intp)
+        return self._leaf_value[self._leaf_start + leaf_rank]
+
+    def raw_score(self, X):
+        """Summed leaf outputs, shape (n_rows, num_class)"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got {X.shape[1]}")
+        # Keep the (splits x rows) working set small enough to stay in cache
+        chunk = max(1, _CHUNK_CELLS // max(1, len(self._split_feature)))
+        if X.shape[0] > chunk:
+            return np.concatenate([self.raw_score(X[i:i + chunk]) for i in range(0, X.shape[0], chunk)])
+
+        leaf_values = self.leaf_values(X)
+        scores = np.empty((X.shape[0], self.num_class), dtype=np.float64)
+        for k, trees in enumerate(self._class_trees):
+            # cumsum adds strictly in tree order, like LightGBM does
+            scores[:, k] = np.cumsum(leaf_values[trees], axis=0)[-1] if len(trees) else 0.0
+            if self.meta["average_output"] and len(trees):
+                scores[:, k] /= len(trees)
+        return scores
+
+    def predict_proba(self, X):
+        scores = self.raw_score(X)
+        if self.num_class == 1:
+            p = 1.0 / (1.0 + np.exp(-self.meta["sigmoid"] * scores[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
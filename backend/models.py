@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, date
+from utils.replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -24,17 +25,47 @@ class User(db.Model):
             data["profile"] = self.profile.to_dict()
         return data
 
+class RevokedToken(db.Model):
+    """Logged-out tokens (by SHA-256), kept until they would have expired"""
+    token_hash = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class UserProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
     age = db.Column(db.Integer)
     weight = db.Column(db.Float)
     height = db.Column(db.Float)
     fitness_level = db.Column(db.String(50))
-    goals = db.Column(db.ARRAY(db.String))
+    # Arrays are JSON lists on SQLite (local and load-test databases)
+    goals = db.Column(db.ARRAY(db.String).with_variant(db.JSON, "sqlite"))
     bmi = db.Column(db.Float)
     city = db.Column(db.String(128))
     group_id = db.Column(db.Integer, db.ForeignKey("group.id"))
+    join_date = db.Column(db.Date, default=date.today)
+
+    # Lifestyle stats fed to the ML recommendations
+    avg_calories_consumed = db.Column(db.Float)
+    avg_calories_burned = db.Column(db.Float)
+    protein_g = db.Column(db.Float)
+    carbs_g = db.Column(db.Float)
+    fat_g = db.Column(db.Float)
+    avg_steps = db.Column(db.Float)
+    avg_heart_rate = db.Column(db.Float)
+    avg_sleep_duration = db.Column(db.Float)
+    avg_workout_duration = db.Column(db.Float)
+    avg_workout_intensity = db.Column(db.Float)
+
+    # Cohort predicted by the ML models
+    fitness_category = db.Column(db.String(32))
+    fitness_goal = db.Column(db.String(32))
+
+    __table_args__ = (
+        db.Index("ix_user_profile_cohort", "fitness_category", "fitness_goal"),
+        # /api/users filters, paged by user id
+        db.Index("ix_user_profile_city", "city", "user_id"),
+        db.Index("ix_user_profile_fitness_level", "fitness_level", "user_id"),
+    )
 
     def to_dict(self):
         return {
@@ -47,10 +78,49 @@ class UserProfile(db.Model):
             "city": self.city
         }
 
+class FitnessRecommendation(db.Model):
+    """Last ML recommendation computed for a user (see score_users.py)"""
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    category = db.Column(db.String(32))
+    goal = db.Column(db.String(32))
+    payload = db.Column(db.JSON, nullable=False)
+    model_version = db.Column(db.String(64), index=True)
+    # Hash of the profile features it was computed from
+    features_key = db.Column(db.String(40))
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        data = dict(self.payload)
+        data["modelVersion"] = self.model_version
+        data["computedAt"] = self.computed_at.isoformat()
+        return data
+
+class LeaderboardEntry(db.Model):
+    """Materialized leaderboard points per user (see utils/leaderboard.py)"""
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    points = db.Column(db.Integer, nullable=False)
+
+    user = db.relationship("User")
+
+# Matches the leaderboard order: most points first, ties by user id
+db.Index("ix_leaderboard_rank", LeaderboardEntry.points.desc(), LeaderboardEntry.user_id)
+
+class LeaderboardBucket(db.Model):
+    """How many users have each points value; a user's rank is one plus the members above it"""
+    points = db.Column(db.Integer, primary_key=True)
+    members = db.Column(db.Integer, nullable=False, default=0)
+
+class CommunityCounter(db.Model):
+    """Running row counts behind /api/community/stats (see utils/counters.py)"""
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128))
     description = db.Column(db.String(256))
+    # Normalized city this group is the home of (utils/groups.py), if any
+    city_key = db.Column(db.String(128), unique=True, index=True)
     members = db.relationship("UserProfile", backref="group")
 
     def to_dict(self):
@@ -61,7 +131,8 @@ class CommunityEvent(db.Model):
     title = db.Column(db.String(128))
     details = db.Column(db.String(256))
     location = db.Column(db.String(128))
-    attendees = db.Column(db.ARRAY(db.Integer))
+    # Rows in EventAttendance, kept in step by utils/events.py
+    attendee_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def to_dict(self):
         return {
@@ -69,9 +140,15 @@ class CommunityEvent(db.Model):
             "title": self.title,
             "details": self.details,
             "location": self.location,
-            "attendees": self.attendees or []
+            "attendeeCount": self.attendee_count or 0
         }
 
+class EventAttendance(db.Model):
+    """One row per RSVP; the primary key pages an event's attendees by user id"""
+    event_id = db.Column(db.Integer, db.ForeignKey("community_event.id", ondelete="CASCADE"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey("group.id"))
@@ -80,6 +157,11 @@ class ChatMessage(db.Model):
     message = db.Column(db.String(500))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Chat history pages: one group, in (timestamp, id) order
+        db.Index("ix_chat_message_group_time", "group_id", "timestamp", "id"),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -1,25 +1,27 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, g, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import db, User
 import jwt
+import uuid
 from datetime import datetime, timedelta
 from config import Config
+from utils.auth import login_required, token_cache
 
 auth_bp = Blueprint("auth", __name__)
 
 def generate_token(user_id):
     payload = {
         "user_id": user_id,
+        # Unique per token, so revoking one login doesn't revoke another
+        "jti": uuid.uuid4().hex,
         "exp": datetime.utcnow() + timedelta(hours=24)
     }
     return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm="HS256")
 
 def decode_token(token):
-    try:
-        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=["HS256"])
-        return payload["user_id"]
-    except:
-        return None
+    # Verified once, then served from the token cache
+    identity = token_cache.identity(token)
+    return identity.user_id if identity else None
 
 @auth_bp.route("/register", methods=["POST"])
 def register():
@@ -55,5 +57,12 @@ def login():
 
 @auth_bp.route("/logout", methods=["POST"])
 def logout():
-    # For JWT, logout is client-side: just discard the token
+    # The client discards the token; a presented one is also revoked
+    if g.get("token"):
+        token_cache.revoke(g.token)
     return jsonify({"message": "Logout successful"}), 200
+
+@auth_bp.route("/me", methods=["GET"])
+@login_required
+def me():
+    return jsonify({"id": g.identity.user_id, "username": g.identity.username}), 200
@@ -1,45 +1,105 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
 from models import db, User, UserProfile, Group, CommunityEvent, ChatMessage, Challenge
+from utils import leaderboard as leaderboard_store
+from utils.helpers import decode_cursor, encode_cursor
+from utils.chat_stream import broker
+from utils.chat_writer import MAX_MESSAGE_LENGTH, chat_writer
+from utils.counters import read_counters
+from utils.events import attendees, set_attendance
+from utils.auth import login_required
+from utils.response_cache import response_cache
+from utils.json_stream import CHAT_MESSAGE_JSON, stream_json_array, stream_rows, wants_stream
+from datetime import datetime
+from sqlalchemy import select, tuple_
 
 community_bp = Blueprint("community", __name__)
 
+MAX_MESSAGES_PAGE = 200
+MAX_ATTENDEES_PAGE = 500
+
+# Messages replayed per query when a stream resumes from Last-Event-ID
+STREAM_REPLAY_CHUNK = 500
+
 @community_bp.route("/community/stats", methods=["GET"])
 def stats():
-    total_members = User.query.count()
-    total_groups = Group.query.count()
-    upcoming_events = CommunityEvent.query.count()
+    # Maintained counters, see utils/counters.py
+    counters = read_counters()
     return jsonify({
-        "totalMembers": total_members,
-        "totalGroups": total_groups,
-        "upcomingEvents": upcoming_events
+        "totalMembers": counters["users"],
+        "totalGroups": counters["groups"],
+        "upcomingEvents": counters["events"]
     })
 
 @community_bp.route("/community/events", methods=["GET"])
+@response_cache.cached(CommunityEvent)
 def get_events():
     events = CommunityEvent.query.all()
     return jsonify([e.to_dict() for e in events]), 200
 
+@community_bp.route("/community/events/<int:event_id>/rsvp", methods=["POST", "DELETE"])
+@login_required
+def rsvp(event_id):
+    """POST to attend an event, DELETE to cancel; both are idempotent"""
+    attending = request.method == "POST"
+    count = set_attendance(event_id, g.identity.user_id, attending)
+    if count is None:
+        return jsonify({"error": "Event not found"}), 404
+    # The counts in /community/events changed outside the ORM's view
+    response_cache.invalidate(CommunityEvent.__tablename__)
+    return jsonify({"eventId": event_id, "attending": attending, "attendeeCount": count}), 200
+
+@community_bp.route("/community/events/<int:event_id>/attendees", methods=["GET"])
+def event_attendees(event_id):
+    # ?limit=&cursor=; the next page's cursor is in X-Next-Cursor
+    limit = min(max(request.args.get("limit", 50, type=int), 1), MAX_ATTENDEES_PAGE)
+    if db.session.get(CommunityEvent, event_id) is None:
+        return jsonify({"error": "Event not found"}), 404
+    try:
+        page, next_cursor = attendees(event_id, limit, request.args.get("cursor"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid cursor"}), 400
+    response = jsonify(page)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
 @community_bp.route("/community/groups", methods=["GET"])
+@response_cache.cached(Group)
 def get_groups():
     groups = Group.query.all()
     return jsonify([g.to_dict() for g in groups]), 200
 
 @community_bp.route("/leaderboard", methods=["GET"])
 def leaderboard():
-    users = User.query.all()
-    leaderboard = []
-    for u in users:
-        pts = 10
-        if u.profile:
-            if u.profile.age:
-                pts += max(0, 100 - u.profile.age)
-            if u.profile.bmi:
-                pts += max(0, int(100 - u.profile.bmi))
-        leaderboard.append({"user": u.to_dict(include_profile=True), "points": int(pts)})
-    leaderboard.sort(key=lambda x: x["points"], reverse=True)
-    return jsonify(leaderboard), 200
+    # ?limit=&offset= or ?limit=&cursor=; the next page's cursor is in X-Next-Cursor
+    # ?stream=1 streams every entry from the top (or after ?cursor=)
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    offset = request.args.get("offset", 0, type=int)
+    cursor = request.args.get("cursor")
+    try:
+        if wants_stream():
+            return stream_json_array(leaderboard_store.stream(cursor))
+        entries, next_cursor = leaderboard_store.top(max(limit, 1), max(offset, 0), cursor)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid cursor"}), 400
+    response = jsonify(entries)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
+@community_bp.route("/leaderboard/users/<int:user_id>", methods=["GET"])
+def leaderboard_around(user_id):
+    """The user's rank plus the entries just above and below"""
+    radius = min(max(request.args.get("radius", 5, type=int), 0), 50)
+    result = leaderboard_store.around(user_id, radius)
+    if result is None:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify(result), 200
 
 @community_bp.route("/challenges", methods=["GET"])
+@response_cache.cached(Challenge)
 def get_challenges():
     challenges = Challenge.query.all()
     return jsonify([c.to_dict() for c in challenges]), 200
@@ -49,10 +109,59 @@ def reports():
     # Mock example for weekly/monthly progress
     return jsonify({"weekly": {"steps": 50000}, "monthly": {"steps": 200000}}), 200
 
+def _message_position(cursor):
+    timestamp, message_id = decode_cursor(cursor)
+    return datetime.fromisoformat(timestamp), int(message_id)
+
+def _position_cursor(position):
+    timestamp, message_id = position
+    return encode_cursor(timestamp.isoformat(), message_id)
+
+def _message_cursor(msg):
+    return _position_cursor((msg.timestamp, msg.id))
+
+def _event_position(event):
+    return datetime.fromisoformat(event["timestamp"]), event["id"]
+
 @community_bp.route("/chat/<int:group_id>/messages", methods=["GET"])
 def get_messages(group_id):
-    msgs = ChatMessage.query.filter_by(group_id=group_id).all()
-    return jsonify([m.to_dict() for m in msgs]), 200
+    """
+    One page of a group's messages (all of them with ?stream=1).
+
+    By default (or with ?before=) the newest messages come first, going
+    back in time; with ?after= only messages newer than the cursor are
+    returned, oldest first, for incremental sync. X-Before-Cursor and
+    X-After-Cursor hold the cursors for older and newer messages.
+    """
+    limit = min(max(request.args.get("limit", 50, type=int), 1), MAX_MESSAGES_PAGE)
+    position = tuple_(ChatMessage.timestamp, ChatMessage.id)
+    query = select(ChatMessage).where(ChatMessage.group_id == group_id)
+    try:
+        if request.args.get("after"):
+            after = _message_position(request.args["after"])
+            query = query.where(position > after).order_by(ChatMessage.timestamp, ChatMessage.id)
+        else:
+            if request.args.get("before"):
+                query = query.where(position < _message_position(request.args["before"]))
+            query = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    if wants_stream():
+        # Every message in that direction, streamed, without cursor headers
+        rows = stream_rows(query.with_only_columns(*CHAT_MESSAGE_JSON.columns))
+        return stream_json_array(CHAT_MESSAGE_JSON.encode(row) for row in rows)
+
+    msgs = db.session.execute(query.limit(limit)).scalars().all()
+    response = jsonify([m.to_dict() for m in msgs])
+    if msgs:
+        oldest, newest = (msgs[0], msgs[-1]) if request.args.get("after") else (msgs[-1], msgs[0])
+        response.headers["X-Before-Cursor"] = _message_cursor(oldest)
+        response.headers["X-After-Cursor"] = _message_cursor(newest)
+    elif request.args.get("after"):
+        # Nothing new yet: keep polling from the same place
+        response.headers["X-After-Cursor"] = request.args["after"]
+    return response, 200
 
 @community_bp.route("/chat/<int:group_id>/messages", methods=["POST"])
 def post_message(group_id):
@@ -61,10 +170,111 @@ def post_message(group_id):
     message = data.get("message")
     if not user_id or not message:
         return jsonify({"error": "Missing fields"}), 400
+    if chat_writer.enabled:
+        # Group commit: no per-message transaction, see utils/chat_writer.py
+        username = chat_writer.username(user_id)
+        if username is None:
+            return jsonify({"error": "User not found"}), 404
+        try:
+            return jsonify(chat_writer.post(group_id, user_id, username, message)), 201
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": f"Could not save message: {e}"}), 500
+
+    if len(message) > MAX_MESSAGE_LENGTH:
+        return jsonify({"error": f"Message longer than {MAX_MESSAGE_LENGTH} characters"}), 400
+    if db.session.get(Group, group_id) is None:
+        return jsonify({"error": "Group not found"}), 404
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     msg = ChatMessage(group_id=group_id, user_id=user.id, username=user.username, message=message)
     db.session.add(msg)
     db.session.commit()
+    broker.publish(group_id, msg.to_dict())
     return jsonify(msg.to_dict()), 201
+
+def _sse(event_type, data, event_id=None):
+    lines = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{lines}event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+@community_bp.route("/chat/<int:group_id>/stream", methods=["GET"])
+def stream_messages(group_id):
+    """
+    Server-sent events for a group: one "message" event per new message.
+    Event ids are (timestamp, id) cursors, as in the message pages, of the
+    furthest message sent so far: message ids from different processes
+    interleave, so they can't be used to resume. Reconnecting with
+    Last-Event-ID (or ?last_event_id=) first replays what was missed from
+    the database. Comment lines are sent as heartbeats while the group is
+    quiet.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        if not last_event_id:
+            position = None
+        elif last_event_id.isdigit():
+            # A bare message id, from before ids were cursors
+            msg = db.session.get(ChatMessage, int(last_event_id))
+            position = (msg.timestamp, msg.id) if msg else None
+        else:
+            position = _message_position(last_event_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+    heartbeat = current_app.config["CHAT_STREAM_HEARTBEAT_SECONDS"]
+
+    def events():
+        # Subscribed once the client is reading (a client gone before then
+        # leaves nothing behind), and before replaying, so nothing posted
+        # in between is lost
+        subscription = broker.subscribe(group_id)
+        sent = position
+        # Messages both replayed and still queued in the subscription. Live
+        # events are only skipped if replayed: concurrent posts can publish
+        # out of (timestamp, id) order, and none of them may be dropped.
+        replayed = set()
+        try:
+            yield "retry: 3000\n\n"
+            while sent is not None:
+                missed = (
+                    ChatMessage.query.filter(ChatMessage.group_id == group_id,
+                                             tuple_(ChatMessage.timestamp, ChatMessage.id) > sent)
+                    .order_by(ChatMessage.timestamp, ChatMessage.id).limit(STREAM_REPLAY_CHUNK).all()
+                )
+                for msg in missed:
+                    sent = (msg.timestamp, msg.id)
+                    replayed.add(msg.id)
+                    yield _sse("message", msg.to_dict(), _message_cursor(msg))
+                if len(missed) < STREAM_REPLAY_CHUNK:
+                    break
+            # Don't hold a pooled connection while idle
+            db.session.close()
+
+            while True:
+                event = subscription.get(timeout=heartbeat)
+                if subscription.evicted:
+                    # Too far behind: the client reconnects and replays
+                    yield _sse("evicted", {"lastEventId": sent and _position_cursor(sent)})
+                    return
+                if event is None:
+                    # Quiet for a while: whatever the replay overlapped has been delivered
+                    replayed.clear()
+                    yield ": heartbeat\n\n"
+                elif event["id"] in replayed:
+                    replayed.discard(event["id"])
+                else:
+                    event_position = _event_position(event)
+                    if sent is None or event_position > sent:
+                        sent = event_position
+                    yield _sse("message", event, _position_cursor(sent))
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,9 +1,27 @@
-from flask import Blueprint, request, jsonify
-from models import db, User, UserProfile, Group
-from utils.helpers import calculate_bmi
+from flask import Blueprint, request, jsonify, current_app
+from models import db, User, UserProfile, Group, FitnessRecommendation
+from utils.helpers import calculate_bmi, decode_cursor, encode_cursor
+from utils.groups import group_for_city
+from utils.fitness import (
+    LIFESTYLE_FIELDS, assign_cohort, features_key, is_stale, profile_features,
+    store_recommendations, ml_service,
+)
+from utils.auth import login_required, operator_required
+from utils.user_import import import_users
+from utils.json_stream import (
+    USER_WITH_PROFILE_COLUMNS, distinct_users, encode_user_with_profile, stream_json_array, stream_rows,
+    wants_stream,
+)
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager
+import io
+import threading
 
 profile_bp = Blueprint("profile", __name__)
 
+MAX_USERS_PAGE = 200
+
 @profile_bp.route("/users/<int:user_id>/profile", methods=["PUT"])
 def update_profile(user_id):
     data = request.json or {}
@@ -19,14 +37,19 @@ def update_profile(user_id):
     profile.goals = data.get("goals", [])
     profile.city = data.get("city")
     profile.bmi = calculate_bmi(profile.weight, profile.height)
+    for field in LIFESTYLE_FIELDS:
+        setattr(profile, field, data.get(field))
+    profile.join_date = profile.join_date or date.today()
+
+    # Place the user in an ML cohort; a scoring failure shouldn't block the save
+    try:
+        assign_cohort(profile)
+    except Exception as e:
+        print(f"❌ Could not assign cohort for user {user.id}: {e}")
 
     # Assign group based on city
-    if profile.city:
-        group = Group.query.filter(Group.name.ilike(f"%{profile.city}%")).first()
-        if not group:
-            group = Group(name=f"{profile.city} Fitness Group", description=f"Group for {profile.city}")
-            db.session.add(group)
-        profile.group_id = group.id
+    if profile.city and profile.city.strip():
+        profile.group_id = group_for_city(profile.city)
 
     db.session.add(profile)
     db.session.commit()
@@ -39,7 +62,108 @@ def get_user(user_id):
         return jsonify({"error": "User not found"}), 404
     return jsonify(user.to_dict(include_profile=True)), 200
 
+@profile_bp.route("/users/<int:user_id>/fitness-recommendation", methods=["GET"])
+def get_fitness_recommendation(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    if not user.profile:
+        return jsonify({"error": "Profile not found"}), 404
+
+    # Serve the stored result unless the profile or models changed since
+    features = profile_features(user.profile)
+    key = features_key(features)
+    stored = db.session.get(FitnessRecommendation, user_id)
+    max_age = current_app.config["RECOMMENDATION_MAX_AGE_HOURS"]
+    if stored and not is_stale(stored, key, max_age):
+        return jsonify(stored.to_dict()), 200
+
+    try:
+        result = ml_service.get_recommendation(features, apply_defaults=True)
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    if not result["success"]:
+        # An outdated recommendation beats none
+        if stored:
+            return jsonify(dict(stored.to_dict(), stale=True)), 200
+        return jsonify({"error": result["error"]}), 500
+
+    store_recommendations([(user_id, key, result)])
+    db.session.commit()
+    return jsonify(db.session.get(FitnessRecommendation, user_id).to_dict()), 200
+
 @profile_bp.route("/users", methods=["GET"])
 def get_all_users():
-    users = User.query.all()
-    return jsonify([u.to_dict(include_profile=True) for u in users]), 200
+    # ?limit=&cursor=&city=&fitness_level=; the next page's cursor is in X-Next-Cursor.
+    # With ?stream=1 every user after the cursor comes back in one streamed
+    # array (no X-Next-Cursor), for exports and bulk syncs.
+    limit = min(max(request.args.get("limit", 50, type=int), 1), MAX_USERS_PAGE)
+    city = request.args.get("city")
+    fitness_level = request.args.get("fitness_level")
+    cursor = request.args.get("cursor")
+    after_id = None
+    if cursor:
+        try:
+            (after_id,) = decode_cursor(cursor)
+            after_id = int(after_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    if wants_stream():
+        query = select(*USER_WITH_PROFILE_COLUMNS)
+        if city or fitness_level:
+            query = query.join(UserProfile, UserProfile.user_id == User.id)
+            if city:
+                query = query.where(UserProfile.city == city)
+            if fitness_level:
+                query = query.where(UserProfile.fitness_level == fitness_level)
+        else:
+            query = query.outerjoin(UserProfile, UserProfile.user_id == User.id)
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        rows = distinct_users(stream_rows(query.order_by(User.id)))
+        return stream_json_array(encode_user_with_profile(row) for row in rows)
+
+    # Profiles come back in the same query; users without one only match unfiltered
+    query = User.query.options(contains_eager(User.profile))
+    if city or fitness_level:
+        query = query.join(User.profile)
+        if city:
+            query = query.filter(UserProfile.city == city)
+        if fitness_level:
+            query = query.filter(UserProfile.fitness_level == fitness_level)
+    else:
+        query = query.outerjoin(User.profile)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+
+    users = query.order_by(User.id).limit(limit + 1).all()
+    response = jsonify([u.to_dict(include_profile=True) for u in users[:limit]])
+    if len(users) > limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(users[limit - 1].id)
+    return response, 200
+
+# One bulk import at a time per process: each one runs a hashing process pool
+_import_lock = threading.Lock()
+
+@profile_bp.route("/users/import", methods=["POST"])
+@operator_required
+def import_users_route():
+    """
+    Bulk user import, for operators (X-Operator-Token) only: registration
+    is open, so a login isn't enough. import_users.py does the same from
+    the command line without tying up a web worker.
+    """
+    # Body is CSV or NDJSON (?format=, else from the Content-Type), read as a stream
+    fmt = request.args.get("format") or ("csv" if request.mimetype == "text/csv" else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    if not _import_lock.acquire(blocking=False):
+        return jsonify({"error": "An import is already running"}), 409
+    try:
+        stream = io.TextIOWrapper(io.BufferedReader(request.stream), encoding="utf-8", newline="")
+        batch_size = min(max(request.args.get("batch_size", 1000, type=int), 1), 10000)
+        workers = current_app.config["USER_IMPORT_WORKERS"]
+        return jsonify(import_users(stream, fmt, batch_size, workers)), 200
+    finally:
+        _import_lock.release()
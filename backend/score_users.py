@@ -0,0 +1,111 @@
+"""
+Precompute fitness recommendations for every user profile.
+
+    python score_users.py [--chunk-size 5000] [--restart]
+
+Profiles are streamed in user_id order (a server-side cursor where the
+database supports one), scored in batches with predict_many and upserted
+into FitnessRecommendation, one commit per chunk. Progress is saved to a
+checkpoint file after each commit, so an interrupted run picks up where it
+stopped; a new model version starts over.
+"""
+import argparse
+import json
+import os
+import time
+
+from sqlalchemy import select
+
+from app import app
+from models import db, UserProfile
+from utils.fitness import LIFESTYLE_FIELDS, features_key, ml_service, profile_features, store_recommendations
+
+CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".score_users.checkpoint")
+
+# Only the columns profile_features() reads, to keep rows small (it takes
+# these rows as well as UserProfile objects)
+PROFILE_COLUMNS = [
+    UserProfile.user_id, UserProfile.age, UserProfile.bmi, UserProfile.fitness_level,
+    UserProfile.join_date, *[getattr(UserProfile, f) for f in LIFESTYLE_FIELDS],
+]
+
+
+def load_checkpoint(restart):
+    if restart or not os.path.exists(CHECKPOINT_PATH):
+        return 0
+    with open(CHECKPOINT_PATH) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("model_version") != ml_service.model_version:
+        print("⚠️ Models changed since the last run, starting over")
+        return 0
+    return checkpoint["last_user_id"]
+
+
+def save_checkpoint(last_user_id):
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"model_version": ml_service.model_version, "last_user_id": last_user_id}, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def stream_profiles(after_user_id, chunk_size):
+    """Yield lists of up to chunk_size profile rows with user_id > after_user_id"""
+    query = (
+        select(*PROFILE_COLUMNS)
+        .where(UserProfile.user_id > after_user_id)
+        .order_by(UserProfile.user_id)
+    )
+    if db.engine.dialect.supports_server_side_cursors:
+        # Own connection, so committing the writes doesn't close the cursor
+        with db.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+            for chunk in result.partitions():
+                yield chunk
+        return
+
+    # No server-side cursors (e.g. SQLite): page on user_id instead
+    while True:
+        chunk = db.session.execute(query.where(UserProfile.user_id > after_user_id).limit(chunk_size)).all()
+        if not chunk:
+            return
+        yield chunk
+        after_user_id = chunk[-1].user_id
+
+
+def score_users(chunk_size=5000, restart=False):
+    last_user_id = load_checkpoint(restart)
+    if last_user_id:
+        print(f"↩️ Resuming after user {last_user_id}")
+
+    scored = failed = 0
+    start = time.perf_counter()
+    for chunk in stream_profiles(last_user_id, chunk_size):
+        features = [profile_features(row) for row in chunk]
+        results = ml_service.predict_many(features, apply_defaults=True)
+        stored = store_recommendations(
+            (row.user_id, features_key(data), result)
+            for row, data, result in zip(chunk, features, results)
+        )
+        db.session.commit()
+
+        last_user_id = chunk[-1].user_id
+        save_checkpoint(last_user_id)
+        scored += stored
+        failed += len(chunk) - stored
+        rate = scored / (time.perf_counter() - start)
+        print(f"✅ {scored} users scored ({failed} failed), up to user {last_user_id}, {rate:.0f}/s")
+
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+    print(f"✅ Done: {scored} recommendations stored with model {ml_service.model_version}")
+    return scored
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="profiles scored and committed at a time")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and rescore everyone")
+    args = parser.parse_args()
+
+    with app.app_context():
+        score_users(args.chunk_size, args.restart)
@@ -65,12 +65,12 @@ with app.app_context():
     # ---------------------------
     # Add groups
     groups_data = [
-        {"name": "Tunis Fitness Group", "description": "Group for Tunis"},
-        {"name": "Sousse Gym Buddies", "description": "Fitness friends from Sousse"}
+        {"name": "Tunis Fitness Group", "description": "Group for Tunis", "city_key": "tunis"},
+        {"name": "Sousse Gym Buddies", "description": "Fitness friends from Sousse", "city_key": "sousse"}
     ]
     for g in groups_data:
         if not Group.query.filter_by(name=g["name"]).first():
-            group = Group(name=g["name"], description=g["description"])
+            group = Group(**g)
             db.session.add(group)
 
     db.session.commit()
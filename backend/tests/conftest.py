@@ -0,0 +1,42 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import: point it at a scratch database
+_db_dir = tempfile.mkdtemp(prefix="fitconnect-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("CHAT_WRITE_BEHIND", "1")
+os.environ.setdefault("QUERY_PROFILER", "1")
+os.environ.setdefault("OPERATOR_TOKEN", "test-operator-token")
+os.environ.setdefault("COUNTER_RECONCILE_SECONDS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    """Register a user through the API; returns (user dict, token)"""
+    def make(**fields):
+        n = next(_user_numbers)
+        data = {"username": f"user{n}", "surname": "Test", "phone": f"+1555{n:07d}", "password": "secret"}
+        data.update(fields)
+        response = client.post("/api/register", json=data)
+        assert response.status_code == 201, response.get_json()
+        body = response.get_json()
+        return body["user"], body["token"]
+    return make
@@ -0,0 +1,25 @@
+from sqlalchemy import delete
+
+from models import db, RevokedToken
+from utils.auth import token_cache, token_hash
+
+
+def test_refresh_keeps_revocations_its_snapshot_missed(app, make_user):
+    _, token = make_user()
+    with app.app_context():
+        assert token_cache.identity(token) is not None
+        token_cache.revoke(token)
+        # As if the refresh's SELECT ran before the revocation was committed
+        db.session.execute(delete(RevokedToken).where(RevokedToken.token_hash == token_hash(token)))
+        db.session.commit()
+        token_cache._revoked_loaded_at = None
+        assert token_cache.identity(token) is None
+
+
+def test_loaded_revocations_are_no_longer_tracked_locally(app, make_user):
+    _, token = make_user()
+    with app.app_context():
+        token_cache.revoke(token)
+        token_cache._revoked_loaded_at = None
+        assert token_cache.identity(token) is None
+        assert token_hash(token) not in token_cache._revoked_locally
@@ -0,0 +1,166 @@
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+from models import db, ChatMessage, Group
+from utils.chat_stream import broker
+from utils.chat_writer import MAX_MESSAGE_LENGTH, chat_writer
+
+
+@pytest.fixture
+def group(app):
+    with app.app_context():
+        group = Group(name="Writers")
+        db.session.add(group)
+        db.session.commit()
+        return group.id
+
+
+@pytest.fixture
+def frequent_switches():
+    """Switch threads as often as possible, to interleave concurrent posts"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_concurrent_posts_reach_subscribers_in_id_order(app, make_user, group, frequent_switches):
+    assert chat_writer.enabled
+    user, _ = make_user()
+    subscription = broker.subscribe(group)
+    errors = []
+
+    def poster(n):
+        client = app.test_client()
+        for i in range(25):
+            response = client.post(f"/api/chat/{group}/messages",
+                                   json={"userId": user["id"], "message": f"{n}-{i}"})
+            if response.status_code != 201:
+                errors.append(response.get_json())
+
+    threads = [threading.Thread(target=poster, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        received = []
+        while len(received) < 200:
+            event = subscription.get(timeout=5)
+            assert event is not None, f"only {len(received)} of 200 messages published"
+            received.append(event)
+    finally:
+        subscription.close()
+
+    assert not errors
+    ids = [event["id"] for event in received]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    positions = [(event["timestamp"], event["id"]) for event in received]
+    assert positions == sorted(positions)
+
+
+def test_post_rejects_unknown_group_and_long_messages(client, make_user, group):
+    user, _ = make_user()
+    response = client.post("/api/chat/999999/messages", json={"userId": user["id"], "message": "hi"})
+    assert response.status_code == 404
+    response = client.post(f"/api/chat/{group}/messages",
+                           json={"userId": user["id"], "message": "x" * (MAX_MESSAGE_LENGTH + 1)})
+    assert response.status_code == 400
+
+
+def test_failed_row_does_not_fail_its_batch(app, make_user, group):
+    user, _ = make_user()
+    with app.app_context():
+        # Hold the next id the writer will hand out, so its INSERT collides
+        next_id = chat_writer._ids[0] if chat_writer._ids else chat_writer._next_local_id
+        assert next_id is not None
+        db.session.add(ChatMessage(id=next_id, group_id=group, user_id=user["id"], message="taken"))
+        db.session.commit()
+
+    results = {}
+
+    def poster(n):
+        with app.app_context():
+            try:
+                results[n] = chat_writer.post(group, user["id"], user["username"], f"batch {n}")
+            except Exception as e:
+                results[n] = e
+
+    threads = [threading.Thread(target=poster, args=(n,)) for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failed = [n for n, result in results.items() if isinstance(result, Exception)]
+    assert len(failed) == 1
+    assert results[failed[0]].__class__.__name__ == "IntegrityError"
+    with app.app_context():
+        saved = ChatMessage.query.filter(ChatMessage.message.like("batch %")).count()
+    assert saved == 4
+
+
+def _stream_events(client, group, last_event_id, count):
+    response = client.get(f"/api/chat/{group}/stream", headers={"Last-Event-ID": last_event_id},
+                          buffered=False)
+    events = []
+    try:
+        for chunk in response.response:
+            chunk = chunk.decode()
+            if chunk.startswith("id:"):
+                lines = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+                events.append(lines)
+                if len(events) == count:
+                    break
+    finally:
+        response.close()
+    return events
+
+
+def test_stream_resumes_from_cursor(client, make_user, group):
+    user, _ = make_user()
+    posted = [client.post(f"/api/chat/{group}/messages",
+                          json={"userId": user["id"], "message": f"resume {i}"}).get_json()
+              for i in range(3)]
+    first = _stream_events(client, group, str(posted[0]["id"]), 2)
+    assert [json.loads(event["data"])["id"] for event in first] == [posted[1]["id"], posted[2]["id"]]
+
+    # The id of each event is a cursor to resume from
+    resumed = _stream_events(client, group, first[0]["id"], 1)
+    assert json.loads(resumed[0]["data"])["id"] == posted[2]["id"]
+
+
+def test_writer_survives_an_unexpected_error(app, make_user, group, monkeypatch):
+    user, _ = make_user()
+    write = chat_writer._write
+
+    def broken_write(batch):
+        raise RuntimeError("connection dropped")
+
+    monkeypatch.setattr(chat_writer, "_write", broken_write)
+    with app.app_context(), pytest.raises(RuntimeError):
+        chat_writer.post(group, user["id"], user["username"], "lost")
+    monkeypatch.setattr(chat_writer, "_write", write)
+
+    assert chat_writer._thread.is_alive()
+    with app.app_context():
+        assert chat_writer.post(group, user["id"], user["username"], "saved")["message"] == "saved"
+
+
+def test_flush_post_gives_up_after_timeout(app, make_user, group, monkeypatch):
+    user, _ = make_user()
+    write = chat_writer._write
+
+    def slow_write(batch):
+        time.sleep(0.5)
+        write(batch)
+
+    monkeypatch.setattr(chat_writer, "_write", slow_write)
+    monkeypatch.setattr(chat_writer, "result_timeout", 0.05)
+    with app.app_context(), pytest.raises(TimeoutError):
+        chat_writer.post(group, user["id"], user["username"], "slow")
+    time.sleep(0.6)
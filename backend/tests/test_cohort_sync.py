@@ -0,0 +1,27 @@
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Group, UserProfile
+from utils.fitness import ml_service
+
+
+def test_savepoint_rollback_keeps_pending_cohort_changes(app, make_user, monkeypatch):
+    user, _ = make_user()
+    added = []
+    monkeypatch.setattr(ml_service, "add_neighbor", lambda user_id, features: added.append(user_id))
+
+    with app.app_context():
+        db.session.add(Group(name="Taken", city_key="cohort-sync-city"))
+        db.session.commit()
+
+        db.session.add(UserProfile(user_id=user["id"], age=30, weight=70, height=175,
+                                   fitness_category="Beginner", fitness_goal="Weight Loss"))
+        db.session.flush()
+        # What group_for_city does when it loses the insert race
+        try:
+            with db.session.begin_nested():
+                db.session.add(Group(name="Taken again", city_key="cohort-sync-city"))
+        except IntegrityError:
+            pass
+        db.session.commit()
+
+    assert added == [user["id"]]
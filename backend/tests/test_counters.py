@@ -0,0 +1,27 @@
+from sqlalchemy import delete, func, select, update
+
+from models import db, CommunityCounter, User
+from utils.counters import read_counters, reconcile_counters
+
+
+def test_reconcile_recounts_in_place(app, make_user):
+    make_user()
+    with app.app_context():
+        users = db.session.execute(select(func.count()).select_from(User)).scalar()
+        db.session.execute(update(CommunityCounter).where(CommunityCounter.name == "users").values(value=users + 7))
+        db.session.execute(delete(CommunityCounter).where(CommunityCounter.name == "groups"))
+        db.session.commit()
+
+        drift = reconcile_counters()
+        assert drift["users"] == -7
+        assert read_counters()["users"] == users
+        assert db.session.get(CommunityCounter, "groups") is not None
+        assert reconcile_counters() == {}
+
+
+def test_counters_follow_registrations(app, make_user):
+    with app.app_context():
+        before = read_counters()["users"]
+    make_user()
+    with app.app_context():
+        assert read_counters()["users"] == before + 1
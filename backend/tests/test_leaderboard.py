@@ -0,0 +1,45 @@
+from sqlalchemy import delete, func, select, update
+
+from models import db, LeaderboardBucket, LeaderboardEntry
+from utils.leaderboard import rebuild_buckets, rebuild_leaderboard
+
+
+def _bucket_counts():
+    return {points: members for points, members in db.session.execute(
+        select(LeaderboardBucket.points, LeaderboardBucket.members).where(LeaderboardBucket.members > 0)
+    ).all()}
+
+
+def _entry_counts():
+    return dict(db.session.execute(
+        select(LeaderboardEntry.points, func.count()).group_by(LeaderboardEntry.points)
+    ).all())
+
+
+def test_rebuild_repairs_only_diverging_entries(app, make_user):
+    (first, _), (second, _), (third, _) = make_user(), make_user(), make_user()
+    with app.app_context():
+        expected = dict(db.session.execute(select(LeaderboardEntry.user_id, LeaderboardEntry.points)).all())
+        db.session.execute(update(LeaderboardEntry).where(LeaderboardEntry.user_id == first["id"])
+                           .values(points=-5))
+        db.session.execute(delete(LeaderboardEntry).where(LeaderboardEntry.user_id == second["id"]))
+        db.session.commit()
+
+        assert rebuild_leaderboard() == 2
+        assert dict(db.session.execute(select(LeaderboardEntry.user_id, LeaderboardEntry.points)).all()) == expected
+        assert _bucket_counts() == _entry_counts()
+        assert rebuild_leaderboard() == 0
+
+
+def test_rebuild_buckets_recounts_in_place(app, make_user):
+    make_user()
+    with app.app_context():
+        points = db.session.execute(select(LeaderboardEntry.points)).scalars().first()
+        db.session.execute(update(LeaderboardBucket).where(LeaderboardBucket.points == points)
+                           .values(members=1000))
+        db.session.execute(LeaderboardBucket.__table__.insert().values(points=-1, members=3))
+        db.session.commit()
+
+        assert rebuild_buckets() == 2
+        assert _bucket_counts() == _entry_counts()
+        assert rebuild_buckets() == 0
@@ -0,0 +1,10 @@
+from utils.auth import token_cache
+from utils.metrics import request_metrics
+
+
+def test_metrics_hooks_wrap_authentication(app):
+    before = app.before_request_funcs[None]
+    assert before[0] == request_metrics._start
+    assert before.index(token_cache._authenticate) > 0
+    # Teardown hooks run in reverse order of registration: the metrics one last
+    assert app.teardown_request_funcs[None][0] == request_metrics._teardown
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from utils.query_profiler import max_queries
+
+
+def test_users_page_query_count(client, make_user):
+    make_user()
+    with max_queries(1):
+        assert client.get("/api/users").status_code == 200
+
+
+def test_leaderboard_query_count(client, make_user):
+    make_user()
+    with max_queries(3):
+        assert client.get("/api/leaderboard").status_code == 200
+
+
+def test_login_query_count(client, make_user):
+    user, _ = make_user()
+    with max_queries(2):
+        response = client.post("/api/login", json={"phone": user["phone"], "password": "secret"})
+    assert response.status_code == 200
+
+
+def test_request_count_includes_authentication(client, make_user):
+    _, token = make_user()
+    with max_queries(10) as profile:
+        response = client.get("/api/users", headers={"Authorization": f"Bearer {token}"})
+    # A new token is looked up by the auth hook, which runs after the profiler's
+    assert profile.count > 1
+    assert int(response.headers["X-Query-Count"]) == profile.count
+
+
+def test_failed_statement_is_not_counted(app):
+    with app.app_context(), max_queries(1) as profile:
+        with pytest.raises(OperationalError):
+            db.session.execute(text("SELECT * FROM no_such_table"))
+        db.session.rollback()
+        assert db.session.execute(text("SELECT 1")).scalar() == 1
+    assert profile.count == 1
+    assert profile.seconds < 1
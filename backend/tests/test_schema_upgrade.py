@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.orm import Session
+
+from models import UserProfile
+from utils.helpers import add_missing_columns
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tables as they were before the performance work (arrays as JSON text)
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY, username VARCHAR(128) NOT NULL UNIQUE, surname VARCHAR(128) NOT NULL,
+    phone VARCHAR(20) NOT NULL UNIQUE, password_hash VARCHAR(512) NOT NULL
+);
+CREATE TABLE "group" (id INTEGER PRIMARY KEY, name VARCHAR(128), description VARCHAR(256));
+CREATE TABLE user_profile (
+    id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES user (id), age INTEGER, weight FLOAT,
+    height FLOAT, fitness_level VARCHAR(50), goals JSON, bmi FLOAT, city VARCHAR(128),
+    group_id INTEGER REFERENCES "group" (id)
+);
+CREATE TABLE community_event (
+    id INTEGER PRIMARY KEY, title VARCHAR(128), details VARCHAR(256), location VARCHAR(128), attendees JSON
+);
+CREATE TABLE chat_message (
+    id INTEGER PRIMARY KEY, group_id INTEGER REFERENCES "group" (id), user_id INTEGER REFERENCES user (id),
+    username VARCHAR(128), message VARCHAR(500), timestamp DATETIME
+);
+CREATE TABLE challenge (
+    id INTEGER PRIMARY KEY, title VARCHAR(128), description VARCHAR(256), progress INTEGER, reward VARCHAR(128)
+);
+CREATE TABLE meal (id INTEGER PRIMARY KEY, name VARCHAR(128), calories FLOAT, type VARCHAR(128));
+INSERT INTO user VALUES (1, 'old', 'User', '+15550000001', 'x');
+INSERT INTO "group" VALUES (1, 'Tunis Fitness Group', 'Members in Tunis');
+INSERT INTO user_profile (id, user_id, age, weight, height, city, group_id)
+    VALUES (1, 1, 30, 70, 175, 'Tunis', 1);
+INSERT INTO community_event VALUES (1, 'Run', 'Morning run', 'Tunis', '[1]');
+"""
+
+
+def _baseline_session(tmp_path):
+    path = tmp_path / "baseline.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    return Session(create_engine(f"sqlite:///{path}"))
+
+
+def test_profile_columns_added_to_baseline_table(tmp_path):
+    session = _baseline_session(tmp_path)
+    added = add_missing_columns(session, UserProfile)
+    assert {"join_date", "avg_steps", "fitness_category", "fitness_goal"} <= set(added)
+    assert add_missing_columns(session, UserProfile) == []
+
+    bind = session.get_bind()
+    indexes = {index["name"] for index in inspect(bind).get_indexes("user_profile")}
+    assert {"ix_user_profile_cohort", "ix_user_profile_city", "ix_user_profile_user_id"} <= indexes
+    profile = session.execute(select(UserProfile)).scalar_one()
+    assert profile.city == "Tunis" and profile.fitness_category is None
+
+
+def test_app_starts_on_a_baseline_database(tmp_path):
+    path = tmp_path / "baseline.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", CHAT_WRITE_BEHIND="0")
+    script = "from app import app\nfrom utils.groups import group_for_city\n" \
+             "with app.app_context():\n    print('group', group_for_city('Tunis'))"
+    for _ in range(2):   # the second start finds everything already migrated
+        result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND, env=env,
+                                capture_output=True, text=True, timeout=300)
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert "group 1" in result.stdout
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('SELECT city_key FROM "group" WHERE id = 1').fetchone()[0] == "tunis"
+        indexes = {row[1]: row[2] for row in conn.execute('PRAGMA index_list("group")')}
+    assert indexes["ix_group_city_key"] == 1   # unique
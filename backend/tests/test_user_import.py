@@ -0,0 +1,56 @@
+import io
+import os
+
+CSV = "username,surname,phone,password\nimported1,Test,+15550900001,secret\nimported2,Test,+15550900002,secret\n"
+
+
+def test_import_requires_operator_token(client, make_user):
+    _, token = make_user()
+    response = client.post("/api/users/import", data=CSV, content_type="text/csv",
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+    response = client.post("/api/users/import", data=CSV, content_type="text/csv",
+                           headers={"X-Operator-Token": "wrong"})
+    assert response.status_code == 403
+
+
+def test_operator_can_import(client):
+    response = client.post("/api/users/import", data=CSV, content_type="text/csv",
+                           headers={"X-Operator-Token": os.environ["OPERATOR_TOKEN"]})
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 2
+
+
+def test_over_long_fields_are_rejected_per_row(client):
+    csv = ("username,surname,phone,password\n"
+           "longphone,Test,+1555123456789012345678,secret\n"
+           "shortphone,Test,+15550900003,secret\n")
+    response = client.post("/api/users/import", data=csv, content_type="text/csv",
+                           headers={"X-Operator-Token": os.environ["OPERATOR_TOKEN"]})
+    summary = response.get_json()
+    assert summary["imported"] == 1
+    assert summary["errors"] == [{"line": 2, "error": "phone longer than 20 characters"}]
+
+
+def test_database_error_only_fails_the_bad_row(app, monkeypatch):
+    from utils.user_import import UserImporter, read_rows
+
+    class DriverError(Exception):
+        """Stands in for a psycopg2 error raised by COPY"""
+
+    write_batch = UserImporter._write_batch
+
+    def failing_write_batch(self, rows, hashes):
+        if any(user["username"] == "rejected" for _, user, _ in rows):
+            raise DriverError("value rejected")
+        return write_batch(self, rows, hashes)
+
+    monkeypatch.setattr(UserImporter, "_write_batch", failing_write_batch)
+    csv = ("username,surname,phone,password\n"
+           "accepted1,Test,+15550900011,secret\n"
+           "rejected,Test,+15550900012,secret\n"
+           "accepted2,Test,+15550900013,secret\n")
+    with app.app_context():
+        summary = UserImporter(batch_size=10, workers=1).run(read_rows(io.StringIO(csv), "csv"))
+    assert summary["imported"] == 2
+    assert summary["errors"] == [{"line": 3, "error": "Could not insert: value rejected"}]
@@ -0,0 +1,180 @@
+"""
+Bearer token authentication.
+
+A before_request hook reads "Authorization: Bearer <token>" and sets
+g.identity to an Identity(user_id, username), or None without a valid
+token; views that need a user are wrapped in login_required. Verified
+tokens are kept in a bounded LRU until they expire, so after the first
+request a token costs a dictionary lookup instead of an HMAC check, a
+JSON parse and a User query.
+
+Logout revokes a token: its hash goes into RevokedToken and an in-process
+set that is checked before the cache. Other processes pick revocations up
+from the table every revocation_refresh seconds.
+
+Admin actions (model reloads, bulk imports) aren't open to user accounts:
+they are wrapped in operator_required, which wants the OPERATOR_TOKEN
+setting in an X-Operator-Token header. Without OPERATOR_TOKEN they are off.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from functools import wraps
+
+import jwt
+from flask import current_app, g, jsonify, request
+from sqlalchemy import delete, select
+
+from models import db, User, RevokedToken
+
+Identity = namedtuple("Identity", ["user_id", "username"])
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    def __init__(self, secret=None, max_entries=10000, revocation_refresh=30):
+        self.secret = secret
+        self.max_entries = max_entries
+        self.revocation_refresh = revocation_refresh
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()   # token -> (Identity, exp)
+        self._revoked = set()
+        # Revoked here but maybe not in the last load yet: token hash -> expiry
+        self._revoked_locally = {}
+        self._revoked_loaded_at = None
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        """Authenticate every request"""
+        self.secret = app.config["JWT_SECRET_KEY"]
+        self.max_entries = app.config.get("AUTH_TOKEN_CACHE_SIZE", self.max_entries)
+        self.revocation_refresh = app.config.get("AUTH_REVOCATION_REFRESH_SECONDS", self.revocation_refresh)
+        app.before_request(self._authenticate)
+
+    def _authenticate(self):
+        header = request.headers.get("Authorization", "")
+        token = header[7:].strip() if header[:7].lower() == "bearer " else None
+        g.token = token
+        g.identity = self.identity(token) if token else None
+
+    def _refresh_revoked(self):
+        now = time.monotonic()
+        if self._revoked_loaded_at is not None and now - self._revoked_loaded_at < self.revocation_refresh:
+            return
+        self._revoked_loaded_at = now
+        utcnow = datetime.utcnow()
+        hashes = set(db.session.execute(
+            select(RevokedToken.token_hash).where(RevokedToken.expires_at > utcnow)
+        ).scalars())
+        # The table is pruned of expired tokens, so this also drops ours.
+        # Revocations made here since the SELECT's snapshot are kept until
+        # a load includes them.
+        with self._lock:
+            self._revoked_locally = {
+                digest: expires_at for digest, expires_at in self._revoked_locally.items()
+                if digest not in hashes and expires_at > utcnow
+            }
+            self._revoked = hashes | self._revoked_locally.keys()
+
+    def identity(self, token):
+        """Identity for a valid, unrevoked token, else None"""
+        self._refresh_revoked()
+        now = time.time()
+        with self._lock:
+            if token_hash(token) in self._revoked:
+                self.rejected += 1
+                self._tokens.pop(token, None)
+                return None
+            cached = self._tokens.get(token)
+            if cached is not None and cached[1] > now:
+                self._tokens.move_to_end(token)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=["HS256"])
+            user_id = claims["user_id"]
+        except (jwt.InvalidTokenError, KeyError):
+            with self._lock:
+                self.rejected += 1
+            return None
+        username = db.session.execute(select(User.username).where(User.id == user_id)).scalar()
+        if username is None:
+            with self._lock:
+                self.rejected += 1
+            return None
+
+        identity = Identity(user_id, username)
+        with self._lock:
+            self._tokens[token] = (identity, claims.get("exp", float("inf")))
+            if len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+        return identity
+
+    def revoke(self, token):
+        """Reject token from now on, here and (after a refresh) in other processes"""
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return
+        digest = token_hash(token)
+        expires_at = datetime.utcfromtimestamp(claims["exp"]) if "exp" in claims else datetime.max
+        with self._lock:
+            self._revoked.add(digest)
+            self._revoked_locally[digest] = expires_at
+            self._tokens.pop(token, None)
+        if db.session.get(RevokedToken, digest) is None:
+            db.session.add(RevokedToken(token_hash=digest, expires_at=expires_at))
+        # Expired tokens fail verification anyway
+        db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cached_tokens": len(self._tokens),
+                "revoked_tokens": len(self._revoked),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "rejected": self.rejected,
+            }
+
+
+token_cache = TokenCache()
+
+
+def login_required(view):
+    """Reject requests without a valid bearer token with 401"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.get("identity") is None:
+            return jsonify({"error": "Authentication required"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def is_operator(token):
+    """True if token is the configured OPERATOR_TOKEN"""
+    expected = current_app.config.get("OPERATOR_TOKEN")
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def operator_required(view):
+    """Reject requests without the operator token (X-Operator-Token) with 403"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_operator(request.headers.get("X-Operator-Token")):
+            return jsonify({"error": "Operator token required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
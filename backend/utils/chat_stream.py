@@ -0,0 +1,106 @@
+"""
+In-process pub/sub for group chat, feeding the SSE stream endpoint.
+
+Each subscriber gets a bounded buffer. A subscriber that falls more than
+buffer_size events behind is evicted instead of slowing down publishers or
+growing without limit; its client reconnects with Last-Event-ID and
+catches up from the database.
+
+Waiting subscribers block on a Condition rather than polling. Under the
+default server (python app.py / flask run) every open stream holds a
+thread. Under gevent (gunicorn -k gevent, see the README), threading is
+patched to greenlets and thousands of idle streams cost no OS threads. The
+broker only reaches subscribers in the same process; running several
+processes needs an external broker with the same publish/subscribe
+interface.
+"""
+import threading
+from collections import deque
+
+
+class Subscription:
+    def __init__(self, broker, group_id, buffer_size):
+        self.broker = broker
+        self.group_id = group_id
+        self.buffer_size = buffer_size
+        self.evicted = False
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def push(self, event):
+        """Queue an event; returns False (and evicts) if the buffer is full"""
+        with self._ready:
+            if self.evicted:
+                return False
+            if len(self._events) >= self.buffer_size:
+                self.evicted = True
+                self._events.clear()
+                self._ready.notify()
+                return False
+            self._events.append(event)
+            self._ready.notify()
+            return True
+
+    def get(self, timeout=None):
+        """Next event, or None after timeout or once evicted (check .evicted)"""
+        with self._ready:
+            if not self._events and not self.evicted:
+                self._ready.wait(timeout)
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """Fan-out of published events to every subscriber of the same group"""
+
+    def __init__(self, buffer_size=256):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._groups = {}
+        self.published = 0
+        self.evictions = 0
+
+    def subscribe(self, group_id):
+        subscription = Subscription(self, group_id, self.buffer_size)
+        with self._lock:
+            self._groups.setdefault(group_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._groups.get(subscription.group_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._groups[subscription.group_id]
+
+    def publish(self, group_id, event):
+        """Deliver event to the group's subscribers; returns how many got it"""
+        with self._lock:
+            subscribers = list(self._groups.get(group_id, ()))
+            self.published += 1
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.push(event):
+                delivered += 1
+            else:
+                self.unsubscribe(subscription)
+                with self._lock:
+                    self.evictions += 1
+        return delivered
+
+    def stats(self):
+        with self._lock:
+            return {
+                "groups": len(self._groups),
+                "subscribers": sum(len(s) for s in self._groups.values()),
+                "published": self.published,
+                "evictions": self.evictions,
+            }
+
+
+broker = InMemoryBroker()
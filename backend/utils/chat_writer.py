@@ -0,0 +1,249 @@
+"""
+Write-behind group commit for chat messages.
+
+post() validates the sender against a cached user id -> username map,
+gives the message its id and timestamp right away and queues it. A writer
+thread flushes the queue as one multi-row INSERT per batch, every
+max_delay_ms or max_batch messages, and then publishes the messages to the
+chat stream.
+
+Ids come from blocks reserved up front: nextval() on the id sequence in
+PostgreSQL; elsewhere (SQLite in development) a counter seeded from
+max(id), which is only safe with a single writing process. The id, the
+timestamp and the queue slot are taken under one lock, so within a process
+ids, timestamps and publish order agree. Across processes blocks interleave
+ids, which is why the chat stream resumes from (timestamp, id) positions.
+
+post() rejects unknown groups and over-long messages up front. A batch
+whose INSERT still fails is retried row by row, so only the bad rows fail;
+any other error fails just that batch and the writer thread carries on.
+Id blocks are reserved without holding the queue lock.
+
+durability="flush" makes post() wait until its batch is committed (and
+raise if it failed); "enqueue" returns as soon as the message is queued,
+so a crash can lose the last few milliseconds of messages. A "flush" post
+gives up after result_timeout seconds (the message may still be written).
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, text
+
+from models import db, ChatMessage, Group, User
+from utils.chat_stream import broker
+
+DURABILITY_MODES = ("flush", "enqueue")
+MAX_MESSAGE_LENGTH = ChatMessage.message.type.length
+
+
+class ChatWriter:
+    def __init__(self, max_batch=200, max_delay_ms=5, durability="flush",
+                 id_block=100, username_cache_size=10000, result_timeout=10.0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.durability = durability
+        self.id_block = id_block
+        self.username_cache_size = username_cache_size
+        self.result_timeout = result_timeout
+        self.app = None
+        self.enabled = False
+
+        self._usernames = OrderedDict()
+        self._usernames_lock = threading.Lock()
+        self._groups = set()
+        self._ids = []
+        self._ids_lock = threading.Lock()
+        self._next_local_id = None
+        self._last_timestamp = datetime.min
+
+        self._queue = []
+        self._ready = threading.Condition()
+        self._thread = None
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        """Enable write-behind if CHAT_WRITE_BEHIND is set and start the writer thread"""
+        self.app = app
+        self.enabled = app.config.get("CHAT_WRITE_BEHIND", False)
+        self.max_batch = app.config.get("CHAT_WRITE_BATCH", self.max_batch)
+        self.max_delay = app.config.get("CHAT_WRITE_DELAY_MS", self.max_delay * 1000) / 1000.0
+        self.durability = app.config.get("CHAT_WRITE_DURABILITY", self.durability)
+        self.result_timeout = app.config.get("CHAT_WRITE_TIMEOUT_SECONDS", self.result_timeout)
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"CHAT_WRITE_DURABILITY must be one of {DURABILITY_MODES}")
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def username(self, user_id):
+        """Username for user_id (None if there's no such user), cached"""
+        with self._usernames_lock:
+            if user_id in self._usernames:
+                self._usernames.move_to_end(user_id)
+                return self._usernames[user_id]
+        username = db.session.execute(select(User.username).where(User.id == user_id)).scalar()
+        if username is not None:
+            with self._usernames_lock:
+                self._usernames[user_id] = username
+                if len(self._usernames) > self.username_cache_size:
+                    self._usernames.popitem(last=False)
+        return username
+
+    def _group_exists(self, group_id):
+        """Whether the group exists; known groups are remembered (they aren't deleted)"""
+        if group_id in self._groups:
+            return True
+        if db.session.execute(select(Group.id).where(Group.id == group_id)).scalar() is None:
+            return False
+        self._groups.add(group_id)
+        return True
+
+    def _refill_ids(self):
+        """Reserve the next id block once the current one is used up, without holding _ready"""
+        if self._ids:
+            return
+        with self._ids_lock:
+            # Blocks are reserved one at a time and only once the previous
+            # one is empty, so ids are handed out in increasing order
+            if not self._ids:
+                block = self._reserve_ids(self.id_block)
+                with self._ready:
+                    self._ids.extend(block)
+
+    def _reserve_ids(self, n):
+        if db.session.get_bind().dialect.name == "postgresql":
+            rows = db.session.execute(
+                text("SELECT nextval(pg_get_serial_sequence('chat_message', 'id')) FROM generate_series(1, :n)"),
+                {"n": n},
+            )
+            return [row[0] for row in rows]
+        if self._next_local_id is None:
+            self._next_local_id = (db.session.execute(select(func.max(ChatMessage.id))).scalar() or 0) + 1
+        start, self._next_local_id = self._next_local_id, self._next_local_id + n
+        return list(range(start, start + n))
+
+    def post(self, group_id, user_id, username, message):
+        """
+        Queue a message; returns its to_dict() once acknowledged per
+        durability. Raises LookupError for an unknown group and ValueError
+        for a message over MAX_MESSAGE_LENGTH.
+        """
+        if len(message) > MAX_MESSAGE_LENGTH:
+            raise ValueError(f"Message longer than {MAX_MESSAGE_LENGTH} characters")
+        if not self._group_exists(group_id):
+            raise LookupError("Group not found")
+        future = Future()
+        while True:
+            self._refill_ids()
+            with self._ready:
+                if not self._ids:
+                    continue   # used up by other posts meanwhile
+                # Never backwards, so (timestamp, id) follows queue order
+                self._last_timestamp = max(datetime.utcnow(), self._last_timestamp)
+                row = {
+                    "id": self._ids.pop(0),
+                    "group_id": group_id,
+                    "user_id": user_id,
+                    "username": username,
+                    "message": message,
+                    "timestamp": self._last_timestamp,
+                }
+                self._queue.append((row, future))
+                self._ready.notify()
+                break
+        if self.durability == "flush":
+            future.result(timeout=self.result_timeout)
+        return ChatMessage(**row).to_dict()
+
+    def _run(self):
+        while True:
+            try:
+                with self._ready:
+                    while not self._queue:
+                        self._ready.wait()
+                # Let a batch build up, unless it's already full
+                deadline = time.monotonic() + self.max_delay
+                with self._ready:
+                    while len(self._queue) < self.max_batch:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._ready.wait(remaining)
+                self.flush()
+            except Exception as e:
+                # The thread must outlive any one failure, or every later post hangs
+                print(f"❌ Chat writer error: {e}")
+                time.sleep(0.1)
+
+    def _insert(self, rows):
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(ChatMessage), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def flush(self):
+        """Write everything queued so far, max_batch rows per INSERT"""
+        while True:
+            with self._ready:
+                batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"❌ Chat write-behind batch of {len(batch)} messages failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        self.failed += 1
+                        future.set_exception(e)
+
+    def _write(self, batch):
+        try:
+            self._insert([row for row, _ in batch])
+            written = batch
+        except Exception as e:
+            # One bad row shouldn't fail everyone else's messages
+            print(f"⚠️ Chat write-behind flush of {len(batch)} messages failed, retrying one by one: {e}")
+            written = []
+            for row, future in batch:
+                try:
+                    self._insert([row])
+                except Exception as row_error:
+                    self.failed += 1
+                    print(f"❌ Chat message {row['id']} could not be saved: {row_error}")
+                    future.set_exception(row_error)
+                else:
+                    written.append((row, future))
+
+        if written:
+            self.flushed += len(written)
+            self.batches += 1
+        for row, future in written:
+            future.set_result(row["id"])
+            broker.publish(row["group_id"], ChatMessage(**row).to_dict())
+
+    def stats(self):
+        with self._ready:
+            queued = len(self._queue)
+        return {
+            "enabled": self.enabled,
+            "durability": self.durability,
+            "queued": queued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failed": self.failed,
+            "avg_batch_size": round(self.flushed / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+chat_writer = ChatWriter()
@@ -0,0 +1,118 @@
+"""
+Community stats counters.
+
+CommunityCounter keeps one row per counted table. Session hooks adjust it
+in the same transaction that inserts or deletes users, groups or events,
+so /api/community/stats reads three tiny rows instead of counting the big
+tables. Writes that bypass the ORM session (bulk imports, raw SQL) aren't
+seen by the hooks; reconcile_counters() recounts everything and runs at
+startup and then periodically. It sets each row to its COUNT(*) in place
+with one upsert per counter, so it never deletes rows that concurrent
+increments (or other workers reconciling at boot) are updating.
+"""
+import threading
+from collections import Counter
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Group, CommunityEvent, CommunityCounter
+from utils.helpers import dialect_insert, increment_counts
+
+# Counter name -> model whose rows it counts
+COUNTED_MODELS = {
+    "users": User,
+    "groups": Group,
+    "events": CommunityEvent,
+}
+_COUNTER_NAMES = {model: name for name, model in COUNTED_MODELS.items()}
+
+
+def _collect_counter_changes(session, flush_context, instances):
+    deltas = session.info.setdefault("counter_deltas", Counter())
+    for obj in session.new:
+        name = _COUNTER_NAMES.get(type(obj))
+        if name:
+            deltas[name] += 1
+    for obj in session.deleted:
+        name = _COUNTER_NAMES.get(type(obj))
+        if name:
+            deltas[name] -= 1
+
+
+def _apply_counter_changes(session, flush_context):
+    deltas = session.info.pop("counter_deltas", None)
+    if deltas:
+        increment_counts(session, CommunityCounter, CommunityCounter.name, CommunityCounter.value, deltas)
+
+
+def _discard_counter_changes(session, previous_transaction=None):
+    session.info.pop("counter_deltas", None)
+
+
+def read_counters():
+    """{name: value} for every counter; never touches the counted tables"""
+    values = dict(db.session.execute(select(CommunityCounter.name, CommunityCounter.value)).all())
+    return {name: values.get(name, 0) for name in COUNTED_MODELS}
+
+
+def _recount(name, model):
+    """Set one counter to its table's COUNT(*) in place, inserting it if missing; returns the count"""
+    actual = select(func.count()).select_from(model).scalar_subquery()
+    insert = dialect_insert(db.session)
+    if insert is not None:
+        stmt = insert(CommunityCounter).values(name=name, value=actual)
+        return db.session.execute(
+            stmt.on_conflict_do_update(index_elements=[CommunityCounter.name], set_={"value": stmt.excluded.value})
+            .returning(CommunityCounter.value)
+        ).scalar()
+    recount = (
+        update(CommunityCounter).where(CommunityCounter.name == name).values(value=actual)
+        .returning(CommunityCounter.value).execution_options(synchronize_session=False)
+    )
+    value = db.session.execute(recount).scalar()
+    if value is None:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(CommunityCounter.__table__.insert().values(name=name, value=actual))
+        except IntegrityError:
+            pass   # inserted by another worker meanwhile
+        value = db.session.execute(recount).scalar()
+    return value
+
+
+def reconcile_counters():
+    """Recount every counter in place; returns what was off"""
+    before = read_counters()
+    actual = {name: _recount(name, model) for name, model in COUNTED_MODELS.items()}
+    db.session.commit()
+    return {name: actual[name] - before[name] for name in actual if actual[name] != before[name]}
+
+
+def init_counters(app, reconcile_seconds=None):
+    """
+    Keep the counters in sync and reconcile them now and, if
+    reconcile_seconds is set, periodically on a background thread.
+    Must run inside an app context.
+    """
+    if not event.contains(db.session, "before_flush", _collect_counter_changes):
+        event.listen(db.session, "before_flush", _collect_counter_changes)
+        event.listen(db.session, "after_flush", _apply_counter_changes)
+        event.listen(db.session, "after_soft_rollback", _discard_counter_changes)
+
+    reconcile_counters()
+    if not reconcile_seconds:
+        return
+
+    def reconcile_periodically():
+        stop = threading.Event()
+        while not stop.wait(reconcile_seconds):
+            try:
+                with app.app_context():
+                    drift = reconcile_counters()
+                if drift:
+                    print(f"⚠️ Community counters were off by {drift}, fixed")
+            except Exception as e:
+                print(f"❌ Counter reconciliation failed: {e}")
+
+    threading.Thread(target=reconcile_periodically, name="counter-reconciler", daemon=True).start()
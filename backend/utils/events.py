@@ -0,0 +1,144 @@
+"""
+Event attendance.
+
+An RSVP is an EventAttendance row (primary key event_id, user_id) and
+CommunityEvent.attendee_count moves with it in the same transaction. The
+count only changes when the insert or delete actually hit a row, and it is
+changed with an in-place UPDATE ... SET attendee_count = attendee_count + 1,
+so concurrent RSVPs to the same event never overwrite each other and
+repeating one is a no-op. The event row is locked last and only until the
+commit, which keeps a popular event's writers queued for as short as
+possible.
+"""
+import json
+
+from sqlalchemy import delete, func, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, CommunityEvent, EventAttendance
+from utils.helpers import decode_cursor, dialect_insert, encode_cursor
+
+
+def _add_attendance(event_id, user_id):
+    """Insert the RSVP unless it exists; True if a row was inserted"""
+    insert = dialect_insert(db.session)
+    if insert is not None:
+        result = db.session.execute(
+            insert(EventAttendance).values(event_id=event_id, user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[EventAttendance.event_id, EventAttendance.user_id])
+        )
+        return result.rowcount > 0
+    try:
+        with db.session.begin_nested():
+            db.session.execute(EventAttendance.__table__.insert().values(event_id=event_id, user_id=user_id))
+        return True
+    except IntegrityError:
+        return False
+
+
+def _move_count(event_id, delta):
+    return db.session.execute(
+        update(CommunityEvent).where(CommunityEvent.id == event_id)
+        .values(attendee_count=CommunityEvent.attendee_count + delta)
+        .returning(CommunityEvent.attendee_count)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+
+def set_attendance(event_id, user_id, attending):
+    """
+    RSVP (or cancel) user_id for event_id and commit; returns the event's
+    attendee count, or None if there is no such event
+    """
+    if db.session.execute(select(CommunityEvent.id).where(CommunityEvent.id == event_id)).scalar() is None:
+        return None
+    if attending:
+        changed = _add_attendance(event_id, user_id)
+    else:
+        changed = db.session.execute(
+            delete(EventAttendance).where(EventAttendance.event_id == event_id,
+                                          EventAttendance.user_id == user_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount > 0
+
+    if changed:
+        count = _move_count(event_id, 1 if attending else -1)
+    else:
+        count = db.session.execute(
+            select(CommunityEvent.attendee_count).where(CommunityEvent.id == event_id)
+        ).scalar()
+    db.session.commit()
+    return count
+
+
+def attendees(event_id, limit, cursor=None):
+    """One page of an event's attendees by user id, and the next page's cursor (None at the end)"""
+    query = (
+        select(User.id, User.username)
+        .join(EventAttendance, EventAttendance.user_id == User.id)
+        .where(EventAttendance.event_id == event_id)
+        .order_by(EventAttendance.user_id)
+    )
+    if cursor:
+        (after_id,) = decode_cursor(cursor)
+        query = query.where(EventAttendance.user_id > int(after_id))
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return [{"id": user_id, "username": username} for user_id, username in rows[:limit]], next_cursor
+
+
+def reconcile_attendee_counts():
+    """Recount every event's attendees; returns how many counts were off"""
+    actual = (
+        select(func.count()).where(EventAttendance.event_id == CommunityEvent.id)
+        .correlate(CommunityEvent).scalar_subquery()
+    )
+    result = db.session.execute(
+        update(CommunityEvent).where(CommunityEvent.attendee_count != actual).values(attendee_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _migrate_attendee_arrays():
+    """Move RSVPs from the old CommunityEvent.attendees array column into EventAttendance"""
+    columns = {column["name"] for column in inspect(db.engine).get_columns("community_event")}
+    if "attendee_count" not in columns:
+        db.session.execute(text(
+            "ALTER TABLE community_event ADD COLUMN attendee_count INTEGER NOT NULL DEFAULT 0"
+        ))
+    if "attendees" not in columns:
+        db.session.commit()
+        return
+
+    rows = db.session.execute(text(
+        "SELECT id, attendees FROM community_event WHERE attendees IS NOT NULL"
+    )).all()
+    known_users = set(db.session.execute(select(User.id)).scalars())
+    moved = []
+    for event_id, user_ids in rows:
+        if isinstance(user_ids, str):   # JSON on SQLite
+            user_ids = json.loads(user_ids)
+        moved += [{"event_id": event_id, "user_id": user_id}
+                  for user_id in dict.fromkeys(user_ids or []) if user_id in known_users]
+    existing = set(db.session.execute(
+        select(EventAttendance.event_id, EventAttendance.user_id)
+        .where(EventAttendance.event_id.in_([event_id for event_id, _ in rows]))
+    ).all())
+    moved = [row for row in moved if (row["event_id"], row["user_id"]) not in existing]
+    if moved:
+        db.session.execute(EventAttendance.__table__.insert(), moved)
+    # Emptied rather than dropped, so a rollback to older code still starts
+    db.session.execute(text("UPDATE community_event SET attendees = NULL WHERE attendees IS NOT NULL"))
+    db.session.commit()
+    if moved:
+        print(f"✅ Moved {len(moved)} event RSVPs to event_attendance")
+
+
+def init_event_attendance():
+    """Migrate old attendee arrays and fix drifted counts. Must run inside an app context."""
+    _migrate_attendee_arrays()
+    drift = reconcile_attendee_counts()
+    if drift:
+        print(f"⚠️ Corrected attendee counts of {drift} events")
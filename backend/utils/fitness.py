@@ -0,0 +1,215 @@
+"""Glue between the SQLAlchemy models and the ML service in ml/"""
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+
+from models import db, UserProfile, FitnessRecommendation
+from utils.helpers import add_missing_columns, dialect_insert
+
+# The ml/ modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ml"))
+
+from cohort_index import COHORT_FIELDS  # noqa: E402
+from ml_service import ml_service  # noqa: E402
+
+FITNESS_LEVELS = {"Beginner": 0, "Intermediate": 1, "Advanced": 2}
+
+# Optional UserProfile columns passed straight through to the models
+LIFESTYLE_FIELDS = [
+    "avg_calories_consumed", "avg_calories_burned", "protein_g", "carbs_g", "fat_g",
+    "avg_steps", "avg_heart_rate", "avg_sleep_duration",
+    "avg_workout_duration", "avg_workout_intensity",
+]
+
+
+def profile_features(profile):
+    """Map a UserProfile to the user_data dict the ML service expects"""
+    data = {
+        "age": profile.age,
+        "bmi": profile.bmi,
+        "fitness_level_num": FITNESS_LEVELS.get(profile.fitness_level),
+    }
+    # Unset stats are left out so the service defaults apply
+    for field in LIFESTYLE_FIELDS:
+        value = getattr(profile, field)
+        if value is not None:
+            data[field] = value
+    if profile.join_date:
+        data["join_date"] = profile.join_date.isoformat()
+    return data
+
+
+def assign_cohort(profile):
+    """Predict the profile's category/goal and store them on it"""
+    category, goal = ml_service.predict_labels(profile_features(profile), apply_defaults=True)
+    profile.fitness_category = str(category)
+    profile.fitness_goal = str(goal)
+
+
+def features_key(features):
+    """Stable hash of a profile_features() dict, to tell when a stored result is outdated"""
+    encoded = json.dumps(features, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def is_stale(recommendation, key, max_age_hours):
+    """Whether a stored FitnessRecommendation no longer matches the profile or models"""
+    return (
+        recommendation.model_version != ml_service.model_version
+        or recommendation.features_key != key
+        or recommendation.computed_at < datetime.utcnow() - timedelta(hours=max_age_hours)
+    )
+
+
+def store_recommendations(rows):
+    """
+    Insert or update FitnessRecommendation rows in one statement.
+
+    rows are (user_id, features_key, result) with result as returned by
+    get_fitness_recommendation; failed results are skipped. Doesn't commit.
+    """
+    now = datetime.utcnow()
+    values = [
+        {
+            "user_id": user_id,
+            "category": str(result["category"]),
+            "goal": str(result["goal"]),
+            "payload": json.loads(json.dumps(result, default=str)),
+            "model_version": ml_service.model_version,
+            "features_key": key,
+            "computed_at": now,
+        }
+        for user_id, key, result in rows
+        if result.get("success")
+    ]
+    if not values:
+        return 0
+
+    insert = dialect_insert(db.session)
+    if insert is None:
+        # No portable upsert: replace row by row
+        for row in values:
+            db.session.merge(FitnessRecommendation(**row))
+        return len(values)
+
+    stmt = insert(FitnessRecommendation).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FitnessRecommendation.user_id],
+        set_={col: stmt.excluded[col] for col in values[0] if col != "user_id"},
+    )
+    db.session.execute(stmt)
+    return len(values)
+
+
+def _cohort_member(profile, committed=False):
+    """(category, goal, values, join_date) for the cohort index, or None"""
+    state = inspect(profile)
+
+    def value(key):
+        if committed:
+            history = state.attrs[key].history
+            if history.has_changes():
+                return history.deleted[0] if history.deleted else None
+        return state.attrs[key].value
+
+    category, goal = value("fitness_category"), value("fitness_goal")
+    if category is None or goal is None:
+        return None
+    return category, goal, {f: value(f) for f in COHORT_FIELDS}, value("join_date")
+
+
+def _similar_user(profile):
+    """Features for the similar-user index; only profiles with a cohort are indexed"""
+    if profile.fitness_category is None or profile.fitness_goal is None:
+        return None
+    return profile_features(profile)
+
+
+def _collect_cohort_changes(session, flush_context):
+    # History still holds the pre-flush values here
+    changes = session.info.setdefault("cohort_changes", [])
+    for obj in session.new:
+        if isinstance(obj, UserProfile):
+            changes.append((None, _cohort_member(obj), obj.user_id, _similar_user(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, UserProfile) and session.is_modified(obj):
+            changes.append((_cohort_member(obj, committed=True), _cohort_member(obj),
+                            obj.user_id, _similar_user(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, UserProfile):
+            changes.append((_cohort_member(obj, committed=True), None, obj.user_id, None))
+
+
+def _apply_cohort_changes(session):
+    for old, new, user_id, features in session.info.pop("cohort_changes", []):
+        if old:
+            ml_service.cohorts.remove(*old)
+        if new:
+            ml_service.cohorts.add(*new)
+        if features:
+            ml_service.add_neighbor(user_id, features)
+        else:
+            ml_service.remove_neighbor(user_id)
+
+
+def _discard_cohort_changes(session, previous_transaction=None):
+    # A rolled back SAVEPOINT (group_for_city losing an insert race), or the
+    # failed flush inside it, leaves the outer transaction and the changes
+    # it will commit in place: only discard once that is gone too
+    if session.in_transaction():
+        return
+    session.info.pop("cohort_changes", None)
+
+
+def init_cohort_index():
+    """
+    Build the cohort and similar-user indexes from UserProfile and keep
+    them in sync.
+
+    Profile changes are applied to the in-memory indexes only once their
+    transaction commits. Must run inside an app context.
+    """
+    added = add_missing_columns(db.session, UserProfile)
+    if added:
+        print(f"✅ Added user_profile columns: {', '.join(added)}")
+
+    if not event.contains(db.session, "after_flush", _collect_cohort_changes):
+        event.listen(db.session, "after_flush", _collect_cohort_changes)
+        event.listen(db.session, "after_commit", _apply_cohort_changes)
+        event.listen(db.session, "after_soft_rollback", _discard_cohort_changes)
+
+    columns = [getattr(UserProfile, f) for f in COHORT_FIELDS]
+    rows = (
+        db.session.query(UserProfile.fitness_category, UserProfile.fitness_goal,
+                         UserProfile.join_date, *columns)
+        .filter(UserProfile.fitness_category.isnot(None), UserProfile.fitness_goal.isnot(None))
+        .yield_per(10000)
+    )
+    loaded = ml_service.load_cohorts(
+        (row[0], row[1], dict(zip(COHORT_FIELDS, row[3:])), row[2]) for row in rows
+    )
+    print(f"✅ Cohort index built from {loaded} profiles")
+
+    columns = [getattr(UserProfile, f) for f in LIFESTYLE_FIELDS]
+    rows = (
+        db.session.query(UserProfile.user_id, UserProfile.join_date, *columns)
+        .filter(UserProfile.fitness_category.isnot(None), UserProfile.fitness_goal.isnot(None))
+        .yield_per(10000)
+    )
+    indexed = ml_service.load_neighbors(
+        (row[0], _row_features(row[1], row[2:])) for row in rows
+    )
+    print(f"✅ Similar-user index built from {indexed} profiles")
+    return loaded
+
+
+def _row_features(join_date, values):
+    """profile_features() for a (join_date, *LIFESTYLE_FIELDS) result row"""
+    data = {f: v for f, v in zip(LIFESTYLE_FIELDS, values) if v is not None}
+    if join_date:
+        data["join_date"] = join_date.isoformat()
+    return data
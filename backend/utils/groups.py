@@ -0,0 +1,89 @@
+"""
+City groups.
+
+Every city has one group, found through Group.city_key (the normalized
+city name, unique). Profile saves resolve it with group_for_city(), which
+answers repeat cities from an in-process cache and otherwise does one
+indexed lookup, creating the group if it doesn't exist yet.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Group
+from utils.helpers import add_missing_columns
+
+CITY_CACHE_SIZE = 50000
+
+_city_groups = OrderedDict()
+_city_groups_lock = threading.Lock()
+
+
+def city_key(city):
+    """'  new   York ' -> 'new york'"""
+    return " ".join(city.split()).casefold()
+
+
+def _cached(key):
+    with _city_groups_lock:
+        group_id = _city_groups.get(key)
+        if group_id is not None:
+            _city_groups.move_to_end(key)
+        return group_id
+
+
+def _cache(key, group_id):
+    with _city_groups_lock:
+        _city_groups[key] = group_id
+        if len(_city_groups) > CITY_CACHE_SIZE:
+            _city_groups.popitem(last=False)
+
+
+def group_for_city(city):
+    """
+    Id of the city's group, creating the group in the current transaction if
+    there is none. A concurrent save creating the same group loses on the
+    unique index and uses the winner's row instead.
+    """
+    key = city_key(city)
+    group_id = _cached(key)
+    if group_id is not None:
+        return group_id
+
+    group_id = db.session.execute(select(Group.id).where(Group.city_key == key)).scalar()
+    if group_id is None:
+        # Added through the session (rather than a Core INSERT ... ON CONFLICT)
+        # so the counters and response cache hooks see the new group
+        name = " ".join(city.split())
+        group = Group(name=f"{name} Fitness Group", description=f"Group for {name}", city_key=key)
+        try:
+            with db.session.begin_nested():
+                db.session.add(group)
+            return group.id
+        except IntegrityError:
+            group_id = db.session.execute(select(Group.id).where(Group.city_key == key)).scalar()
+
+    # Only committed groups are cached; a group created above may still be
+    # rolled back with the rest of its transaction
+    _cache(key, group_id)
+    return group_id
+
+
+def init_city_groups():
+    """
+    Add the city_key column and its unique index to an older database, and
+    give groups created before it existed (named "<city> Fitness Group")
+    their key. Must run inside an app context.
+    """
+    if add_missing_columns(db.session, Group):
+        print("✅ Added group.city_key")
+    groups = Group.query.filter(Group.city_key.is_(None), Group.name.like("% Fitness Group")).all()
+    taken = set(db.session.execute(select(Group.city_key).where(Group.city_key.isnot(None))).scalars())
+    for group in groups:
+        key = city_key(group.name[:-len(" Fitness Group")])
+        if key and key not in taken:
+            group.city_key = key
+            taken.add(key)
+    db.session.commit()
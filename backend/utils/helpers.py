@@ -1,4 +1,136 @@
+import base64
+import csv
+import io
+import json
+
+from sqlalchemy import inspect, text, update
+from sqlalchemy.exc import DBAPIError
+
 def calculate_bmi(weight, height):
     if not weight or not height:
         return None
     return round(weight / ((height / 100) ** 2), 2)
+
+def calculate_points(age, bmi):
+    """Leaderboard points: 10, plus more the younger and the lower the BMI"""
+    points = 10
+    if age:
+        points += max(0, 100 - age)
+    if bmi:
+        points += max(0, int(100 - bmi))
+    return int(points)
+
+def add_missing_columns(session, model):
+    """
+    Add model's columns and indexes missing from its existing table
+    (create_all() only creates whole tables); returns the added column
+    names. Safe to run from several processes at once: a column or index
+    another one added first is left alone.
+    """
+    bind = session.get_bind()
+    table = model.__table__
+    quote = bind.dialect.identifier_preparer.quote
+
+    def columns():
+        return {column["name"] for column in inspect(bind).get_columns(table.name)}
+
+    added = []
+    for column in table.columns:
+        if column.name in columns():
+            continue
+        try:
+            session.execute(text(
+                f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                f"{column.type.compile(dialect=bind.dialect)}"
+            ))
+            session.commit()
+            added.append(column.name)
+        except DBAPIError:
+            session.rollback()
+            if column.name not in columns():
+                raise
+
+    for index in table.indexes:
+        try:
+            index.create(bind, checkfirst=True)
+        except DBAPIError:
+            if index.name not in {existing["name"] for existing in inspect(bind).get_indexes(table.name)}:
+                raise
+    return added
+
+def encode_cursor(*values):
+    """Opaque pagination cursor for a keyset position"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Values passed to encode_cursor(); raises ValueError if the cursor is malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+def dialect_insert(session):
+    """
+    The INSERT construct for the session's database, with
+    on_conflict_do_update() on PostgreSQL and SQLite; None elsewhere
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+def increment_counts(session, model, key_column, count_column, deltas):
+    """
+    Add deltas ({key: delta}) to count_column of model's rows, inserting
+    missing keys, atomically per row. For use in flush hooks, on the
+    session's current connection.
+    """
+    conn = session.connection()
+    insert = dialect_insert(session)
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        if insert is not None:
+            stmt = insert(model).values({key_column.key: key, count_column.key: delta})
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=[key_column],
+                set_={count_column.key: count_column + delta},
+            ))
+            continue
+        updated = conn.execute(
+            update(model).where(key_column == key).values({count_column.key: count_column + delta})
+        )
+        if not updated.rowcount:
+            conn.execute(model.__table__.insert().values({key_column.key: key, count_column.key: delta}))
+
+def _pg_array(values):
+    """A PostgreSQL array literal, for COPY"""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'"{value}"' for value in escaped) + "}"
+
+def copy_rows(session, table, columns, rows):
+    """
+    Bulk-load rows (dicts) into table with PostgreSQL COPY, on the
+    session's connection and transaction (psycopg2). None is NULL and lists
+    become arrays.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            _pg_array(row[col]) if isinstance(row[col], list) else row[col]
+            for col in columns
+        )
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table}" ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
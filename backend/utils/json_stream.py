@@ -0,0 +1,190 @@
+"""
+Streamed JSON arrays for large list responses.
+
+Rows are read with yield_per (a server-side cursor on PostgreSQL) and each
+one is turned into JSON text by a RowEncoder, which is built once per model
+from its columns: a string prefix and a value encoder per field, picked from
+the column type. That skips the ORM objects, the to_dict() dicts and the
+generic json.dumps type dispatch. The array is written in chunks of about
+chunk_bytes, so a request holds one chunk and one fetch batch in memory
+whatever the number of rows.
+
+Bodies up to gzip_min_bytes are sent whole and uncompressed; larger ones are
+gzipped on the fly for clients that accept it.
+"""
+import json
+import zlib
+from datetime import date, datetime
+from json.encoder import encode_basestring_ascii
+
+from flask import Response, current_app, request, stream_with_context
+
+from models import db, User, UserProfile, ChatMessage
+
+NULL = "null"
+INFINITY = float("inf")
+
+
+def _encode_float(value):
+    # json.dumps's spelling, NaN and Infinity included
+    if value != value:
+        return "NaN"
+    if value in (INFINITY, -INFINITY):
+        return "Infinity" if value > 0 else "-Infinity"
+    return float.__repr__(value)
+
+
+def _encode_bool(value):
+    return "true" if value else "false"
+
+
+def _encode_isoformat(value):
+    return '"' + value.isoformat() + '"'
+
+
+def _value_encoder(column):
+    """Encoder for the values of a column, from its Python type"""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+    if python_type is bool:
+        return _encode_bool
+    if python_type is int:
+        return int.__repr__
+    if python_type is float:
+        return _encode_float
+    if python_type is str:
+        return encode_basestring_ascii
+    if python_type in (datetime, date):
+        return _encode_isoformat
+    # ARRAY, JSON and anything else
+    return json.dumps
+
+
+class RowEncoder:
+    """JSON object text for rows holding the given (key, column) fields, in order"""
+
+    def __init__(self, *fields):
+        self.keys = tuple(key for key, _ in fields)
+        self.columns = tuple(column for _, column in fields)
+        self._fields = tuple(
+            (encode_basestring_ascii(key) + ":", _value_encoder(column)) for key, column in fields
+        )
+
+    def members(self, values):
+        """The object's members without the braces, to nest or extend it"""
+        return ",".join(
+            prefix + (NULL if value is None else encode(value))
+            for (prefix, encode), value in zip(self._fields, values)
+        )
+
+    def encode(self, values):
+        return "{" + self.members(values) + "}"
+
+
+def _chunks(items, chunk_bytes):
+    buffer, size, separator = ["["], 1, ""
+    for item in items:
+        buffer.append(separator)
+        buffer.append(item)
+        separator = ","
+        size += len(item) + 1
+        if size >= chunk_bytes:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    buffer.append("]")
+    yield "".join(buffer).encode()
+
+
+def _gzipped(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)   # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_json_array(items, headers=None):
+    """
+    A response with the JSON texts in items as an array. Call it from a
+    view: the rest of items is consumed after the view returns, in the same
+    request context (and database transaction).
+    """
+    config = current_app.config
+    chunk_bytes = config.get("STREAM_CHUNK_BYTES", 65536)
+    gzip_min_bytes = config.get("STREAM_GZIP_MIN_BYTES", 16384)
+
+    # Read up to the gzip threshold: small bodies go out whole
+    chunks = _chunks(items, chunk_bytes)
+    head, size = [], 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size > gzip_min_bytes:
+            break
+    else:
+        response = Response(b"".join(head), mimetype="application/json", headers=headers)
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def body():
+        yield from head
+        yield from chunks
+
+    if gzip_min_bytes and "gzip" in request.accept_encodings:
+        response = Response(stream_with_context(_gzipped(body(), config.get("STREAM_GZIP_LEVEL", 6))),
+                            mimetype="application/json", headers=headers)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(stream_with_context(body()), mimetype="application/json", headers=headers)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def wants_stream():
+    return request.args.get("stream") in ("1", "true")
+
+
+def stream_rows(statement):
+    """The rows of a select, fetched STREAM_YIELD_PER at a time"""
+    yield_per = current_app.config.get("STREAM_YIELD_PER", 1000)
+    return db.session.execute(statement.execution_options(yield_per=yield_per))
+
+
+# Encoders for the streamed endpoints; output matches the models' to_dict()
+
+USER_JSON = RowEncoder(
+    ("id", User.id), ("username", User.username), ("surname", User.surname), ("phone", User.phone),
+)
+PROFILE_JSON = RowEncoder(
+    ("age", UserProfile.age), ("weight", UserProfile.weight), ("height", UserProfile.height),
+    ("fitness_level", UserProfile.fitness_level), ("goals", UserProfile.goals), ("bmi", UserProfile.bmi),
+    ("city", UserProfile.city),
+)
+CHAT_MESSAGE_JSON = RowEncoder(
+    ("id", ChatMessage.id), ("groupId", ChatMessage.group_id), ("userId", ChatMessage.user_id),
+    ("username", ChatMessage.username), ("message", ChatMessage.message), ("timestamp", ChatMessage.timestamp),
+)
+
+# Select these (users outer-joined to their profile) for encode_user_with_profile
+USER_WITH_PROFILE_COLUMNS = USER_JSON.columns + (UserProfile.id,) + PROFILE_JSON.columns
+_PROFILE_START = len(USER_JSON.columns) + 1
+
+
+def encode_user_with_profile(row):
+    """User.to_dict(include_profile=True) as JSON text, from USER_WITH_PROFILE_COLUMNS"""
+    user = USER_JSON.members(row)
+    if row[_PROFILE_START - 1] is None:
+        return "{" + user + "}"
+    return "{" + user + ',"profile":' + PROFILE_JSON.encode(row[_PROFILE_START:]) + "}"
+
+
+def distinct_users(rows):
+    """Skip the extra rows of users joined to several profiles (they are adjacent in id order)"""
+    last_id = None
+    for row in rows:
+        if row[0] != last_id:
+            last_id = row[0]
+            yield row
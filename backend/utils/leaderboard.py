@@ -0,0 +1,290 @@
+"""
+Materialized leaderboard.
+
+LeaderboardEntry holds every user's points, indexed in leaderboard order,
+and LeaderboardBucket counts users per points value. Both are kept up to
+date by session hooks in the same transaction as the User/UserProfile
+change, so reads never recompute points. Ranks are competition style (ties
+share a rank): one plus the members of every bucket above, a sum over a few
+hundred rows at most whatever the number of users.
+
+At startup both are checked against the users and repaired in place: only
+entries whose points differ are written, and buckets are recounted with
+UPDATE/upsert. Nothing is deleted wholesale, so workers booting together
+don't collide and increments committed meanwhile aren't lost.
+"""
+from collections import Counter
+
+from sqlalchemy import and_, delete, event, func, inspect, or_, select, update
+from sqlalchemy.orm import joinedload
+
+from models import db, User, UserProfile, LeaderboardEntry, LeaderboardBucket
+from utils.helpers import calculate_points, decode_cursor, dialect_insert, encode_cursor, increment_counts
+from utils.json_stream import USER_WITH_PROFILE_COLUMNS, encode_user_with_profile, stream_rows
+
+REBUILD_CHUNK = 10000
+
+
+def _profile_points(profile):
+    if profile is None:
+        return calculate_points(None, None)
+    return calculate_points(profile.age, profile.bmi)
+
+
+def _set_points(session, deltas, user_id, points, user=None):
+    entry = session.get(LeaderboardEntry, user_id) if user_id is not None else None
+    if entry is None:
+        session.add(LeaderboardEntry(user_id=user_id, user=user, points=points))
+        deltas[points] += 1
+    elif entry.points != points:
+        deltas[entry.points] -= 1
+        deltas[points] += 1
+        entry.points = points
+
+
+def _collect_leaderboard_changes(session, flush_context, instances):
+    deltas = session.info.setdefault("leaderboard_deltas", Counter())
+    with session.no_autoflush:
+        new_users = [obj for obj in session.new if isinstance(obj, User)]
+        for user in new_users:
+            _set_points(session, deltas, user.id, _profile_points(user.profile), user=user)
+
+        for obj in session.deleted:
+            if isinstance(obj, User):
+                entry = session.get(LeaderboardEntry, obj.id)
+                if entry is not None:
+                    deltas[entry.points] -= 1
+                    session.delete(entry)
+
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, UserProfile) or obj.user in new_users:
+                continue
+            user_id = obj.user_id if obj.user_id is not None else (obj.user.id if obj.user else None)
+            if user_id is None:
+                continue
+            if obj in session.deleted:
+                _set_points(session, deltas, user_id, _profile_points(None))
+            elif obj in session.new or any(
+                inspect(obj).attrs[key].history.has_changes() for key in ("age", "bmi", "user_id")
+            ):
+                _set_points(session, deltas, user_id, _profile_points(obj))
+
+
+def _apply_bucket_deltas(session, flush_context):
+    deltas = session.info.pop("leaderboard_deltas", None)
+    if deltas:
+        increment_counts(session, LeaderboardBucket, LeaderboardBucket.points, LeaderboardBucket.members, deltas)
+
+
+def _discard_bucket_deltas(session, previous_transaction=None):
+    session.info.pop("leaderboard_deltas", None)
+
+
+def _upsert(model, key_column, rows):
+    """Insert rows, overwriting the existing ones with the same key"""
+    insert = dialect_insert(db.session)
+    if insert is None:
+        for row in rows:
+            key = row[key_column.key]
+            if not db.session.execute(update(model).where(key_column == key).values(row)).rowcount:
+                db.session.execute(model.__table__.insert().values(row))
+        return
+    stmt = insert(model).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={column: stmt.excluded[column] for column in rows[0] if column != key_column.key},
+    ))
+
+
+def rebuild_buckets():
+    """
+    Recount LeaderboardBucket from the entries in place (fixes drift from
+    racing updates); returns how many buckets were off
+    """
+    actual = (
+        select(func.count()).where(LeaderboardEntry.points == LeaderboardBucket.points)
+        .correlate(LeaderboardBucket).scalar_subquery()
+    )
+    fixed = db.session.execute(
+        update(LeaderboardBucket).where(LeaderboardBucket.members != actual).values(members=actual)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    missing = db.session.execute(
+        select(LeaderboardEntry.points, func.count())
+        .where(LeaderboardEntry.points.not_in(select(LeaderboardBucket.points)))
+        .group_by(LeaderboardEntry.points)
+    ).all()
+    if missing:
+        _upsert(LeaderboardBucket, LeaderboardBucket.points,
+                [{"points": points, "members": members} for points, members in missing])
+    db.session.commit()
+    return fixed + len(missing)
+
+
+def rebuild_leaderboard():
+    """
+    Bring every user's entry in line with their points, streaming users in
+    chunks and writing only the entries that are missing or wrong; returns
+    how many were repaired
+    """
+    db.session.execute(
+        delete(LeaderboardEntry).where(LeaderboardEntry.user_id.not_in(select(User.id)))
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.session.execute(
+        select(User.id, UserProfile.age, UserProfile.bmi, LeaderboardEntry.points)
+        .outerjoin(UserProfile, UserProfile.user_id == User.id)
+        .outerjoin(LeaderboardEntry, LeaderboardEntry.user_id == User.id)
+        .order_by(User.id)
+        .execution_options(yield_per=REBUILD_CHUNK)
+    )
+    repairs, total = [], 0
+    last_user_id = None
+    for user_id, age, bmi, points in rows:
+        # A user with several profile rows counts once, like User.profile
+        if user_id == last_user_id:
+            continue
+        last_user_id = user_id
+        expected = calculate_points(age, bmi)
+        if points != expected:
+            repairs.append({"user_id": user_id, "points": expected})
+        if len(repairs) >= REBUILD_CHUNK:
+            _upsert(LeaderboardEntry, LeaderboardEntry.user_id, repairs)
+            total += len(repairs)
+            repairs = []
+    if repairs:
+        _upsert(LeaderboardEntry, LeaderboardEntry.user_id, repairs)
+        total += len(repairs)
+    rebuild_buckets()
+    return total
+
+
+def init_leaderboard():
+    """
+    Keep the leaderboard in sync with User/UserProfile changes, repairing
+    it first if it doesn't cover every user. Must run inside an app context.
+    """
+    if not event.contains(db.session, "before_flush", _collect_leaderboard_changes):
+        event.listen(db.session, "before_flush", _collect_leaderboard_changes)
+        event.listen(db.session, "after_flush", _apply_bucket_deltas)
+        event.listen(db.session, "after_soft_rollback", _discard_bucket_deltas)
+
+    users = db.session.query(func.count(User.id)).scalar()
+    entries = db.session.query(func.count(LeaderboardEntry.user_id)).scalar()
+    if users != entries:
+        total = rebuild_leaderboard()
+        print(f"✅ Leaderboard entries repaired for {total} users")
+    else:
+        rebuild_buckets()
+
+
+def _ranks():
+    """points -> competition rank, from the buckets"""
+    buckets = db.session.execute(
+        select(LeaderboardBucket.points, LeaderboardBucket.members)
+        .where(LeaderboardBucket.members > 0)
+        .order_by(LeaderboardBucket.points.desc())
+    ).all()
+    ranks, above = {}, 0
+    for points, members in buckets:
+        ranks[points] = above + 1
+        above += members
+    return ranks
+
+
+def _serialize(entries, ranks):
+    users = User.query.options(joinedload(User.profile)).filter(
+        User.id.in_([entry.user_id for entry in entries])
+    ).all()
+    by_id = {user.id: user for user in users}
+    return [
+        {"user": by_id[entry.user_id].to_dict(include_profile=True),
+         "points": entry.points,
+         "rank": ranks.get(entry.points)}
+        for entry in entries if entry.user_id in by_id
+    ]
+
+
+def _after(points, user_id):
+    """Entries ranked below (points, user_id)"""
+    return or_(
+        LeaderboardEntry.points < points,
+        and_(LeaderboardEntry.points == points, LeaderboardEntry.user_id > user_id),
+    )
+
+
+def top(limit, offset=0, cursor=None):
+    """
+    One page of the leaderboard and the cursor of the next one (None at
+    the end). A cursor seeks through the rank index, so deep pages cost the
+    same as the first; offset is kept for simple clients.
+    """
+    query = select(LeaderboardEntry).order_by(LeaderboardEntry.points.desc(), LeaderboardEntry.user_id)
+    if cursor:
+        points, user_id = decode_cursor(cursor)
+        query = query.where(_after(int(points), int(user_id)))
+    elif offset:
+        query = query.offset(offset)
+    entries = db.session.execute(query.limit(limit + 1)).scalars().all()
+
+    next_cursor = encode_cursor(entries[limit - 1].points, entries[limit - 1].user_id) if len(entries) > limit else None
+    entries = entries[:limit]
+    return _serialize(entries, _ranks()), next_cursor
+
+
+def stream(cursor=None):
+    """
+    JSON text of every entry from the top (or after cursor), for
+    json_stream.stream_json_array; rows are read STREAM_YIELD_PER at a time
+    """
+    query = (
+        select(LeaderboardEntry.points, *USER_WITH_PROFILE_COLUMNS)
+        .join(User, User.id == LeaderboardEntry.user_id)
+        .outerjoin(UserProfile, UserProfile.user_id == User.id)
+        .order_by(LeaderboardEntry.points.desc(), LeaderboardEntry.user_id)
+    )
+    if cursor:
+        points, user_id = decode_cursor(cursor)
+        query = query.where(_after(int(points), int(user_id)))
+    ranks = _ranks()
+    rows = stream_rows(query)
+
+    def entries():
+        last_id = None
+        for row in rows:
+            if row[1] == last_id:
+                continue
+            last_id = row[1]
+            yield ('{"user":' + encode_user_with_profile(row[1:]) + ',"points":' + str(row[0])
+                   + ',"rank":' + str(ranks.get(row[0], "null")) + "}")
+    return entries()
+
+
+def around(user_id, radius):
+    """The user's entry with up to radius entries above and below, or None"""
+    entry = db.session.get(LeaderboardEntry, user_id)
+    if entry is None:
+        return None
+
+    above = db.session.execute(
+        select(LeaderboardEntry)
+        .where(or_(
+            LeaderboardEntry.points > entry.points,
+            and_(LeaderboardEntry.points == entry.points, LeaderboardEntry.user_id < entry.user_id),
+        ))
+        .order_by(LeaderboardEntry.points, LeaderboardEntry.user_id.desc())
+        .limit(radius)
+    ).scalars().all()
+    below = db.session.execute(
+        select(LeaderboardEntry)
+        .where(_after(entry.points, entry.user_id))
+        .order_by(LeaderboardEntry.points.desc(), LeaderboardEntry.user_id)
+        .limit(radius)
+    ).scalars().all()
+
+    ranks = _ranks()
+    return {
+        "rank": ranks.get(entry.points),
+        "points": entry.points,
+        "entries": _serialize(list(reversed(above)) + [entry] + below, ranks),
+    }
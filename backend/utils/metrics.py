@@ -0,0 +1,209 @@
+"""
+Request instrumentation.
+
+RequestMetrics records, per route (the URL rule, so ids don't multiply
+series) and method: a latency histogram, status counts, response sizes and
+requests in flight. GET /metrics serves them, plus any stats registered
+with add_stats(), in the Prometheus text format.
+
+Access logs are JSON lines on the "access" logger, for a sample of requests
+(access_log_sample_rate) and every failed or slow one. They are written by
+a QueueListener thread, so requests never wait on stdout. Headers and
+bodies aren't logged.
+"""
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import Response, g, request
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+access_log = logging.getLogger("access")
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+class _RouteStats:
+    __slots__ = ("buckets", "count", "seconds", "bytes", "statuses", "in_flight")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.statuses = {}
+        self.in_flight = 0
+
+
+class RequestMetrics:
+    def __init__(self, access_log_sample_rate=0.01, slow_request_ms=1000):
+        self.access_log_sample_rate = access_log_sample_rate
+        self.slow_request_ms = slow_request_ms
+        self._lock = threading.Lock()
+        self._routes = {}    # (blueprint, route, method) -> _RouteStats
+        self._stats = {}     # metric prefix -> function returning a stats dict
+        self._listener = None
+
+    def init_app(self, app):
+        """Instrument every request, log a sample and serve GET /metrics"""
+        self.access_log_sample_rate = app.config.get("ACCESS_LOG_SAMPLE_RATE", self.access_log_sample_rate)
+        self.slow_request_ms = app.config.get("ACCESS_LOG_SLOW_MS", self.slow_request_ms)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+
+        if self._listener is None:
+            records = queue.SimpleQueue()
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._listener = QueueListener(records, handler)
+            self._listener.start()
+            access_log.addHandler(QueueHandler(records))
+            access_log.setLevel(logging.INFO)
+            access_log.propagate = False
+
+    def add_stats(self, prefix, stats):
+        """Export stats() (a flat dict) as <prefix>_<key> gauges; non-numbers are skipped"""
+        self._stats[prefix] = stats
+
+    def _key(self):
+        rule = request.url_rule
+        return (request.blueprint or "", rule.rule if rule else "<unmatched>", request.method)
+
+    def _route(self, key):
+        route = self._routes.get(key)
+        if route is None:
+            with self._lock:
+                route = self._routes.setdefault(key, _RouteStats())
+        return route
+
+    def _start(self):
+        g.metrics_key = self._key()
+        g.metrics_start = time.perf_counter()
+        route = self._route(g.metrics_key)
+        with self._lock:
+            route.in_flight += 1
+
+    def _finish(self, response):
+        g.metrics_status = response.status_code
+        if response.is_streamed:
+            # Counted as it is sent, after the request is torn down: measuring
+            # up front would buffer the whole body (and never return for SSE)
+            response.response = self._counted(response.response, self._route(g.metrics_key))
+        else:
+            g.metrics_bytes = response.calculate_content_length() or 0
+        return response
+
+    def _counted(self, chunks, route):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                route.bytes += size
+
+    def _teardown(self, error=None):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        status = g.pop("metrics_status", 500)
+        size = g.pop("metrics_bytes", 0)
+        route = self._route(g.metrics_key)
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            route.in_flight -= 1
+            route.buckets[bucket] += 1
+            route.count += 1
+            route.seconds += seconds
+            route.bytes += size
+            route.statuses[status] = route.statuses.get(status, 0) + 1
+
+        ms = seconds * 1000
+        if status >= 500 or ms >= self.slow_request_ms or random.random() < self.access_log_sample_rate:
+            identity = g.get("identity")
+            access_log.info(json.dumps({
+                "ts": round(time.time(), 3),
+                "method": request.method,
+                "path": request.path,
+                "route": g.metrics_key[1],
+                "status": status,
+                "duration_ms": round(ms, 2),
+                "bytes": size,
+                "remote_addr": request.remote_addr,
+                "user_id": identity.user_id if identity else None,
+                "error": repr(error) if error else None,
+            }))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            routes = [(key, route.buckets[:], route.count, route.seconds, route.bytes,
+                       dict(route.statuses), route.in_flight)
+                      for key, route in self._routes.items()]
+
+        lines = [
+            "# HELP http_requests_in_flight Requests being handled",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        for (blueprint, rule, method), _, _, _, _, _, in_flight in routes:
+            labels = _labels(blueprint=blueprint, route=rule, method=method)
+            lines.append(f"http_requests_in_flight{labels} {in_flight}")
+
+        lines += ["# HELP http_requests_total Requests handled, by status",
+                  "# TYPE http_requests_total counter"]
+        for (blueprint, rule, method), _, _, _, _, statuses, _ in routes:
+            for status, count in sorted(statuses.items()):
+                labels = _labels(blueprint=blueprint, route=rule, method=method, status=status)
+                lines.append(f"http_requests_total{labels} {count}")
+
+        lines += ["# HELP http_request_duration_seconds Time to produce the response",
+                  "# TYPE http_request_duration_seconds histogram"]
+        for (blueprint, rule, method), buckets, count, seconds, _, _, _ in routes:
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket_count
+                labels = _labels(blueprint=blueprint, route=rule, method=method, le=bound)
+                lines.append(f"http_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(blueprint=blueprint, route=rule, method=method)
+            lines.append(f"http_request_duration_seconds_sum{labels} {seconds:.6f}")
+            lines.append(f"http_request_duration_seconds_count{labels} {count}")
+
+        lines += ["# HELP http_response_size_bytes Response body sizes",
+                  "# TYPE http_response_size_bytes summary"]
+        for (blueprint, rule, method), _, count, _, size, _, _ in routes:
+            labels = _labels(blueprint=blueprint, route=rule, method=method)
+            lines.append(f"http_response_size_bytes_sum{labels} {size}")
+            lines.append(f"http_response_size_bytes_count{labels} {count}")
+
+        for prefix, stats in self._stats.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _metrics_view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,180 @@
+"""
+Opt-in SQL profiler (QUERY_PROFILER=1).
+
+Counts and times every statement a request runs, grouped by shape (the SQL
+with literals and IN lists collapsed). A shape run n_plus_one_threshold
+times or more in one request is flagged as a likely N+1: a lazy load or
+per-row query inside a loop. Each response gets
+
+    X-Query-Count: 12
+    Server-Timing: db;dur=3.41;desc="12 queries, 1 N+1"
+
+and GET /api/debug/queries lists the slowest shapes of recent requests.
+
+max_queries() works without the profiler being enabled, for tests:
+
+    with max_queries(3):
+        client.get("/api/users")
+"""
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_current = ContextVar("query_profile", default=None)
+_watchers = set()
+_watchers_lock = threading.Lock()
+_listening = False
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """The statement's shape: literals become ?, IN (...) lists become (?)"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class QueryProfile:
+    """Statements seen in one request (or one max_queries() block), by shape"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}   # shape -> [count, seconds]
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        shape = self.shapes.setdefault(normalize(sql), [0, 0.0])
+        shape[0] += 1
+        shape[1] += seconds
+
+    def repeated(self, threshold):
+        """(shape, count) run at least threshold times, most repeated first"""
+        return sorted(((shape, stats[0]) for shape, stats in self.shapes.items() if stats[0] >= threshold),
+                      key=lambda item: -item[1])
+
+    def to_dict(self, threshold, top=10):
+        slowest = sorted(self.shapes.items(), key=lambda item: -item[1][1])[:top]
+        return {
+            "request": self.label,
+            "queries": self.count,
+            "db_ms": round(self.seconds * 1000, 3),
+            "n_plus_one": [{"sql": shape, "count": count} for shape, count in self.repeated(threshold)],
+            "slowest": [{"sql": shape, "count": count, "ms": round(seconds * 1000, 3)}
+                        for shape, (count, seconds) in slowest],
+        }
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the statement's own context: one that raises is simply never timed
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    profile = _current.get()
+    if profile is not None:
+        profile.record(statement, seconds)
+    if _watchers:
+        with _watchers_lock:
+            for watcher in _watchers:
+                watcher.record(statement, seconds)
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+        _listening = True
+
+
+class QueryProfiler:
+    def __init__(self, n_plus_one_threshold=5, history=100):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.recent = deque(maxlen=history)
+        self.enabled = False
+
+    def init_app(self, app):
+        """Profile every request if QUERY_PROFILER is set"""
+        self.enabled = app.config.get("QUERY_PROFILER", False)
+        self.n_plus_one_threshold = app.config.get("QUERY_PROFILER_N_PLUS_ONE", self.n_plus_one_threshold)
+        if not self.enabled:
+            return
+        _listen()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule("/api/debug/queries", "debug_queries", self._debug_view)
+
+    def _start(self):
+        g.query_profile_token = _current.set(QueryProfile(f"{request.method} {request.path}"))
+
+    def _finish(self, response):
+        profile = _current.get()
+        if profile is None:
+            return response
+        repeated = profile.repeated(self.n_plus_one_threshold)
+        response.headers["X-Query-Count"] = str(profile.count)
+        response.headers["Server-Timing"] = (
+            f'db;dur={profile.seconds * 1000:.2f};desc="{profile.count} queries, {len(repeated)} N+1"'
+        )
+        for shape, count in repeated:
+            print(f"⚠️ Possible N+1 in {profile.label}: {count}x {shape[:200]}")
+        if request.endpoint != "debug_queries":
+            self.recent.append(profile)
+        return response
+
+    def _teardown(self, error=None):
+        token = g.pop("query_profile_token", None)
+        if token is not None:
+            _current.reset(token)
+
+    def _debug_view(self):
+        # ?n_plus_one=1 keeps only requests with a flagged shape
+        profiles = [p.to_dict(self.n_plus_one_threshold) for p in reversed(self.recent)]
+        if request.args.get("n_plus_one"):
+            profiles = [p for p in profiles if p["n_plus_one"]]
+        return jsonify(profiles), 200
+
+
+query_profiler = QueryProfiler()
+
+
+@contextmanager
+def max_queries(limit):
+    """
+    Fail with AssertionError if the block runs more than limit statements,
+    listing them by shape. Counts statements from every thread.
+    """
+    _listen()
+    profile = QueryProfile("max_queries")
+    with _watchers_lock:
+        _watchers.add(profile)
+    try:
+        yield profile
+    finally:
+        with _watchers_lock:
+            _watchers.discard(profile)
+    if profile.count > limit:
+        shapes = "\n".join(f"  {stats[0]}x {shape}" for shape, stats in
+                           sorted(profile.shapes.items(), key=lambda item: -item[1][0]))
+        raise AssertionError(f"{profile.count} queries run, at most {limit} expected:\n{shapes}")
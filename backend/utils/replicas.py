@@ -0,0 +1,49 @@
+"""
+Read-replica routing for the Flask-SQLAlchemy session.
+
+Replicas are the binds named "replica_<n>" (Config builds them from
+DATABASE_REPLICA_URLS). During a GET, HEAD or OPTIONS request, SELECTs go
+to one replica, picked round-robin when the request first reads and kept
+for the rest of it, so the request sees one consistent snapshot. Anything
+else (flushes, INSERT/UPDATE/DELETE, text() statements) goes to the
+primary, and once a request has done that, its later reads do too, so it
+reads its own writes. Other requests, CLI jobs and background threads only
+use the primary.
+
+Replicas may lag the primary: a client reading right after its own write
+in a previous request can still see old data.
+"""
+import itertools
+import threading
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql import CompoundSelect, Select
+
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_rotation = {"keys": None, "cycle": None}
+_rotation_lock = threading.Lock()
+
+
+def _next_replica(keys):
+    with _rotation_lock:
+        if _rotation["keys"] != keys:
+            _rotation["keys"], _rotation["cycle"] = keys, itertools.cycle(keys)
+        return next(_rotation["cycle"])
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get("primary_only"):
+            if self._flushing or not isinstance(clause, (Select, CompoundSelect)):
+                self.info["primary_only"] = True
+            elif has_request_context() and request.method in READ_ONLY_METHODS:
+                engines = self._db.engines
+                replica = self.info.get("replica")
+                if replica is None:
+                    keys = tuple(sorted(key for key in engines if key and key.startswith("replica_")))
+                    replica = self.info["replica"] = _next_replica(keys) if keys else False
+                if replica:
+                    return engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,188 @@
+"""
+Response cache for read-mostly GET endpoints.
+
+    @community_bp.route("/community/groups", methods=["GET"])
+    @response_cache.cached(Group)
+    def get_groups(): ...
+
+The serialized body of a 200 response is kept per endpoint and query
+string with a strong ETag; a request whose If-None-Match matches gets a
+304 without the view running. Entries are tagged with the tables of the
+models given to cached() and dropped when a session commits an insert,
+update or delete of one of those models.
+
+Writes that bypass the ORM session (raw SQL, bulk inserts) and writes made
+by other processes aren't seen, so entries also expire after ttl seconds.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+from sqlalchemy import event
+
+from models import db
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = True
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (body, etag, mimetype, tags, expires_at)
+        self._tagged = {}               # tag -> keys
+        self._generations = {}          # tag -> writes seen, to spot races with a miss
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_served = 0
+        self.bytes_saved = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        """Configure from RESPONSE_CACHE_* and invalidate on committed writes"""
+        self.enabled = app.config.get("RESPONSE_CACHE", self.enabled)
+        self.max_entries = app.config.get("RESPONSE_CACHE_MAX_ENTRIES", self.max_entries)
+        self.ttl = app.config.get("RESPONSE_CACHE_TTL", self.ttl)
+        if not event.contains(db.session, "after_flush", self._collect_written_tags):
+            event.listen(db.session, "after_flush", self._collect_written_tags)
+            event.listen(db.session, "after_commit", self._invalidate_written_tags)
+            event.listen(db.session, "after_soft_rollback", self._discard_written_tags)
+
+    # Invalidation
+
+    def _collect_written_tags(self, session, flush_context):
+        tags = session.info.setdefault("response_cache_tags", set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            table = getattr(obj, "__tablename__", None)
+            if table:
+                tags.add(table)
+
+    def _invalidate_written_tags(self, session):
+        tags = session.info.pop("response_cache_tags", None)
+        if tags:
+            self.invalidate(*tags)
+
+    def _discard_written_tags(self, session, previous_transaction=None):
+        session.info.pop("response_cache_tags", None)
+
+    def invalidate(self, *tags):
+        """Drop every entry tagged with one of tags"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in self._tagged.pop(tag, ()):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for tag in list(self._tagged):
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self._entries.clear()
+            self._tagged.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[3]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    # Lookup and storage
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[4] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, body, etag, mimetype, tags, generations):
+        with self._lock:
+            # A write committed while the view ran; its result may predate it
+            if any(self._generations.get(tag, 0) != generations[tag] for tag in tags):
+                return
+            self._drop(key)
+            self._entries[key] = (body, etag, mimetype, tags, time.monotonic() + self.ttl)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _respond(self, body, etag, mimetype):
+        if request.if_none_match.contains(etag):
+            with self._lock:
+                self.not_modified += 1
+                self.bytes_saved += len(body)
+            response = make_response("", 304)
+        else:
+            response = make_response(body, 200)
+            response.mimetype = mimetype
+        response.set_etag(etag)
+        # Clients may keep the body but should revalidate it every time
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def cached(self, *models):
+        """Decorator caching a GET view's 200 responses, invalidated by writes to models"""
+        tags = tuple(model.__tablename__ for model in models)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method != "GET":
+                    return view(*args, **kwargs)
+
+                key = (request.endpoint, tuple(sorted((request.view_args or {}).items())),
+                       tuple(sorted(request.args.items(multi=True))))
+                entry = self._get(key)
+                if entry is not None:
+                    body, etag, mimetype = entry[:3]
+                    with self._lock:
+                        self.hits += 1
+                        self.bytes_served += len(body)
+                    return self._respond(body, etag, mimetype)
+
+                with self._lock:
+                    self.misses += 1
+                    generations = {tag: self._generations.get(tag, 0) for tag in tags}
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha1(body).hexdigest()
+                self._put(key, body, etag, response.mimetype, tags, generations)
+                return self._respond(body, etag, response.mimetype)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "bytes_served_from_cache": self.bytes_served,
+                "bytes_saved_by_304": self.bytes_saved,
+                "invalidations": self.invalidations,
+            }
+
+
+response_cache = ResponseCache()
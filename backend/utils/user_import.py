@@ -0,0 +1,317 @@
+"""
+Bulk user import.
+
+Rows come from a CSV (header row) or NDJSON stream and are processed in
+batches: validated, checked for duplicate usernames/phones with one query
+per batch, password-hashed in a process pool and inserted with one
+statement per table (COPY on PostgreSQL). Hashing of the next batch runs
+while the current one is written. Each batch is its own transaction.
+
+Columns: username, surname, phone, password (required); age, weight,
+height, fitness_level, city, goals (";"-separated in CSV, a list in
+NDJSON) and the lifestyle stats (optional). Users with any profile column
+get a UserProfile with its BMI, city group and ML cohort.
+
+The inserts skip the session hooks, so the leaderboard, stats counters
+and cohort/similar-user indexes are updated here instead.
+"""
+import csv
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from types import SimpleNamespace
+
+from sqlalchemy import insert, or_, select, text
+from werkzeug.security import generate_password_hash
+
+from models import db, User, UserProfile, LeaderboardEntry, LeaderboardBucket, CommunityCounter
+from utils.fitness import LIFESTYLE_FIELDS, ml_service, profile_features
+from utils.groups import group_for_city
+from utils.helpers import calculate_bmi, calculate_points, copy_rows, increment_counts
+
+USER_FIELDS = ("username", "surname", "phone", "password")
+PROFILE_FIELDS = ("age", "weight", "height", "fitness_level", "city", "goals", *LIFESTYLE_FIELDS)
+FLOAT_FIELDS = ("weight", "height", *LIFESTYLE_FIELDS)
+USER_COLUMNS = ("id", "username", "surname", "phone", "password_hash")
+PROFILE_COLUMNS = ("user_id", "age", "weight", "height", "fitness_level", "goals", "bmi", "city",
+                   "group_id", "join_date", *LIFESTYLE_FIELDS, "fitness_category", "fitness_goal")
+
+
+def _max_lengths(model, fields):
+    """{field: length} for the fields stored in length-limited String columns of model"""
+    columns = model.__table__.columns
+    return {field: columns[field].type.length for field in fields
+            if field in columns and getattr(columns[field].type, "length", None)}
+
+
+# Checked up front: one over-long value would otherwise fail its whole batch
+MAX_LENGTHS = {**_max_lengths(User, USER_FIELDS), **_max_lengths(UserProfile, PROFILE_FIELDS)}
+
+# Row errors reported back in full; later ones are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+def read_rows(stream, fmt):
+    """Yield (line, row dict or error string) from a text stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    if fmt != "ndjson":
+        raise ValueError(f"Unsupported import format: {fmt}")
+    for line, raw in enumerate(stream, 1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as e:
+            yield line, f"Invalid JSON: {e}"
+            continue
+        yield line, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+def _blank(value):
+    return value is None or isinstance(value, str) and not value.strip()
+
+
+def _check_length(field, value):
+    limit = MAX_LENGTHS.get(field)
+    if limit is not None and len(value) > limit:
+        raise ValueError(f"{field} longer than {limit} characters")
+
+
+def parse_row(row):
+    """(user dict, profile dict or None) from an input row; raises ValueError"""
+    user = {}
+    for field in USER_FIELDS:
+        if _blank(row.get(field)):
+            raise ValueError(f"Missing {field}")
+        user[field] = str(row[field]).strip()
+        _check_length(field, user[field])
+
+    profile = {}
+    for field in PROFILE_FIELDS:
+        value = row.get(field)
+        if _blank(value):
+            continue
+        try:
+            if field == "age":
+                profile[field] = int(value)
+            elif field in FLOAT_FIELDS:
+                profile[field] = float(value)
+            elif field == "goals":
+                goals = value.split(";") if isinstance(value, str) else list(value)
+                profile[field] = [str(goal).strip() for goal in goals if str(goal).strip()]
+            else:
+                profile[field] = str(value).strip()
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {field}: {value!r}")
+        if isinstance(profile[field], str):
+            _check_length(field, profile[field])
+    return user, profile or None
+
+
+def _hash_passwords(passwords):
+    return [generate_password_hash(password) for password in passwords]
+
+
+class UserImporter:
+    def __init__(self, batch_size=1000, workers=None, use_copy=None):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count()
+        self.use_copy = use_copy
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+
+    def _error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def _batches(self, rows):
+        batch = []
+        for line, row in rows:
+            if isinstance(row, str):
+                self._error(line, row)
+                continue
+            try:
+                user, profile = parse_row(row)
+            except ValueError as e:
+                self._error(line, str(e))
+                continue
+            batch.append((line, user, profile))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _new_rows(self, batch, seen_usernames, seen_phones):
+        """The batch without duplicates of existing users or earlier rows"""
+        usernames = [user["username"] for _, user, _ in batch]
+        phones = [user["phone"] for _, user, _ in batch]
+        existing = db.session.execute(
+            select(User.username, User.phone).where(or_(User.username.in_(usernames), User.phone.in_(phones)))
+        ).all()
+        taken_usernames = {username for username, _ in existing}
+        taken_phones = {phone for _, phone in existing}
+
+        rows = []
+        for line, user, profile in batch:
+            if user["username"] in taken_usernames or user["username"] in seen_usernames:
+                self.skipped += 1
+                self._error(line, f"Username {user['username']} already exists")
+            elif user["phone"] in taken_phones or user["phone"] in seen_phones:
+                self.skipped += 1
+                self._error(line, f"Phone {user['phone']} already exists")
+            else:
+                seen_usernames.add(user["username"])
+                seen_phones.add(user["phone"])
+                rows.append((line, user, profile))
+        return rows
+
+    def _reserve_ids(self, table, n):
+        rows = db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :n)"),
+            {"table": f'"{table}"', "n": n},
+        )
+        return [row[0] for row in rows]
+
+    def _insert_users(self, users):
+        """Insert users (dicts without id), returning their ids in order"""
+        if self.use_copy:
+            ids = self._reserve_ids("user", len(users))
+            copy_rows(db.session, "user", USER_COLUMNS,
+                      [{"id": user_id, **user} for user_id, user in zip(ids, users)])
+            return ids
+        result = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True), users
+        )
+        return [row[0] for row in result]
+
+    def _profiles(self, rows, user_ids):
+        """UserProfile column dicts for the rows that have profile data"""
+        profiles = []
+        for (_, _, data), user_id in zip(rows, user_ids):
+            if data is None:
+                continue
+            profile = {col: None for col in PROFILE_COLUMNS}
+            profile.update(data)
+            profile["user_id"] = user_id
+            profile["goals"] = data.get("goals", [])
+            profile["bmi"] = calculate_bmi(profile["weight"], profile["height"])
+            profile["join_date"] = date.today()
+            if profile["city"]:
+                profile["group_id"] = group_for_city(profile["city"])
+            profiles.append(profile)
+
+        # Cohorts in one batched prediction; without models they stay unset
+        try:
+            labels = ml_service.predict_labels_many(
+                [profile_features(SimpleNamespace(**profile)) for profile in profiles], apply_defaults=True
+            )
+        except Exception as e:
+            print(f"⚠️ Imported profiles left without a cohort: {e}")
+            labels = [None] * len(profiles)
+        for profile, label in zip(profiles, labels):
+            if label is not None:
+                profile["fitness_category"], profile["fitness_goal"] = str(label[0]), str(label[1])
+        return profiles
+
+    def _write_batch(self, rows, hashes):
+        users = [
+            {"username": user["username"], "surname": user["surname"], "phone": user["phone"],
+             "password_hash": password_hash}
+            for (_, user, _), password_hash in zip(rows, hashes)
+        ]
+        user_ids = self._insert_users(users)
+        profiles = self._profiles(rows, user_ids)
+        if profiles:
+            if self.use_copy:
+                copy_rows(db.session, "user_profile", PROFILE_COLUMNS, profiles)
+            else:
+                db.session.execute(insert(UserProfile), profiles)
+
+        # What the session hooks would have done for ORM inserts
+        points = {user_id: calculate_points(None, None) for user_id in user_ids}
+        for profile in profiles:
+            points[profile["user_id"]] = calculate_points(profile["age"], profile["bmi"])
+        db.session.execute(insert(LeaderboardEntry), [
+            {"user_id": user_id, "points": value} for user_id, value in points.items()
+        ])
+        session = db.session()
+        increment_counts(session, LeaderboardBucket, LeaderboardBucket.points, LeaderboardBucket.members,
+                         Counter(points.values()))
+        increment_counts(session, CommunityCounter, CommunityCounter.name, CommunityCounter.value,
+                         {"users": len(user_ids)})
+        db.session.commit()
+
+        for profile in profiles:
+            if profile["fitness_category"] is not None:
+                ml_service.cohorts.add(profile["fitness_category"], profile["fitness_goal"],
+                                       profile, profile["join_date"])
+                ml_service.add_neighbor(profile["user_id"], profile_features(SimpleNamespace(**profile)))
+        self.imported += len(user_ids)
+
+    def run(self, rows):
+        """Import rows from read_rows(); returns the summary"""
+        if self.use_copy is None:
+            self.use_copy = db.session.get_bind().dialect.driver == "psycopg2"
+        seen_usernames, seen_phones = set(), set()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            def start_hashing(rows):
+                passwords = [user["password"] for _, user, _ in rows]
+                chunk = max(1, -(-len(passwords) // self.workers))
+                return [pool.submit(_hash_passwords, passwords[i:i + chunk])
+                        for i in range(0, len(passwords), chunk)]
+
+            pending = None
+            for batch in self._batches(rows):
+                batch_rows = self._new_rows(batch, seen_usernames, seen_phones)
+                hashing = start_hashing(batch_rows)
+                if pending:
+                    self._flush(*pending)
+                pending = (batch_rows, hashing)
+            if pending:
+                self._flush(*pending)
+        return self.summary()
+
+    def _flush(self, rows, hashing):
+        if not rows:
+            return
+        hashes = [password_hash for future in hashing for password_hash in future.result()]
+        try:
+            self._write_batch(rows, hashes)
+        except Exception:
+            # Lost a race with a concurrent registration, or the database
+            # rejected some row (COPY raises the driver's own errors, not
+            # IntegrityError): recheck and write row by row
+            db.session.rollback()
+            for row, password_hash in zip(rows, hashes):
+                try:
+                    if self._new_rows([row], set(), set()):
+                        self._write_batch([row], [password_hash])
+                except Exception as e:
+                    db.session.rollback()
+                    self._error(row[0], f"Could not insert: {getattr(e, 'orig', None) or e}")
+        print(f"✅ {self.imported} users imported, {self.error_count} rows rejected")
+
+    def summary(self):
+        return {
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "failed": self.error_count - self.skipped,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errorsTruncated": self.error_count > len(self.errors),
+        }
+
+
+
+def import_users(stream, fmt, batch_size=1000, workers=None):
+    """Import users from a CSV/NDJSON text stream; returns the summary"""
+    return UserImporter(batch_size, workers).run(read_rows(stream, fmt))